@@ -1,33 +1,51 @@
-import serial
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+# Arranque rápido: sólo se importa lo necesario para empezar a capturar.
+# matplotlib, control y scipy (identificación) se cargan recién cuando hacen falta.
 import numpy as np
-import control as ct
-from collections import deque
 import time
 import datetime
+import argparse
+import contextlib
+
+from lector_serial import LectorSerial
+from buffer_circular import (BufferCircular, filas_desde_tramas, COL_TIEMPO, COL_TEMPERATURA,
+                             COL_SETPOINT, COL_P, COL_I, COL_D, COL_PWM)
+from renderizador import RenderizadorBlit
+from decimacion import decimar_minmax, puntos_por_ancho, PiramideMinMax
+from grabacion import Grabador, ReproductorGrabacion
+from metricas_online import MetricasEnLinea
+from instrumentacion import (Instrumentacion, RegistroJSONL, MuestreadorPilas, perfilar,
+                             texto_recuadro as resumen_instrumentacion)
+from nominales import KP, KI, KD, K, T, L, parametros_nominales
 
 # --- CONFIGURACIÓN DEL USUARIO ---
 PUERTO_SERIAL = 'COM1'  # Puerto virtual de SimulIDE (cambiar si es necesario)
 BAUD_RATE = 9600
-MAX_PUNTOS = 300  # Número de puntos a mostrar en la gráfica
-MOSTRAR_ANALISIS_ESTABILIDAD = True  # Si True, muestra análisis al inicio (bloquea hasta cerrar)
+MAX_PUNTOS = 300  # Número de puntos a mostrar en la gráfica (admite decenas de miles)
+MOSTRAR_ANALISIS_ESTABILIDAD = False  # Si True, muestra el análisis de Bode al inicio (también
+                                      # con --estabilidad); se hace con la captura ya iniciada
+MODO_RENDER = 'blit'  # 'blit': blitting + histéresis de ejes + intervalo adaptativo
+                      # 'clasico': FuncAnimation redibujando la figura completa
+INTERVALO_DIBUJO_MS = 50  # Intervalo pedido entre frames; con 'blit' se alarga si dibujar es lento
+ARCHIVO_GRABACION = None  # Ruta .pidrec para grabar la sesión (None = no grabar)
+MOSTRAR_HISTORIAL = False  # Si True, grafica toda la sesión (pirámide min/max) y no sólo
+                           # los últimos MAX_PUNTOS puntos
+MOSTRAR_METRICAS = True  # Si True, muestra sobre la gráfica las métricas del escalón actual
+IDENTIFICAR_EN_LINEA = False  # Si True, ajusta K/T/L con RLS durante la sesión y lo muestra
+MOSTRAR_INSTRUMENTACION = False  # Si True, recuadro con bytes/tramas por segundo, tiempos de
+                                 # lectura, parseo y dibujo, profundidad de la cola y fps
+ARCHIVO_INSTRUMENTACION = None  # Ruta .jsonl donde guardar la instrumentación cada segundo
 
 # --- MODELO DEL SISTEMA PARA ANÁLISIS DE ESTABILIDAD ---
-# Parámetros del Controlador PID (de los archivos .ino y .md)
-KP = 1.8
-KI = 5.4
-KD = 0.31
-
-# Parámetros estimados de la Planta (Invernadero)
-K = 0.35   # Ganancia (°C / % PWM)
-T = 1.0    # Constante de Tiempo (segundos)
-L = 0.1    # Tiempo muerto / Retardo (segundos)
+# KP/KI/KD y la planta nominal (K, T, L) se definen en nominales.py
 
 # --- ANÁLISIS DE FRECUENCIA (MÁRGENES DE GANANCIA Y FASE) ---
-def analizar_estabilidad():
+def analizar_estabilidad(modelo=None, graficar=True):
     """
     Calcula y muestra los márgenes de ganancia/fase y el diagrama de Bode.
+
+    modelo: ModeloFOPDT identificado (identificacion.py). Si es None se usan
+    los parámetros K, T y L escritos arriba.
+    graficar: si False sólo imprime el informe (modo sin ventana).
     
     EXPLICACIÓN DE LOS MÁRGENES:
     
@@ -46,6 +64,8 @@ def analizar_estabilidad():
     - Si PM > 0°: el sistema es estable
     - Rango óptimo: 30° < PM < 60°
     """
+    import control as ct  # Importación diferida: tarda más de un segundo
+
     print("=" * 70)
     print("ANÁLISIS DE ESTABILIDAD DEL SISTEMA")
     print("=" * 70)
@@ -54,6 +74,18 @@ def analizar_estabilidad():
     # CONSTRUCCIÓN DEL MODELO DEL SISTEMA
     # ========================================================================
     
+    # Parámetros de la planta: los identificados o los estimados a mano
+    if modelo is not None and not modelo.valido:
+        print(f"\n⚠️ El modelo identificado ({modelo.metodo}) no es válido o no convergió; "
+              f"se usan K, T y L de la configuración")
+        modelo = None
+    if modelo is None:
+        k_planta, t_planta, l_planta = K, T, L
+    else:
+        k_planta, t_planta, l_planta = modelo.K, modelo.T, modelo.L
+        print(f"\nUsando el modelo identificado ({modelo.metodo}): "
+              f"K = {k_planta:.4f}, T = {t_planta:.3f} s, L = {l_planta:.3f} s")
+
     # Variable de Laplace
     s = ct.TransferFunction.s
     
@@ -75,11 +107,11 @@ def analizar_estabilidad():
     # Aproximación de Padé para el retardo de tiempo
     # Padé aproxima e^(-L*s) como una función racional (cociente de polinomios)
     # Orden 1: e^(-L*s) ≈ (1 - L*s/2) / (1 + L*s/2)
-    n_pade, d_pade = ct.pade(L, 1)  # Aproximación de 1er orden
+    n_pade, d_pade = ct.pade(l_planta, 1)  # Aproximación de 1er orden
     retardo = ct.TransferFunction(n_pade, d_pade)
     
     # Planta completa: sistema de primer orden con retardo
-    G_p = (K / (T*s + 1)) * retardo
+    G_p = (k_planta / (t_planta*s + 1)) * retardo
     G_p.name = 'Planta (Invernadero)'
 
     # Función de transferencia de lazo abierto L(s) = Gc(s) * Gp(s)
@@ -229,7 +261,8 @@ def analizar_estabilidad():
     # ========================================================================
     
     # Graficar Diagrama de Bode (solo mostrar si está habilitado)
-    if MOSTRAR_ANALISIS_ESTABILIDAD:
+    if graficar:
+        import matplotlib.pyplot as plt
         try:
             print("\n📈 Generando Diagrama de Bode...")
             
@@ -294,46 +327,85 @@ def analizar_estabilidad():
 
 # --- GRAFICACIÓN EN TIEMPO REAL ---
 
-# Inicializar la conexión serial (se hará después del análisis si es necesario)
-ser = None
-intentos_serial = 0
+# El hilo lector es el dueño del puerto serial; se crea en la ejecución principal
+lector = None
 MAX_INTENTOS_SERIAL = 10  # Intentar conectar solo 10 veces antes de dar por perdido
 
-# Contenedores para los datos
-tiempo = deque(maxlen=MAX_PUNTOS)
-temperatura = deque(maxlen=MAX_PUNTOS)
-setpoint = deque(maxlen=MAX_PUNTOS)
-salida_pwm = deque(maxlen=MAX_PUNTOS)
-pid_p = deque(maxlen=MAX_PUNTOS)
-pid_i = deque(maxlen=MAX_PUNTOS)
-pid_d = deque(maxlen=MAX_PUNTOS)
-
-# Configuración de la figura para graficar
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
-fig.suptitle('Análisis en Vivo del Controlador PID', fontsize=16)
-
-# Gráfica 1: Temperatura
-ax1.set_ylabel('Temperatura [°C]')
-ax1.grid(True)
-line_temp, = ax1.plot([], [], 'r-', label='Temperatura Medida')
-line_setpoint, = ax1.plot([], [], 'b--', label='Setpoint')
-ax1.legend()
-ax1_twin = ax1.twinx()
-ax1_twin.set_ylabel('Salida PID [%]')
-line_pwm, = ax1_twin.plot([], [], 'g-', alpha=0.5, label='Salida PWM')
-ax1_twin.legend(loc='lower right')
-
-# Gráfica 2: Componentes PID
-ax2.set_ylabel('Contribución PID')
-ax2.set_xlabel('Tiempo [s]')
-ax2.grid(True)
-line_p, = ax2.plot([], [], label='Componente P')
-line_i, = ax2.plot([], [], label='Componente I')
-line_d, = ax2.plot([], [], label='Componente D')
-ax2.legend()
+# Contenedor para los datos: un buffer circular (MAX_PUNTOS, 8) preasignado
+# Columnas: tiempo, temperatura, setpoint, error, P, I, D, PWM [%]
+buffer = BufferCircular(MAX_PUNTOS)
+# Historial completo de la sesión con varios niveles de resolución (columnas 1 a 7)
+historial = PiramideMinMax(7) if MOSTRAR_HISTORIAL else None
+# Métricas de la respuesta (sobreimpulso, tiempos, IAE...) actualizadas en cada bloque
+metricas = MetricasEnLinea() if MOSTRAR_METRICAS else None
+# Identificación recursiva de la planta (K, T, L) con los datos en vivo
+identificador = None
+if IDENTIFICAR_EN_LINEA:
+    from identificacion import IdentificadorRLS
+    identificador = IdentificadorRLS()
+
+# Contadores y tiempos del lazo en vivo (lector, consumo, set_data, dibujo)
+instrumentacion = Instrumentacion()
+registro_instrumentacion = None  # RegistroJSONL si se pidió guardar la instrumentación
+t_instantanea = 0.0
+INTERVALO_INSTRUMENTACION = 1.0  # Segundos entre instantáneas
+
+# Figura, ejes y líneas: los crea crear_figura() (no existen en modo sin ventana)
+fig = ax1 = ax1_twin = ax2 = None
+line_temp = line_setpoint = line_pwm = line_p = line_i = line_d = texto_metricas = None
+texto_instrumentacion = None
+LINEAS_COLUMNAS = []
+renderizador = None
 
 start_time = None
 
+def crear_figura():
+    """Importa matplotlib y arma la figura del tablero en vivo."""
+    global fig, ax1, ax1_twin, ax2, line_temp, line_setpoint, line_pwm
+    global line_p, line_i, line_d, texto_metricas, texto_instrumentacion, LINEAS_COLUMNAS
+    import matplotlib.pyplot as plt
+
+    # Configuración de la figura para graficar
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+    fig.suptitle('Análisis en Vivo del Controlador PID', fontsize=16)
+
+    # Gráfica 1: Temperatura
+    ax1.set_ylabel('Temperatura [°C]')
+    ax1.grid(True)
+    line_temp, = ax1.plot([], [], 'r-', label='Temperatura Medida')
+    line_setpoint, = ax1.plot([], [], 'b--', label='Setpoint')
+    ax1.legend(loc='upper right')
+    ax1_twin = ax1.twinx()
+    ax1_twin.set_ylabel('Salida PID [%]')
+    line_pwm, = ax1_twin.plot([], [], 'g-', alpha=0.5, label='Salida PWM')
+    ax1_twin.legend(loc='lower right')
+
+    # Gráfica 2: Componentes PID
+    ax2.set_ylabel('Contribución PID')
+    ax2.set_xlabel('Tiempo [s]')
+    ax2.grid(True)
+    line_p, = ax2.plot([], [], label='Componente P')
+    line_i, = ax2.plot([], [], label='Componente I')
+    line_d, = ax2.plot([], [], label='Componente D')
+    ax2.legend()
+
+    # Recuadro de texto con las métricas de calidad del control
+    texto_metricas = ax1.text(0.01, 0.97, '', transform=ax1.transAxes, va='top', ha='left',
+                              fontsize=8, family='monospace', zorder=5,
+                              bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+    texto_metricas.set_visible(MOSTRAR_METRICAS or IDENTIFICAR_EN_LINEA)
+
+    # Recuadro de instrumentación (se reescribe una vez por segundo)
+    texto_instrumentacion = fig.text(0.005, 0.005, '', va='bottom', ha='left', fontsize=7,
+                                     family='monospace',
+                                     bbox=dict(boxstyle='round', facecolor='lightyellow', alpha=0.9))
+    texto_instrumentacion.set_visible(MOSTRAR_INSTRUMENTACION)
+
+    # Columna del buffer que dibuja cada línea
+    LINEAS_COLUMNAS = [(line_temp, COL_TEMPERATURA), (line_setpoint, COL_SETPOINT),
+                       (line_pwm, COL_PWM), (line_p, COL_P), (line_i, COL_I), (line_d, COL_D)]
+    return fig
+
 def init():
     """Función de inicialización para la animación."""
     ax1.set_ylim(20, 35)
@@ -341,150 +413,319 @@ def init():
     ax2.set_ylim(-100, 100)
     ax1.set_xlim(0, 30)  # Inicializar con 30 segundos
     ax2.set_xlim(0, 30)
-    return line_temp, line_setpoint, line_pwm, line_p, line_i, line_d
+    return line_temp, line_setpoint, line_pwm, line_p, line_i, line_d, texto_metricas
+
+def consumir_muestras():
+    """Pasa al buffer las muestras que el hilo LectorSerial ya parseó.
+
+    La lectura del puerto ocurre fuera del hilo de la GUI.
+    """
+    global start_time
+
+    if lector is None:
+        return
+    reloj = getattr(lector, 'reloj', None)
+    if reloj is not None and reloj.listo:
+        instrumentacion.fijar('deriva_ppm', round(reloj.deriva_ppm, 1))
+    t_llegada, tramas = lector.extraer()
+    # extraer() vacía la cola: lo extraído es lo que estaba pendiente, en tramas
+    # (un bloque del lector puede traer una o cientos)
+    instrumentacion.fijar('cola_tramas', len(tramas))
+    if len(tramas) == 0:
+        return
+    if start_time is None:
+        start_time = t_llegada[0]
+        print(f"📊 Recibiendo datos... (T={tramas[0, 0]:.2f}°C, Setpoint={tramas[0, 1]:.2f}°C)")
+
+    # Cada muestra conserva la hora a la que llegó por el puerto, o la de su
+    # medición si el firmware envía millis (la salida PWM se convierte a %)
+    filas = filas_desde_tramas(t_llegada - start_time, tramas)
+    buffer.agregar_bloque(filas)
+
+    if historial is not None:
+        historial.agregar_bloque(filas[:, COL_TIEMPO], filas[:, 1:])
+    if metricas is not None:
+        metricas.agregar_bloque(filas)
+    if identificador is not None:
+        identificador.agregar_tramas(tramas)
+
+def texto_recuadro():
+    """Texto del recuadro: métricas del escalón y, si está activo, el modelo RLS."""
+    lineas = [metricas.texto()] if metricas is not None else []
+    if identificador is not None:
+        modelo = identificador.modelo()
+        if modelo.valido:
+            lineas.append(f"Modelo RLS: K={modelo.K:.3f} T={modelo.T:.2f} s L={modelo.L:.2f} s")
+        elif not modelo.convergido:
+            lineas.append(f"Modelo RLS: convergiendo ({modelo.muestras} muestras)")
+        else:
+            lineas.append("Modelo RLS: sin excitación suficiente")
+    return "\n".join(lineas)
+
+def actualizar_lineas():
+    """Actualiza las líneas con la ventana actual y devuelve el rango de los datos.
+
+    Devuelve una lista de tuplas (ax, 'x' | 'y', lo, hi), vacía si no hay datos.
+    """
+    if len(buffer) == 0:
+        return []
+
+    if metricas is not None or identificador is not None:
+        texto_metricas.set_text(texto_recuadro())
+
+    # Como mucho dos puntos por columna de píxeles (mínimo y máximo)
+    max_puntos = puntos_por_ancho(ax1)
+
+    if historial is not None:
+        return actualizar_lineas_historial(max_puntos)
+
+    # Vistas sin copia de la ventana actual
+    datos = buffer.ventana()
+    t = datos[:, COL_TIEMPO]
+
+    # Actualizar las líneas, decimando si hay más puntos que píxeles
+    for linea, col in LINEAS_COLUMNAS:
+        linea.set_data(*decimar_minmax(t, datos[:, col], max_puntos))
+
+    # Rango en X: al menos 30 segundos desde la primera muestra de la ventana
+    t_min = max(0, t[0]) if len(t) > 1 else 0
+    t_max = max(t[-1], t_min + 30)
+
+    # Rango en Y para temperatura
+    # (min/max se mantienen de forma incremental en el buffer)
+    temp_min = min(buffer.minimo(COL_TEMPERATURA), 20)
+    temp_max = max(buffer.maximo(COL_TEMPERATURA), 35)
+
+    # Rango en Y para componentes PID
+    pid_min = min(buffer.minimo(COL_P, COL_I, COL_D), -100)
+    pid_max = max(buffer.maximo(COL_P, COL_I, COL_D), 100)
+
+    # ax1 y ax2 comparten el eje X, basta con ajustar uno
+    return [(ax1, 'x', t_min, t_max),
+            (ax1, 'y', temp_min - 2, temp_max + 2),
+            (ax2, 'y', pid_min - 10, pid_max + 10)]
+
+def actualizar_lineas_historial(max_puntos):
+    """Como actualizar_lineas(), pero con toda la sesión leída de la pirámide min/max."""
+    t_fin = buffer.ultimo(COL_TIEMPO)
+    t, y = historial.consultar(0, t_fin, max_puntos)
+    for linea, col in LINEAS_COLUMNAS:
+        linea.set_data(t[:, col - 1], y[:, col - 1])
+
+    # La decimación min/max conserva los extremos: basta con mirar los puntos dibujados
+    temp_min = min(y[:, COL_TEMPERATURA - 1].min(), 20)
+    temp_max = max(y[:, COL_TEMPERATURA - 1].max(), 35)
+    pid = y[:, COL_P - 1:COL_D]
+    pid_min = min(pid.min(), -100)
+    pid_max = max(pid.max(), 100)
+
+    return [(ax1, 'x', 0, max(t_fin, 30)),
+            (ax1, 'y', temp_min - 2, temp_max + 2),
+            (ax2, 'y', pid_min - 10, pid_max + 10)]
 
 def update(frame):
-    """Función que se llama en cada frame para actualizar la gráfica."""
-    global start_time, ser, intentos_serial
-    
-    # Inicializar serial si no está abierto
-    if ser is None or (hasattr(ser, 'is_open') and not ser.is_open):
-        if intentos_serial < MAX_INTENTOS_SERIAL:
-            try:
-                ser = serial.Serial(PUERTO_SERIAL, BAUD_RATE, timeout=0.1)
-                print(f"✅ Conectado al puerto {PUERTO_SERIAL}")
-                intentos_serial = MAX_INTENTOS_SERIAL  # Ya conectó, no intentar más
-            except serial.SerialException as e:
-                intentos_serial += 1
-                if intentos_serial == 1:  # Solo mostrar el error la primera vez
-                    print(f"⚠️ Error al abrir el puerto {PUERTO_SERIAL}: {e}")
-                    print("   Asegúrate de que SimulIDE esté corriendo y el puerto sea correcto.")
-                    print("   Reintentando...")
-            except Exception as e:
-                intentos_serial += 1
-                if intentos_serial == 1:
-                    print(f"⚠️ Error inesperado: {e}")
+    """Función que se llama en cada frame para actualizar la gráfica (modo clásico)."""
+    with instrumentacion.medir('consumo'):
+        consumir_muestras()
+
+    # Actualizar gráficas y ajustar límites dinámicamente si hay datos
+    with instrumentacion.medir('set_data'):
+        rangos = actualizar_lineas()
+    for ax, dim, lo, hi in rangos:
+        if dim == 'x':
+            ax.set_xlim(lo, hi)
         else:
-            # Ya intentamos muchas veces, solo retornar sin hacer nada
-            return line_temp, line_setpoint, line_pwm, line_p, line_i, line_d
-    
-    # Leer datos del serial
-    if ser and ser.is_open:
-        try:
-            # Leer todas las líneas disponibles
-            while ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                
-                # Ignorar líneas vacías
-                if not line:
-                    continue
-                
-                # Buscamos el prefijo ">> " para asegurarnos que es una línea de datos
-                if line.startswith(">> "):
-                    # Extraemos los datos
-                    parts = line.replace(">> ", "").split(',')
-                    if len(parts) == 8:
-                        # Convertimos los datos a números
-                        try:
-                            data = [float(p) for p in parts]
-                            
-                            if start_time is None:
-                                start_time = time.time()
-                                print(f"📊 Recibiendo datos... (T={data[0]:.2f}°C, Setpoint={data[1]:.2f}°C)")
-
-                            current_time = time.time() - start_time
-
-                            # Añadimos los datos a las listas
-                            tiempo.append(current_time)
-                            temperatura.append(data[0])
-                            setpoint.append(data[1])
-                            pid_p.append(data[3])
-                            pid_i.append(data[4])
-                            pid_d.append(data[5])
-                            salida_pwm.append(data[7] * 100.0 / 255.0)  # Convertir PWM a %
-                        except (ValueError, IndexError) as e:
-                            # Debug: mostrar línea que no se pudo parsear
-                            if len(tiempo) == 0:  # Solo mostrar errores al inicio
-                                print(f"⚠️ Error parseando línea: {line[:50]}...")
-        except serial.SerialException as e:
-            print(f"⚠️ Error de comunicación serial: {e}")
-        except Exception as e:
-            if len(tiempo) == 0:  # Solo mostrar errores al inicio
-                print(f"⚠️ Error inesperado: {e}")
-    
-    # Actualizar gráficas si hay datos
-    if len(tiempo) > 0:
-        # Convertir deques a listas para matplotlib
-        t_list = list(tiempo)
-        temp_list = list(temperatura)
-        setpoint_list = list(setpoint)
-        pwm_list = list(salida_pwm)
-        p_list = list(pid_p)
-        i_list = list(pid_i)
-        d_list = list(pid_d)
-        
-        # Actualizar las líneas
-        line_temp.set_data(t_list, temp_list)
-        line_setpoint.set_data(t_list, setpoint_list)
-        line_pwm.set_data(t_list, pwm_list)
-        line_p.set_data(t_list, p_list)
-        line_i.set_data(t_list, i_list)
-        line_d.set_data(t_list, d_list)
-
-        # Ajustar límites del eje X dinámicamente
-        if len(t_list) > 1:
-            t_min = max(0, t_list[0])
-            t_max = t_list[-1]
-            ax1.set_xlim(t_min, max(t_max, t_min + 30))
-            ax2.set_xlim(t_min, max(t_max, t_min + 30))
-        elif len(t_list) == 1:
-            # Si solo hay un punto, mostrar un rango inicial
-            ax1.set_xlim(0, 30)
-            ax2.set_xlim(0, 30)
-        
-        # Ajustar límites Y dinámicamente para temperatura
-        if len(temp_list) > 0:
-            temp_min = min(min(temp_list), 20)
-            temp_max = max(max(temp_list), 35)
-            ax1.set_ylim(temp_min - 2, temp_max + 2)
-        
-        # Ajustar límites Y para componentes PID
-        if len(p_list) > 0 or len(i_list) > 0 or len(d_list) > 0:
-            all_pid = p_list + i_list + d_list
-            if all_pid:
-                pid_min = min(min(all_pid), -100)
-                pid_max = max(max(all_pid), 100)
-                ax2.set_ylim(pid_min - 10, pid_max + 10)
+            ax.set_ylim(lo, hi)
+    instrumentacion.sumar('frames')
+    revisar_instrumentacion()
+
+    return (line_temp, line_setpoint, line_pwm, line_p, line_i, line_d, texto_metricas,
+            texto_instrumentacion)
+
+def frame_blit():
+    """Actualización para RenderizadorBlit: los límites los decide la histéresis."""
+    with instrumentacion.medir('consumo'):
+        consumir_muestras()
+    with instrumentacion.medir('set_data'):
+        rangos = actualizar_lineas()
+    revisar_instrumentacion()
+    return rangos
+
+def revisar_instrumentacion():
+    """Cada INTERVALO_INSTRUMENTACION s: instantánea al archivo JSONL y al recuadro."""
+    global t_instantanea
+    ahora = time.perf_counter()
+    if ahora - t_instantanea < INTERVALO_INSTRUMENTACION:
+        return
+    t_instantanea = ahora
+    if fig is not None:
+        instrumentacion.fijar('fps_pedido', 1000.0 / INTERVALO_DIBUJO_MS)
+        if renderizador is not None:
+            instrumentacion.fijar('fps_temporizador', 1000.0 / renderizador.intervalo_ms)
+    datos = instrumentacion.instantanea()
+    if registro_instrumentacion is not None:
+        registro_instrumentacion.escribir(datos)
+    if texto_instrumentacion is not None and texto_instrumentacion.get_visible():
+        texto_instrumentacion.set_text(resumen_instrumentacion(datos))
+        if renderizador is not None:
+            renderizador.refrescar_lentos()
+
+def estado_consola():
+    """Una línea de estado para el modo sin ventana."""
+    t, temp, sp, pwm = (buffer.ultimo(c) for c in (COL_TIEMPO, COL_TEMPERATURA,
+                                                    COL_SETPOINT, COL_PWM))
+    linea = (f"[{t:8.1f} s] {lector.tramas_leidas} tramas | T={temp:.2f}°C "
+             f"SP={sp:.2f}°C PWM={pwm:.0f}%")
+    if metricas is not None and metricas.escalones:
+        linea += (f" | IAE={metricas.iae:.1f} "
+                  f"sat={metricas.saturacion * 100:.0f}%")
+    return linea
+
+def ejecutar_sin_ventana(intervalo=1.0):
+    """Modo sin gráficos: consume las muestras y muestra un resumen por consola.
+
+    Termina cuando el lector se detiene (puerto perdido o fin de la reproducción).
+    """
+    while lector.is_alive() or lector.muestras:
+        time.sleep(intervalo)
+        with instrumentacion.medir('consumo'):
+            consumir_muestras()
+        revisar_instrumentacion()
+        if len(buffer):
+            print(estado_consola())
 
-    return line_temp, line_setpoint, line_pwm, line_p, line_i, line_d
+def parametros_sesion():
+    """Parámetros del controlador y de la planta que se guardan en la cabecera."""
+    return {'puerto': PUERTO_SERIAL, 'baud_rate': BAUD_RATE, **parametros_nominales()}
 
 # --- EJECUCIÓN PRINCIPAL ---
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Análisis en vivo del controlador PID")
+    parser.add_argument('--puerto', default=PUERTO_SERIAL, help="Puerto serial")
+    parser.add_argument('--grabar', default=ARCHIVO_GRABACION, metavar='ARCHIVO',
+                        help="Graba cada trama en un archivo .pidrec")
+    parser.add_argument('--reproducir', metavar='ARCHIVO',
+                        help="Reproduce una grabación .pidrec en lugar de leer el puerto")
+    parser.add_argument('--velocidad', type=float, default=1.0,
+                        help="Velocidad de reproducción (1 = tiempo real, 0 = máxima)")
+    parser.add_argument('--desde', type=float, default=0.0,
+                        help="Segundos desde el inicio de la grabación a partir de los cuales reproducir")
+    parser.add_argument('--remoto', metavar='HOST:PUERTO',
+                        help="Recibe los datos de un servidor de telemetría (telemetria.py)")
+    parser.add_argument('--hz', type=float, default=0.0,
+                        help="Con --remoto: tasa máxima pedida al servidor (0 = todas las muestras)")
+    parser.add_argument('--modelo', metavar='JSON',
+                        help="Modelo identificado (identificacion.py --guardar) para el análisis")
+    parser.add_argument('--identificar', metavar='ARCHIVO',
+                        help="Identifica K/T/L con una grabación .pidrec antes del análisis")
+    parser.add_argument('--estabilidad', action='store_true', default=MOSTRAR_ANALISIS_ESTABILIDAD,
+                        help="Muestra el análisis de estabilidad (márgenes y Bode)")
+    parser.add_argument('--sin-ventana', action='store_true',
+                        help="Sin gráficos: sólo captura (y graba) con un resumen por consola")
+    parser.add_argument('--instrumentacion', action='store_true', default=MOSTRAR_INSTRUMENTACION,
+                        help="Recuadro con tasas del puerto, tiempos de parseo/dibujo y fps")
+    parser.add_argument('--instrumentacion-jsonl', default=ARCHIVO_INSTRUMENTACION,
+                        metavar='ARCHIVO', help="Guarda la instrumentación cada segundo (JSON lines)")
+    parser.add_argument('--perfilar', metavar='ARCHIVO',
+                        help="Perfil cProfile del hilo principal (.prof)")
+    parser.add_argument('--muestrear', metavar='ARCHIVO',
+                        help="Muestrea las pilas de todos los hilos (formato colapsado, flamegraph)")
+    args = parser.parse_args()
+    PUERTO_SERIAL = args.puerto
+    MOSTRAR_INSTRUMENTACION = args.instrumentacion
+    if args.instrumentacion_jsonl:
+        registro_instrumentacion = RegistroJSONL(args.instrumentacion_jsonl)
+
     print("=" * 60)
     print("ANÁLISIS EN VIVO DEL CONTROLADOR PID")
     print("=" * 60)
-    
-    # 1. Realizar el análisis de estabilidad (opcional, puede bloquear)
-    if MOSTRAR_ANALISIS_ESTABILIDAD:
-        print("\n[1/2] Realizando análisis de estabilidad...")
-        analizar_estabilidad()
-        print("\n[2/2] Iniciando graficación en tiempo real...")
+
+    # 1. Iniciar el hilo lector (o el reproductor) antes que cualquier otra cosa:
+    #    el transitorio después de un reinicio del firmware no se pierde mientras
+    #    se cargan matplotlib/control o se calcula el análisis
+    grabador = None
+    if args.reproducir:
+        print(f"   Reproduciendo la grabación {args.reproducir}...")
+        lector = ReproductorGrabacion(args.reproducir, velocidad=args.velocidad, desde=args.desde)
+    elif args.remoto:
+        from telemetria import ClienteTelemetria, separar_direccion
+        print(f"   Conectando al servidor de telemetría {args.remoto}...")
+        if args.grabar:
+            grabador = Grabador(args.grabar, dict(parametros_sesion(), puerto=args.remoto))
+            print(f"   Grabando la sesión en {args.grabar}")
+        lector = ClienteTelemetria(*separar_direccion(args.remoto), hz=args.hz, grabador=grabador)
     else:
-        print("\n[1/1] Iniciando graficación en tiempo real...")
-    
-    # 2. Iniciar la animación para la graficación en tiempo real
-    print(f"   Esperando datos del puerto {PUERTO_SERIAL}...")
-    print("   (Asegúrate de que SimulIDE esté corriendo)")
-    print("   Presiona Ctrl+C o cierra la ventana para terminar\n")
-    
+        print(f"   Esperando datos del puerto {PUERTO_SERIAL}...")
+        print("   (Asegúrate de que SimulIDE esté corriendo)")
+        if args.grabar:
+            grabador = Grabador(args.grabar, parametros_sesion())
+            print(f"   Grabando la sesión en {args.grabar}")
+        lector = LectorSerial(PUERTO_SERIAL, BAUD_RATE, max_intentos=MAX_INTENTOS_SERIAL,
+                              grabador=grabador, instrumentacion=instrumentacion)
+    lector.start()
+    muestreador = None
+    if args.muestrear:
+        muestreador = MuestreadorPilas(args.muestrear)
+        muestreador.start()
+    print(f"   Captura iniciada ({time.process_time():.2f} s de CPU desde el arranque)")
+    print("   Presiona Ctrl+C" + ("" if args.sin_ventana else " o cierra la ventana") +
+          " para terminar\n")
+
     try:
-        ani = animation.FuncAnimation(fig, update, init_func=init, blit=False, 
-                                     interval=50, cache_frame_data=False, save_count=MAX_PUNTOS)
-        plt.show()
+        # 2. Análisis de estabilidad (opcional) con la captura ya en marcha
+        if args.estabilidad:
+            modelo = None
+            if args.modelo or args.identificar:
+                from identificacion import ModeloFOPDT, identificar_grabacion
+                if args.modelo:
+                    modelo = ModeloFOPDT.cargar(args.modelo)
+                else:
+                    print(f"🔍 Identificando la planta con {args.identificar}...")
+                    modelo = identificar_grabacion(args.identificar)
+                print(modelo)
+            print("\nRealizando análisis de estabilidad...")
+            analizar_estabilidad(modelo, graficar=not args.sin_ventana)
+        elif args.modelo or args.identificar:
+            print("⚠️ --modelo/--identificar sólo se usan con --estabilidad")
+
+        # 3. Graficación en tiempo real (o resumen por consola)
+        perfil = perfilar(args.perfilar) if args.perfilar else contextlib.nullcontext()
+        with perfil:
+            if args.sin_ventana:
+                ejecutar_sin_ventana()
+            else:
+                print("\nIniciando graficación en tiempo real...")
+                crear_figura()
+                import matplotlib.pyplot as plt
+                if MODO_RENDER == 'blit':
+                    # init() fija los límites iniciales y devuelve las líneas animadas; el
+                    # recuadro de instrumentación va en la capa lenta (cambia una vez por segundo)
+                    renderizador = RenderizadorBlit(fig, init(), frame_blit, intervalo_ms=INTERVALO_DIBUJO_MS,
+                                                    lentos=[texto_instrumentacion],
+                                                    instrumentacion=instrumentacion)
+                    renderizador.iniciar()
+                else:
+                    import matplotlib.animation as animation
+                    ani = animation.FuncAnimation(fig, update, init_func=init, blit=False,
+                                                  interval=INTERVALO_DIBUJO_MS, cache_frame_data=False,
+                                                  save_count=MAX_PUNTOS)
+                plt.show()
     except KeyboardInterrupt:
         print("\n\n⚠️ Interrupción del usuario")
     finally:
-        # Cerrar el puerto serial al terminar
-        if ser is not None and hasattr(ser, 'is_open') and ser.is_open:
-            ser.close()
-            print("✅ Puerto serial cerrado. Programa finalizado.")
+        # Detener el hilo lector (cierra el puerto serial) y la grabación
+        lector.detener()
+        if muestreador is not None:
+            muestreador.detener()
+        if registro_instrumentacion is not None:
+            registro_instrumentacion.cerrar()
+            print(f"💾 Instrumentación guardada en {registro_instrumentacion.ruta}")
+        if grabador is not None:
+            grabador.cerrar()
+            print(f"💾 {grabador.registros} tramas grabadas en {grabador.ruta}")
+        if identificador is not None and identificador.muestras:
+            print(f"\n🔍 {identificador.modelo()}")
+        if metricas is not None and metricas.escalones:
+            print("\n📊 Métricas del último escalón:")
+            print("   " + metricas.texto().replace("\n", "\n   "))
+        print("✅ Programa finalizado.")
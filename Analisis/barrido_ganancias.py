@@ -0,0 +1,336 @@
+"""
+Barrido de ganancias PID y mapas de estabilidad robusta.
+
+analizar_estabilidad() calcula ct.margin para un único (KP, KI, KD) y una
+única planta (K, T, L). Para sintonizar hace falta conocer el margen de
+ganancia y de fase sobre miles de combinaciones de ganancias y de parámetros
+inciertos de la planta; con un ct.margin por punto eso tarda minutos.
+
+Aquí la respuesta en frecuencia del lazo abierto
+
+    L(jω) = Gc(jω) · Gp(jω),  Gc = KP + KI/(jω) + KD·jω,  Gp = K/(T·jω + 1) · e^(-L·jω)
+
+se evalúa con NumPy sobre toda la grilla a la vez (una fila por combinación,
+una columna por frecuencia) usando las expresiones cerradas de su magnitud y
+fase. Los cruces de ganancia (|L| = 1) y de fase (∠L = -180° ± k·360°) se
+localizan en una grilla gruesa de frecuencias y se refinan por bisección; si
+hay varios cruces se toma el margen más chico, igual que ct.margin. Los
+bloques de la grilla se pueden repartir entre procesos.
+
+Uso:
+    python barrido_ganancias.py --kp 0.5:6:60 --ki 1:12:60 --K 0.3:0.4:5 --L 0.08:0.15:5 \\
+        --salida barrido.npz --grafica barrido.png
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import nominales
+from nominales import parametros_nominales
+
+PARAMETROS = ('KP', 'KI', 'KD', 'K', 'T', 'L')
+
+# Grilla de frecuencias por defecto [rad/s]
+OMEGA_MIN = 1e-3
+OMEGA_MAX = 1e4
+PUNTOS_OMEGA = 300
+
+
+def grilla_omega(omega_min=OMEGA_MIN, omega_max=OMEGA_MAX, puntos=PUNTOS_OMEGA):
+    """Grilla logarítmica de frecuencias [rad/s]."""
+    return np.logspace(np.log10(omega_min), np.log10(omega_max), puntos)
+
+
+def respuesta_controlador(omega, KP, KI, KD):
+    """Gc(jω) = KP + KI/(jω) + KD·jω. Las ganancias pueden ser arreglos (se difunden)."""
+    jw = 1j * omega
+    KP, KI, KD = (np.asarray(x, dtype=np.float64)[..., None] for x in (KP, KI, KD))
+    return KP + KI / jw + KD * jw
+
+
+def margenes_mag_fase(log_mag, fase, omega):
+    """
+    Márgenes de estabilidad de muchos lazos a partir de ln|L(jω)| y de la fase continua.
+
+    log_mag, fase: arreglos (n, w) con ln|L(jω)| y ∠L(jω) [grados, sin saltos]
+    de n lazos sobre la grilla omega (w,). Devuelve (gm, pm, wcg, wcp), cada
+    uno de forma (n,), con la misma convención que ct.margin: gm lineal, pm en
+    grados, inf si no hay cruce y NaN en la frecuencia correspondiente.
+
+    Los cruces se interpolan linealmente entre puntos de la grilla, así que la
+    precisión depende de la densidad de omega. Sirve para lazos que sólo se
+    conocen sobre la grilla (p.ej. con la planta de robustez.py); evaluar()
+    refina los mismos cruces por bisección sobre las expresiones cerradas.
+    """
+    return _margenes(log_mag, fase, np.log(omega))
+
+
+def _margenes(log_mag, fase, log_w, en=None, iteraciones=30):
+    """
+    Busca los cruces de ganancia y de fase de cada fila y los reduce a márgenes.
+
+    Sólo se trabaja en los intervalos de la grilla log_w donde hay un cruce.
+    Si `en` es None el cruce se interpola linealmente dentro del intervalo;
+    si no, en(filas, lw) debe devolver (ln|L|, fase) de esas filas en las
+    frecuencias exp(lw) y el cruce se refina con `iteraciones` bisecciones.
+    Devuelve (gm, pm, wcg, wcp) como margenes_mag_fase().
+    """
+    n = len(log_mag)
+
+    def ubicar(filas, cols, funcion):
+        """ln ω, ln|L| y fase en el cruce funcion(ln|L|, fase) = 0 de cada intervalo."""
+        if en is None:
+            g0 = funcion(log_mag[filas, cols], fase[filas, cols])
+            g1 = funcion(log_mag[filas, cols + 1], fase[filas, cols + 1])
+            frac = g0 / (g0 - g1)
+
+            def interpolar(valores):
+                return valores[filas, cols] + frac * (valores[filas, cols + 1] - valores[filas, cols])
+
+            lw = log_w[cols] + frac * (log_w[cols + 1] - log_w[cols])
+            return lw, interpolar(log_mag), interpolar(fase)
+        lw = _biseccion(lambda x: funcion(*en(filas, x)), log_w[cols], log_w[cols + 1], iteraciones)
+        return (lw,) + tuple(en(filas, lw))
+
+    # --- Cruce de ganancia: ln|L| cambia de signo ---
+    filas, cols = np.nonzero((log_mag[:, :-1] > 0) != (log_mag[:, 1:] > 0))
+    lw, _, fase_cruce = ubicar(filas, cols, lambda m, f: m)
+    # Margen de fase = distancia a la línea de -180° más cercana; como ct.margin,
+    # el más chico en valor absoluto
+    pm_cand = (fase_cruce + 360.0) % 360.0 - 180.0
+    pm, wcp = _menor_por_fila(n, filas, np.abs(pm_cand), (pm_cand, np.exp(lw)))
+    pm = np.where(np.isnan(pm), np.inf, pm)
+
+    # --- Cruce de fase: la fase pasa por -180° + k·360° ---
+    piso = np.floor((fase + 180.0) / 360.0)
+    filas, cols = np.nonzero(piso[:, :-1] != piso[:, 1:])
+    k = np.maximum(piso[filas, cols], piso[filas, cols + 1])
+    lw, log_mag_cruce, _ = ubicar(filas, cols, lambda m, f: (f + 180.0) / 360.0 - k)
+    # Como ct.margin: el margen más cercano a 1 (0 dB) en escala logarítmica
+    log_gm, wcg = _menor_por_fila(n, filas, np.abs(log_mag_cruce), (-log_mag_cruce, np.exp(lw)))
+    gm = np.where(np.isnan(log_gm), np.inf, np.exp(log_gm))
+    return gm, pm, wcg, wcp
+
+
+def _magnitud_fase(parametros, w, retardo):
+    """
+    ln|L(jω)| y ∠L(jω) [grados] del lazo PID + FOPDT en forma cerrada.
+
+        ln|L| = ½·ln(KP² + (KD·ω - KI/ω)²) + ln K - ½·ln(1 + T²ω²)
+        ∠L    = atan2(KD·ω - KI/ω, KP) - atan(T·ω) + ∠retardo
+
+    con ∠retardo = -2·atan(L·ω/2) (Padé 1er orden) o -L·ω (exacto). La fase
+    sale continua, sin necesidad de desenrollarla.
+    """
+    KP, KI, KD, K, T, L = parametros
+    imag_c = KD * w - KI / w
+    log_mag = 0.5 * np.log(KP ** 2 + imag_c ** 2) + np.log(K) - 0.5 * np.log1p((T * w) ** 2)
+    fase = np.arctan2(imag_c, KP) - np.arctan(T * w)
+    if retardo == 'exacto':
+        fase = fase - L * w
+    elif retardo == 'pade':
+        fase = fase - 2 * np.arctan(L * w / 2)
+    else:
+        raise ValueError(f"Retardo desconocido: {retardo!r} (use 'pade' o 'exacto')")
+    return log_mag, np.degrees(fase)
+
+
+def _biseccion(funcion, a, b, iteraciones):
+    """Bisección vectorizada de funcion(x) = 0 en [a, b] (un intervalo por elemento)."""
+    fa = funcion(a)
+    for _ in range(iteraciones):
+        m = 0.5 * (a + b)
+        fm = funcion(m)
+        izquierda = np.signbit(fm) == np.signbit(fa)
+        a = np.where(izquierda, m, a)
+        fa = np.where(izquierda, fm, fa)
+        b = np.where(izquierda, b, m)
+    return 0.5 * (a + b)
+
+
+def _menor_por_fila(n, filas, criterio, valores):
+    """Para cada fila, el elemento de `valores` con menor `criterio` (NaN si no hay)."""
+    salida = [np.full(n, np.nan) for _ in valores]
+    if len(filas) == 0:
+        return salida
+    orden = np.lexsort((criterio, filas))
+    unicas, primero = np.unique(filas[orden], return_index=True)
+    elegidos = orden[primero]
+    for s, v in zip(salida, valores):
+        s[unicas] = v[elegidos]
+    return salida
+
+
+def evaluar(KP, KI, KD, K, T, L, omega=None, retardo='pade', iteraciones=30):
+    """
+    Márgenes para arreglos 1D (misma longitud) de ganancias y parámetros de planta.
+
+    La grilla `omega` sólo se usa para encontrar los intervalos donde hay un
+    cruce; cada cruce se refina luego por bisección sobre las expresiones
+    cerradas de _magnitud_fase(), así que basta con una grilla gruesa.
+    """
+    omega = grilla_omega() if omega is None else omega
+    parametros = tuple(np.asarray(x, dtype=np.float64).reshape(-1, 1)
+                       for x in (KP, KI, KD, K, T, L))
+    log_mag, fase = _magnitud_fase(parametros, omega[None, :], retardo)
+
+    def en(filas, lw):
+        """Magnitud y fase de las filas indicadas en las frecuencias exp(lw)."""
+        return _magnitud_fase(tuple(p[filas, 0] for p in parametros), np.exp(lw), retardo)
+
+    return _margenes(log_mag, fase, np.log(omega), en, iteraciones)
+
+
+def _evaluar_bloque(args):
+    """Función de trabajo para el pool de procesos (debe ser de nivel de módulo)."""
+    bloque, omega, retardo = args
+    return evaluar(*bloque, omega=omega, retardo=retardo)
+
+
+def barrido(valores, omega=None, retardo='pade', tam_bloque=2048, procesos=1):
+    """
+    Evalúa los márgenes sobre el producto cartesiano de los valores dados.
+
+    valores: dict {'KP': arreglo, 'KI': ..., 'KD': ..., 'K': ..., 'T': ..., 'L': ...};
+        los parámetros que falten toman su valor nominal.
+    procesos: 1 = todo en este proceso; >1 reparte los bloques en un ProcessPoolExecutor.
+    Devuelve un dict con los ejes de la grilla y los arreglos 'gm', 'gm_db', 'pm',
+    'wcg', 'wcp' con forma (len(KP), len(KI), len(KD), len(K), len(T), len(L)).
+    """
+    nominales = parametros_nominales()
+    ejes = {p: np.atleast_1d(np.asarray(valores.get(p, nominales[p]), dtype=np.float64))
+            for p in PARAMETROS}
+    forma = tuple(len(ejes[p]) for p in PARAMETROS)
+    mallas = [m.ravel() for m in np.meshgrid(*(ejes[p] for p in PARAMETROS), indexing='ij')]
+    omega = grilla_omega() if omega is None else omega
+    n = len(mallas[0])
+
+    tareas = [([m[i:i + tam_bloque] for m in mallas], omega, retardo)
+              for i in range(0, n, tam_bloque)]
+    if procesos > 1 and len(tareas) > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            partes = list(pool.map(_evaluar_bloque, tareas))
+    else:
+        partes = [_evaluar_bloque(t) for t in tareas]
+
+    gm, pm, wcg, wcp = (np.concatenate(arr).reshape(forma) for arr in zip(*partes))
+    with np.errstate(divide='ignore'):
+        gm_db = 20 * np.log10(gm)
+    resultado = {p: ejes[p] for p in PARAMETROS}
+    resultado.update(gm=gm, gm_db=gm_db, pm=pm, wcg=wcg, wcp=wcp, retardo=np.array(retardo))
+    return resultado
+
+
+def guardar(resultado, ruta):
+    """Guarda el resultado del barrido en un .npz comprimido."""
+    np.savez_compressed(ruta, **resultado)
+
+
+def peor_caso(resultado, ejes=('KP', 'KI')):
+    """
+    Reduce el barrido a los dos ejes pedidos tomando el peor caso del resto.
+
+    Para cada par (p.ej. KP, KI) se devuelven el menor margen de fase y el
+    menor margen de ganancia sobre todas las demás combinaciones (KD y la
+    incertidumbre de la planta): es el margen garantizado para todo el rango.
+    """
+    i, j = (PARAMETROS.index(e) for e in ejes)
+    pm = np.moveaxis(resultado['pm'], (i, j), (0, 1))
+    gm_db = np.moveaxis(resultado['gm_db'], (i, j), (0, 1))
+    resto = tuple(range(2, len(PARAMETROS)))
+    return pm.min(axis=resto), gm_db.min(axis=resto)
+
+
+def graficar_mapas(resultado, ejes=('KP', 'KI'), ruta=None, mostrar=True):
+    """Mapas de calor del peor PM y del peor GM sobre el plano de dos ganancias."""
+    import matplotlib.pyplot as plt
+
+    pm, gm_db = peor_caso(resultado, ejes)
+    x, y = resultado[ejes[0]], resultado[ejes[1]]
+    fig, (ax_pm, ax_gm) = plt.subplots(1, 2, figsize=(14, 6))
+    fig.suptitle("Mapas de estabilidad robusta (peor caso sobre la incertidumbre de la planta)",
+                 fontsize=14, fontweight='bold')
+
+    # Margen de fase: verde en el rango óptimo 30°-60°
+    im = ax_pm.pcolormesh(x, y, pm.T, cmap='RdYlGn', vmin=-30, vmax=90, shading='auto')
+    fig.colorbar(im, ax=ax_pm, label='PM mínimo [°]')
+    if len(x) > 1 and len(y) > 1:
+        cs = ax_pm.contour(x, y, pm.T, levels=[0, 30, 60], colors=['r', 'k', 'b'], linewidths=1)
+        ax_pm.clabel(cs, fmt='%d°')
+    ax_pm.set_title('Margen de Fase (PM)')
+
+    # Margen de ganancia en dB (inf = nunca cruza -180°)
+    gm_plot = np.where(np.isinf(gm_db), 40.0, gm_db)
+    im = ax_gm.pcolormesh(x, y, gm_plot.T, cmap='RdYlGn', vmin=-10, vmax=30, shading='auto')
+    fig.colorbar(im, ax=ax_gm, label='GM mínimo [dB] (∞ mostrado como 40)')
+    if len(x) > 1 and len(y) > 1:
+        cs = ax_gm.contour(x, y, gm_plot.T, levels=[0, 3], colors=['r', 'k'], linewidths=1)
+        ax_gm.clabel(cs, fmt='%g dB')
+    ax_gm.set_title('Margen de Ganancia (GM)')
+
+    nominal = parametros_nominales()
+    for ax in (ax_pm, ax_gm):
+        ax.set_xlabel(ejes[0])
+        ax.set_ylabel(ejes[1])
+        ax.plot(nominal[ejes[0]], nominal[ejes[1]], 'k*', markersize=14, label='Nominal')
+        ax.legend(loc='upper right')
+    plt.tight_layout()
+    if ruta:
+        fig.savefig(ruta, dpi=120)
+        print(f"✅ Mapas guardados en {ruta}")
+    if mostrar:
+        plt.show()
+    return fig
+
+
+def leer_rango(texto):
+    """Convierte 'a:b:n' en np.linspace(a, b, n) y 'v' en [v]."""
+    partes = texto.split(':')
+    if len(partes) == 1:
+        return np.array([float(partes[0])])
+    if len(partes) != 3:
+        raise argparse.ArgumentTypeError(f"Rango inválido {texto!r}: use 'valor' o 'inicio:fin:n'")
+    return np.linspace(float(partes[0]), float(partes[1]), int(partes[2]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Barrido de ganancias PID con márgenes de estabilidad vectorizados",
+        epilog="Cada parámetro acepta un valor ('1.8') o un rango lineal 'inicio:fin:n'.")
+    parser.add_argument('--kp', type=leer_rango, default=np.array([nominales.KP]))
+    parser.add_argument('--ki', type=leer_rango, default=np.array([nominales.KI]))
+    parser.add_argument('--kd', type=leer_rango, default=np.array([nominales.KD]))
+    parser.add_argument('--K', type=leer_rango, default=np.array([nominales.K]), help="Ganancia de la planta")
+    parser.add_argument('--T', type=leer_rango, default=np.array([nominales.T]), help="Constante de tiempo [s]")
+    parser.add_argument('--L', type=leer_rango, default=np.array([nominales.L]), help="Tiempo muerto [s]")
+    parser.add_argument('--retardo', choices=('pade', 'exacto'), default='pade',
+                        help="Modelo del tiempo muerto (pade = el de analizar_estabilidad)")
+    parser.add_argument('--procesos', type=int, default=1, help="Procesos en paralelo")
+    parser.add_argument('--salida', default='barrido.npz', help="Archivo .npz con GM/PM/ωcg/ωcp")
+    parser.add_argument('--grafica', default=None, help="Archivo de imagen para los mapas")
+    parser.add_argument('--ejes', nargs=2, default=['KP', 'KI'], choices=PARAMETROS,
+                        help="Par de parámetros para los mapas de calor")
+    parser.add_argument('--sin-ventana', action='store_true', help="No abrir la ventana de gráficos")
+    args = parser.parse_args(argv)
+
+    valores = dict(KP=args.kp, KI=args.ki, KD=args.kd, K=args.K, T=args.T, L=args.L)
+    total = int(np.prod([len(v) for v in valores.values()]))
+    print(f"📊 Evaluando {total} combinaciones ({args.retardo}, {args.procesos} proceso(s))...")
+    t0 = time.perf_counter()
+    resultado = barrido(valores, retardo=args.retardo, procesos=args.procesos)
+    dt = time.perf_counter() - t0
+    print(f"✅ Listo en {dt:.2f} s ({total / dt:.0f} combinaciones/s)")
+
+    estables = np.mean(resultado['pm'] > 0) * 100
+    print(f"   Combinaciones con PM > 0°: {estables:.1f}%")
+    guardar(resultado, args.salida)
+    print(f"💾 Resultados guardados en {args.salida}")
+
+    if args.grafica or not args.sin_ventana:
+        graficar_mapas(resultado, tuple(args.ejes), ruta=args.grafica, mostrar=not args.sin_ventana)
+
+
+if __name__ == '__main__':
+    main()
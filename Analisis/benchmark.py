@@ -0,0 +1,467 @@
+"""
+Benchmarks del camino caliente del análisis en vivo, sin SimulIDE.
+
+Un generador sintético escribe tramas con el formato del firmware
+(">> temperatura,setpoint,error,out_p,out_i,out_d,out_total,salida") a la
+tasa pedida, en un pty (el LectorSerial real lee del puerto, sólo POSIX) o en
+memoria (el parser corre en el hilo del generador, sin puerto; funciona en
+cualquier sistema). Las tramas salen de una simulación del firmware
+(simulador.py) con escalones de setpoint, así que los datos se parecen a los
+reales y son siempre los mismos.
+
+Benchmarks:
+- parseo: tramas/s y MB/s de ParserTramas con una trama por lectura (el caso
+  en vivo) y según el tamaño de bloque leído, y la aceleración respecto del
+  camino anterior (readline y parseo línea a línea) sobre los mismos bytes.
+- tablero: el camino completo de analisis.py (lector, buffer, métricas,
+  decimación y RenderizadorBlit sobre el backend Agg). Mide la latencia de
+  cada muestra desde que se escribió hasta que se dibujó, tramas perdidas,
+  tiempo de dibujo por frame y frames por segundo reales.
+- memoria: horas de datos por buffer, pirámide min/max y métricas a velocidad
+  máxima, midiendo con tracemalloc cuánto crece la memoria por hora.
+- estabilidad: análisis de márgenes de analisis.py, un barrido de ganancias
+  y una simulación por lotes.
+
+Los resultados se guardan en JSON (--salida) y se comparan con una corrida
+anterior (--comparar): el programa termina con código 1 si algún tiempo o
+tasa empeoró más que TOLERANCIA.
+
+Uso:
+    python benchmark.py                                  # todos los benchmarks
+    python benchmark.py parseo tablero --tasa 1000 --duracion 20 --fuente pty
+    python benchmark.py --salida base.json
+    python benchmark.py --comparar base.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+from parser_tramas import ParserTramas, parsear_linea, PREFIJO_DATOS
+from lector_serial import extraer_bloques
+from buffer_circular import BufferCircular, filas_desde_tramas, COL_TIEMPO
+from decimacion import PiramideMinMax
+from metricas_online import MetricasEnLinea
+import simulador
+
+SEMILLA = 1234
+REPETICIONES = 5
+TOLERANCIA = 0.25  # Empeoramiento relativo tolerado al comparar con --comparar
+TASA = 100.0  # Tramas por segundo del generador en el benchmark del tablero
+DURACION = 10.0  # Segundos del benchmark del tablero
+HORAS_MEMORIA = 6.0  # Horas simuladas en el benchmark de memoria
+TAMANOS_BLOQUE = (64, 4096, 65536)  # Bytes por lectura en el benchmark de parseo
+TRAMAS_PARSEO = 200000
+
+BENCHMARKS = ('parseo', 'tablero', 'memoria', 'estabilidad')
+
+
+# ----------------------------------------------------------------------
+# Datos sintéticos
+# ----------------------------------------------------------------------
+
+def trayectoria_sintetica(duracion=120.0, semilla=SEMILLA):
+    """
+    Tramas (N, 8) de una simulación del firmware con escalones de setpoint.
+
+    El setpoint alterna entre 28 °C y 25 °C cada 30 s y la medición tiene un
+    ruido de ±0.05 °C con semilla fija, así que los datos son reproducibles.
+    Se descarta el primer segundo: el filtro del firmware arranca en cero.
+    """
+    descarte = int(round(1.0 / simulador.PERIODO))
+    n = int(round(duracion / simulador.PERIODO)) + descarte
+    t = np.arange(n) * simulador.PERIODO
+    setpoint = np.where((t // 30) % 2 == 0, 28.0, 25.0)[None, :]
+    r = simulador.simular(setpoint=setpoint, duracion=n * simulador.PERIODO)
+    rng = np.random.default_rng(semilla)
+    medida = r.medida[0] + rng.uniform(-0.05, 0.05, n)
+    datos = np.column_stack([medida, r.setpoint[0], r.error[0], r.p[0], r.i[0], r.d[0],
+                             r.total[0], np.floor(r.salida[0])])
+    return datos[descarte:]
+
+
+def formatear_tramas(datos):
+    """Líneas con el formato del firmware (2 decimales, salida entera) como bytes."""
+    lineas = [f"{PREFIJO_DATOS}{a:.2f},{b:.2f},{c:.2f},{d:.2f},{e:.2f},{f:.2f},{g:.2f},{int(h)}"
+              for a, b, c, d, e, f, g, h in datos.tolist()]
+    return [(linea + '\n').encode('ascii') for linea in lineas]
+
+
+class FuenteMemoria:
+    """
+    Reemplazo en memoria de LectorSerial: escribir() parsea y encola como lo haría el hilo lector.
+    """
+
+    def __init__(self):
+        self.parser = ParserTramas()
+        self.muestras = deque()
+        self.generador = None
+
+    @property
+    def tramas_leidas(self):
+        return self.parser.tramas
+
+    @property
+    def errores_parseo(self):
+        return self.parser.malformadas
+
+    def escribir(self, crudo):
+        datos = self.parser.alimentar(crudo)
+        if len(datos):
+            self.muestras.append((np.full(len(datos), time.time()), datos))
+
+    def extraer(self):
+        return extraer_bloques(self.muestras)
+
+    def is_alive(self):
+        return self.generador is not None and self.generador.is_alive()
+
+    def detener(self, espera=1.0):
+        pass
+
+
+class GeneradorTramas(threading.Thread):
+    """
+    Escribe tramas sintéticas a `tasa` por segundo con `escribir(bytes)`.
+
+    Guarda en t_envio el time.perf_counter() en que se escribió cada trama,
+    para medir la latencia de extremo a extremo. Las tramas que tocan en el
+    mismo tick (1 ms como mínimo) se escriben juntas, como llegarían por el puerto.
+    """
+
+    def __init__(self, escribir, tasa, duracion, lineas, tick=0.001):
+        super().__init__(name='GeneradorTramas', daemon=True)
+        self.escribir = escribir
+        self.tasa = tasa
+        self.lineas = lineas
+        self.tick = max(tick, 1.0 / tasa)
+        self.total = int(round(tasa * duracion))
+        self.t_envio = np.full(self.total, np.nan)
+        self.enviadas = 0
+
+    def run(self):
+        t0 = time.perf_counter()
+        n = len(self.lineas)
+        while self.enviadas < self.total:
+            debidas = min(int((time.perf_counter() - t0) * self.tasa) + 1, self.total)
+            if debidas > self.enviadas:
+                crudo = b''.join(self.lineas[i % n] for i in range(self.enviadas, debidas))
+                self.t_envio[self.enviadas:debidas] = time.perf_counter()
+                self.escribir(crudo)
+                self.enviadas = debidas
+            time.sleep(self.tick)
+
+
+# ----------------------------------------------------------------------
+# Utilidades de medición
+# ----------------------------------------------------------------------
+
+def medir(funcion, repeticiones=REPETICIONES):
+    """Tiempos de `repeticiones` llamadas: devuelve (mínimo, mediana) en segundos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return min(tiempos), float(np.median(tiempos))
+
+
+def memoria_residente():
+    """Memoria residente del proceso en MB (sólo Linux; None en otros sistemas)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def percentiles(valores, prefijo, escala=1000.0):
+    """p50/p95/p99/máx de valores en segundos, como '<prefijo>_p50_ms', ..."""
+    if len(valores) == 0:
+        return {}
+    p50, p95, p99 = np.percentile(valores, [50, 95, 99]) * escala
+    return {f'{prefijo}_p50_ms': p50, f'{prefijo}_p95_ms': p95,
+            f'{prefijo}_p99_ms': p99, f'{prefijo}_max_ms': float(np.max(valores)) * escala}
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+
+def bench_parseo(repeticiones=REPETICIONES, tramas=TRAMAS_PARSEO):
+    lineas = formatear_tramas(trayectoria_sintetica())
+    lineas = [lineas[i % len(lineas)] for i in range(tramas)]
+    crudo = b''.join(lineas)
+    resultados = {'tramas': tramas, 'mb': len(crudo) / 2 ** 20}
+
+    # Referencia: el camino anterior, readline + decode + parsear_linea por trama
+    def linea_a_linea():
+        flujo = io.BytesIO(crudo)
+        for linea in iter(flujo.readline, b''):
+            parsear_linea(linea.decode('utf-8', errors='ignore').strip())
+
+    mejor, _ = medir(linea_a_linea, repeticiones)
+    referencia = tramas / mejor
+    resultados['tramas_por_s_linea_a_linea'] = referencia
+
+    # En vivo a 10-100 tramas/s cada lectura del puerto trae una sola trama
+    casos = [('una_trama', lineas)]
+    casos += [(f'bloque_{tam}', [crudo[i:i + tam] for i in range(0, len(crudo), tam)])
+              for tam in TAMANOS_BLOQUE]
+    for nombre, bloques in casos:
+        def parsear():
+            parser = ParserTramas()
+            for bloque in bloques:
+                parser.alimentar(bloque)
+            assert parser.tramas == tramas and parser.malformadas == 0
+
+        mejor, _ = medir(parsear, repeticiones)
+        resultados[f'tramas_por_s_{nombre}'] = tramas / mejor
+        resultados[f'mb_por_s_{nombre}'] = len(crudo) / 2 ** 20 / mejor
+        resultados[f'aceleracion_{nombre}'] = tramas / mejor / referencia
+    return resultados
+
+
+def bench_tablero(tasa=TASA, duracion=DURACION, fuente='memoria'):
+    """Camino completo de analisis.py con blitting sobre Agg."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import analisis
+    from renderizador import RenderizadorBlit
+
+    lineas = formatear_tramas(trayectoria_sintetica())
+    maestro = None
+    if fuente == 'pty':
+        import pty
+        import tty
+        from lector_serial import LectorSerial
+        maestro, esclavo = pty.openpty()
+        tty.setraw(esclavo)
+        lector = LectorSerial(os.ttyname(esclavo), analisis.BAUD_RATE, max_intentos=1)
+        generador = GeneradorTramas(lambda crudo: os.write(maestro, crudo), tasa, duracion, lineas)
+    else:
+        lector = FuenteMemoria()
+        generador = GeneradorTramas(lector.escribir, tasa, duracion, lineas)
+        lector.generador = generador
+
+    # Estado limpio del módulo analisis para esta corrida
+    analisis.lector = lector
+    analisis.start_time = None
+    analisis.buffer.limpiar()
+    if analisis.metricas is not None:
+        analisis.metricas = MetricasEnLinea()
+    analisis.crear_figura()
+    renderizador = RenderizadorBlit(analisis.fig, analisis.init(), analisis.frame_blit)
+
+    latencias = []
+    tiempos_frame = []
+    memoria_inicial = memoria_residente()
+    if fuente == 'pty':
+        lector.start()
+        time.sleep(0.2)  # Que el lector abra el puerto antes de empezar a escribir
+    generador.start()
+    t0 = time.perf_counter()
+    try:
+        while generador.is_alive() or lector.muestras:
+            total_antes = analisis.buffer.total
+            tiempos_frame.append(renderizador.frame())
+            t_pixel = time.perf_counter()
+            total = analisis.buffer.total
+            if total > total_antes:
+                latencias.append(t_pixel - generador.t_envio[total_antes:min(total, generador.total)])
+            time.sleep(renderizador.intervalo_ms / 1000.0)
+        transcurrido = time.perf_counter() - t0
+        time.sleep(0.2)
+        analisis.consumir_muestras()
+    finally:
+        lector.detener()
+        if maestro is not None:
+            os.close(maestro)
+        matplotlib.pyplot.close(analisis.fig)
+
+    recibidas = analisis.buffer.total
+    latencias = np.concatenate(latencias) if latencias else np.empty(0)
+    resultados = {
+        'fuente': fuente, 'tasa': tasa, 'duracion': duracion,
+        'enviadas': generador.enviadas, 'recibidas': recibidas,
+        'perdidas': generador.enviadas - recibidas, 'malformadas': lector.errores_parseo,
+        'frames': renderizador.frames, 'redibujados_completos': renderizador.redibujados_completos,
+        'frames_por_s': renderizador.frames / transcurrido,
+    }
+    resultados.update(percentiles(latencias[~np.isnan(latencias)], 'latencia'))
+    resultados.update(percentiles(np.array(tiempos_frame), 'frame'))
+    if memoria_inicial is not None:
+        resultados['memoria_crecimiento_mb'] = memoria_residente() - memoria_inicial
+    return resultados
+
+
+def bench_memoria(horas=HORAS_MEMORIA, periodo=0.1, tam_bloque=10):
+    """Horas de datos por el camino del consumidor; crecimiento de memoria por hora."""
+    datos = trayectoria_sintetica()
+    n_tray = len(datos)
+    buffer = BufferCircular(300)
+    historial = PiramideMinMax(7)
+    metricas = MetricasEnLinea()
+    total = int(horas * 3600 / periodo)
+    por_hora = int(3600 / periodo)
+    tracemalloc.start()
+    muestras_memoria = []  # (hora simulada, bytes asignados)
+    t0 = time.perf_counter()
+    try:
+        for i in range(0, total, tam_bloque):
+            idx = np.arange(i, min(i + tam_bloque, total))
+            filas = filas_desde_tramas(idx * periodo, datos[idx % n_tray])
+            buffer.agregar_bloque(filas)
+            historial.agregar_bloque(filas[:, COL_TIEMPO], filas[:, 1:])
+            metricas.agregar_bloque(filas)
+            if (i + tam_bloque) % por_hora < tam_bloque:
+                muestras_memoria.append(((i + tam_bloque) / por_hora,
+                                         tracemalloc.get_traced_memory()[0]))
+        transcurrido = time.perf_counter() - t0
+        # Muestra final siempre (con --horas < 1 no hay ninguna horaria)
+        if not muestras_memoria or muestras_memoria[-1][0] < total / por_hora:
+            muestras_memoria.append((total / por_hora, tracemalloc.get_traced_memory()[0]))
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    horas_muestra, memoria = np.array(muestras_memoria, dtype=float).T
+    memoria /= 2 ** 20
+    # Crecimiento en régimen: pendiente de la segunda mitad de la corrida
+    mitad = slice(len(memoria) // 2, None)
+    pendiente = (float(np.polyfit(horas_muestra[mitad], memoria[mitad], 1)[0])
+                 if len(memoria[mitad]) > 1 else 0.0)
+    return {'horas': horas, 'muestras': total,
+            'muestras_por_s': total / transcurrido,
+            'memoria_final_mb': float(memoria[-1]),
+            'memoria_pico_mb': pico / 2 ** 20,
+            'crecimiento_mb_por_hora': pendiente}
+
+
+def bench_estabilidad(repeticiones=REPETICIONES):
+    import analisis
+    import barrido_ganancias
+
+    resultados = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        mejor, mediana = medir(lambda: analisis.analizar_estabilidad(graficar=False), repeticiones)
+    resultados.update(analisis_estabilidad_s=mejor, analisis_estabilidad_mediana_s=mediana)
+
+    valores = {'KP': np.linspace(0.5, 6, 40), 'KI': np.linspace(1, 12, 40),
+               'K': np.linspace(0.3, 0.4, 5), 'L': np.linspace(0.08, 0.15, 5)}
+    mejor, mediana = medir(lambda: barrido_ganancias.barrido(valores), repeticiones)
+    resultados.update(barrido_40000_s=mejor, barrido_40000_mediana_s=mediana)
+
+    kp = np.linspace(1, 3, 1000)
+    mejor, mediana = medir(lambda: simulador.simular(kp=kp, duracion=60.0), repeticiones)
+    resultados.update(simulacion_1000x60s_s=mejor, simulacion_1000x60s_mediana_s=mediana)
+    return resultados
+
+
+# ----------------------------------------------------------------------
+# Comparación entre corridas
+# ----------------------------------------------------------------------
+
+def sentido(metrica):
+    """+1 si más es mejor, -1 si menos es mejor, 0 si no se compara."""
+    if '_por_s' in metrica:
+        return 1
+    if metrica.endswith(('_s', '_ms', '_mb', '_mb_por_hora')):
+        return -1
+    return 0
+
+
+def comparar(actual, base, tolerancia=TOLERANCIA):
+    """Lista de (benchmark, métrica, base, actual, cambio relativo) que empeoraron."""
+    regresiones = []
+    for nombre, metricas in actual.get('resultados', {}).items():
+        anteriores = base.get('resultados', {}).get(nombre, {})
+        for metrica, valor in metricas.items():
+            s = sentido(metrica)
+            anterior = anteriores.get(metrica)
+            if s == 0 or not isinstance(valor, (int, float)) or not isinstance(anterior, (int, float)):
+                continue
+            if metrica == 'crecimiento_mb_por_hora':
+                # Cerca de cero el cambio relativo no tiene sentido: se compara en absoluto
+                if valor - anterior > 1.0:
+                    regresiones.append((nombre, metrica, anterior, valor, np.inf))
+                continue
+            if anterior <= 0:
+                continue
+            cambio = (valor - anterior) / anterior
+            if s * cambio < -tolerancia:
+                regresiones.append((nombre, metrica, anterior, valor, cambio))
+    return regresiones
+
+
+def entorno():
+    import matplotlib
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__, 'sistema': platform.platform(),
+            'procesador': platform.processor() or platform.machine(), 'cpus': os.cpu_count(),
+            'fecha': time.strftime('%Y-%m-%d %H:%M:%S'), 'semilla': SEMILLA}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del análisis en vivo del PID")
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f"Cuáles correr: {', '.join(BENCHMARKS)} (por defecto todos)")
+    parser.add_argument('--tasa', type=float, default=TASA, help="Tramas/s del generador (tablero)")
+    parser.add_argument('--duracion', type=float, default=DURACION, help="Segundos (tablero)")
+    parser.add_argument('--fuente', choices=('memoria', 'pty'), default='memoria',
+                        help="Generador en memoria o en un pty con el LectorSerial real")
+    parser.add_argument('--horas', type=float, default=HORAS_MEMORIA, help="Horas simuladas (memoria)")
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--salida', metavar='JSON', help="Guarda los resultados")
+    parser.add_argument('--comparar', metavar='JSON', help="Compara con una corrida anterior")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    args = parser.parse_args(argv)
+
+    desconocidos = set(args.benchmarks) - set(BENCHMARKS)
+    if desconocidos:
+        parser.error(f"benchmark desconocido: {', '.join(sorted(desconocidos))}")
+    elegidos = args.benchmarks or BENCHMARKS
+    funciones = {
+        'parseo': lambda: bench_parseo(args.repeticiones),
+        'tablero': lambda: bench_tablero(args.tasa, args.duracion, args.fuente),
+        'memoria': lambda: bench_memoria(args.horas),
+        'estabilidad': lambda: bench_estabilidad(args.repeticiones),
+    }
+    informe = {'entorno': entorno(), 'resultados': {}}
+    for nombre in BENCHMARKS:
+        if nombre not in elegidos:
+            continue
+        print(f"⏱️  {nombre}...")
+        resultados = funciones[nombre]()
+        informe['resultados'][nombre] = resultados
+        for metrica, valor in resultados.items():
+            texto = f"{valor:,.3f}" if isinstance(valor, float) else str(valor)
+            print(f"   {metrica:<36} {texto:>16}")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regresiones = comparar(informe, base, args.tolerancia)
+        if regresiones:
+            print(f"\n⚠️ {len(regresiones)} regresión(es) respecto de {args.comparar}:")
+            for nombre, metrica, anterior, valor, cambio in regresiones:
+                print(f"   {nombre}.{metrica}: {anterior:,.3f} → {valor:,.3f} ({cambio:+.0%})")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones respecto de {args.comparar} (tolerancia {args.tolerancia:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Buffer circular columnar para las muestras del controlador PID.
+
+Reemplaza a los siete deque(maxlen=MAX_PUNTOS) de analisis.py por un único
+arreglo float64 preasignado de (N, 8) columnas. Cada fila se escribe dos veces
+(en i y en i + N) para que la ventana de las últimas n muestras sea siempre
+un bloque contiguo: ventana() y columna() devuelven vistas sin copiar datos,
+listas para line.set_data().
+
+Además lleva el mínimo y el máximo de cada columna de forma incremental con
+colas monótonas, de modo que el autoescalado no tiene que recorrer la ventana
+en cada frame (coste amortizado O(1) por muestra).
+"""
+from collections import deque
+
+import numpy as np
+
+# Columnas del buffer
+COL_TIEMPO = 0
+COL_TEMPERATURA = 1
+COL_SETPOINT = 2
+COL_ERROR = 3
+COL_P = 4
+COL_I = 5
+COL_D = 6
+COL_PWM = 7  # Salida PWM en porcentaje (0-100%)
+NUM_COLUMNAS = 8
+
+
+def filas_desde_tramas(t, datos):
+    """
+    Convierte tramas del firmware (arreglo (n, 8)) en filas del buffer (n, 8).
+
+    Cada trama trae: temperatura,setpoint,error,out_p,out_i,out_d,out_total,salida.
+    out_total no se grafica y la salida (0-255) se guarda en porcentaje.
+    """
+    filas = np.empty((len(datos), NUM_COLUMNAS), dtype=np.float64)
+    filas[:, COL_TIEMPO] = t
+    filas[:, COL_TEMPERATURA:COL_D + 1] = datos[:, :6]
+    filas[:, COL_PWM] = datos[:, 7] * (100.0 / 255.0)
+    return filas
+
+
+class BufferCircular:
+    """Buffer circular de capacidad fija con vistas contiguas y min/max incremental."""
+
+    def __init__(self, capacidad, num_columnas=NUM_COLUMNAS):
+        if capacidad <= 0:
+            raise ValueError("La capacidad debe ser mayor que cero")
+        self.capacidad = capacidad
+        self.num_columnas = num_columnas
+        # Doble de filas: la fila i se guarda también en i + capacidad
+        self._datos = np.zeros((2 * capacidad, num_columnas), dtype=np.float64)
+        self._escritura = 0    # Próxima posición a escribir, en [0, capacidad)
+        self._n = 0            # Muestras válidas en la ventana
+        self._total = 0        # Muestras agregadas desde el inicio (índice global)
+        # Colas monótonas por columna con pares (índice_global, valor)
+        self._colas_min = [deque() for _ in range(num_columnas)]
+        self._colas_max = [deque() for _ in range(num_columnas)]
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def total(self):
+        """Número de muestras agregadas desde la creación del buffer."""
+        return self._total
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def agregar(self, fila):
+        """Agrega una fila (secuencia de num_columnas valores)."""
+        i = self._escritura
+        self._datos[i] = fila
+        self._datos[i + self.capacidad] = fila
+        self._escritura = (i + 1) % self.capacidad
+        if self._n < self.capacidad:
+            self._n += 1
+        self._actualizar_extremos(self._total, self._datos[i])
+        self._total += 1
+
+    def agregar_bloque(self, filas):
+        """Agrega varias filas de una vez (arreglo de forma (m, num_columnas))."""
+        filas = np.asarray(filas, dtype=np.float64).reshape(-1, self.num_columnas)
+        m = len(filas)
+        if m == 0:
+            return
+        # Las filas que no caben en la ventana no hace falta escribirlas
+        descartadas = max(0, m - self.capacidad)
+        utiles = filas[descartadas:]
+        self._total += descartadas
+        indices = (self._escritura + descartadas + np.arange(len(utiles))) % self.capacidad
+        self._datos[indices] = utiles
+        self._datos[indices + self.capacidad] = utiles
+        self._escritura = (self._escritura + m) % self.capacidad
+        self._n = min(self.capacidad, self._n + m)
+        for fila in utiles:
+            self._actualizar_extremos(self._total, fila)
+            self._total += 1
+
+    def limpiar(self):
+        """Vacía el buffer sin liberar memoria."""
+        self._escritura = 0
+        self._n = 0
+        self._total = 0
+        for cola in self._colas_min + self._colas_max:
+            cola.clear()
+
+    def _actualizar_extremos(self, indice, fila):
+        """Actualiza las colas monótonas de min/max con la nueva fila."""
+        limite = indice - self.capacidad  # Índices <= limite ya salieron de la ventana
+        for c in range(self.num_columnas):
+            v = fila[c]
+            cola = self._colas_min[c]
+            while cola and cola[-1][1] >= v:
+                cola.pop()
+            cola.append((indice, v))
+            while cola[0][0] <= limite:
+                cola.popleft()
+            cola = self._colas_max[c]
+            while cola and cola[-1][1] <= v:
+                cola.pop()
+            cola.append((indice, v))
+            while cola[0][0] <= limite:
+                cola.popleft()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def ventana(self):
+        """Vista (sin copia) de las últimas muestras, de forma (n, num_columnas)."""
+        inicio = (self._escritura - self._n) % self.capacidad
+        return self._datos[inicio:inicio + self._n]
+
+    def columna(self, c):
+        """Vista (sin copia) de una columna de la ventana."""
+        return self.ventana()[:, c]
+
+    def ultimo(self, c):
+        """Último valor de la columna c (NaN si el buffer está vacío)."""
+        if self._n == 0:
+            return np.nan
+        return self._datos[(self._escritura - 1) % self.capacidad, c]
+
+    def minimo(self, *columnas):
+        """Mínimo de la ventana sobre una o varias columnas (NaN si está vacío)."""
+        if self._n == 0:
+            return np.nan
+        return min(self._colas_min[c][0][1] for c in columnas)
+
+    def maximo(self, *columnas):
+        """Máximo de la ventana sobre una o varias columnas (NaN si está vacío)."""
+        if self._n == 0:
+            return np.nan
+        return max(self._colas_max[c][0][1] for c in columnas)
@@ -0,0 +1,210 @@
+"""
+Decimación min/max (nivel de detalle) para gráficas con historial largo.
+
+Una línea de matplotlib no puede mostrar más de un par de puntos por columna
+de píxeles, así que dibujar decenas de miles de muestras sólo gasta tiempo y
+memoria. Este módulo reduce cada serie conservando, para cada intervalo, la
+muestra mínima y la máxima en orden cronológico: los picos siguen visibles.
+
+- decimar_minmax(): decimación directa de una ventana (vectorizada).
+- PiramideMinMax: historial completo de la sesión con niveles de resolución
+  (cada nivel agrupa `factor` bloques del anterior). Una consulta de horas de
+  datos lee el nivel más grueso que todavía da suficientes puntos, en lugar de
+  recorrer todas las muestras.
+"""
+import math
+
+import numpy as np
+
+
+def puntos_por_ancho(ax, puntos_por_pixel=2):
+    """Número máximo de puntos útiles para una línea en el eje ax (2 por píxel)."""
+    return max(int(ax.bbox.width) * puntos_por_pixel, 2)
+
+
+def indices_minmax(y, max_puntos):
+    """
+    Índices (ordenados) de las muestras mínima y máxima de cada intervalo.
+
+    y puede ser 1D (n,) o 2D (n, canales); en 2D se devuelve un arreglo
+    (m, canales) con los índices de cada canal.
+    """
+    n = len(y)
+    if n <= max_puntos:
+        idx = np.arange(n)
+        return idx if y.ndim == 1 else np.repeat(idx[:, None], y.shape[1], axis=1)
+    num_bins = max(max_puntos // 2, 1)
+    tam = math.ceil(n / num_bins)
+    completos = (n // tam) * tam
+    bloques = y[:completos].reshape((-1, tam) + y.shape[1:])
+    base = (np.arange(len(bloques)) * tam).reshape((-1,) + (1,) * (y.ndim - 1))
+    idx_min = bloques.argmin(axis=1) + base
+    idx_max = bloques.argmax(axis=1) + base
+    partes = [np.minimum(idx_min, idx_max), np.maximum(idx_min, idx_max)]
+    if completos < n:
+        # Último intervalo incompleto
+        resto = y[completos:]
+        r_min = resto.argmin(axis=0) + completos
+        r_max = resto.argmax(axis=0) + completos
+        partes[0] = np.concatenate([partes[0], np.minimum(r_min, r_max)[None]])
+        partes[1] = np.concatenate([partes[1], np.maximum(r_min, r_max)[None]])
+    # Intercalar (min, max) de cada intervalo respetando el orden temporal
+    idx = np.stack(partes, axis=1)
+    return idx.reshape((-1,) + y.shape[1:])
+
+
+def decimar_minmax(x, y, max_puntos):
+    """
+    Reduce la serie (x, y) a como mucho max_puntos puntos conservando los picos.
+
+    Devuelve (x_dec, y_dec). Si la serie ya es pequeña se devuelve sin copiar.
+    """
+    if len(y) <= max_puntos:
+        return x, y
+    idx = indices_minmax(np.asarray(y), max_puntos)
+    return x[idx], y[idx]
+
+
+class _ArregloCreciente:
+    """Arreglo que crece duplicando su capacidad (append amortizado O(1))."""
+
+    def __init__(self, forma_fila, capacidad=1024):
+        self._datos = np.empty((capacidad,) + tuple(forma_fila), dtype=np.float64)
+        self.n = 0
+
+    def extender(self, filas):
+        m = len(filas)
+        if self.n + m > len(self._datos):
+            nueva = max(2 * len(self._datos), self.n + m)
+            datos = np.empty((nueva,) + self._datos.shape[1:], dtype=np.float64)
+            datos[:self.n] = self._datos[:self.n]
+            self._datos = datos
+        self._datos[self.n:self.n + m] = filas
+        self.n += m
+
+    def vista(self, inicio=0, fin=None):
+        fin = self.n if fin is None else min(fin, self.n)
+        return self._datos[inicio:fin]
+
+    def __len__(self):
+        return self.n
+
+
+class PiramideMinMax:
+    """
+    Historial completo de varios canales con una pirámide de resoluciones min/max.
+
+    El nivel 0 son las muestras originales. El nivel k guarda, para cada bloque
+    de factor**k muestras, el mínimo y el máximo de cada canal junto con el
+    instante en que ocurrieron. Los niveles se completan a medida que llegan
+    muestras, así que agregar datos cuesta O(1) amortizado.
+    """
+
+    def __init__(self, num_canales, factor=4, capacidad_inicial=4096):
+        if factor < 2:
+            raise ValueError("El factor de la pirámide debe ser al menos 2")
+        self.num_canales = num_canales
+        self.factor = factor
+        self._t = _ArregloCreciente((), capacidad_inicial)
+        self._y = _ArregloCreciente((num_canales,), capacidad_inicial)
+        # Cada nivel: (t_min, y_min, t_max, y_max), arreglos (bloques, canales)
+        self._niveles = []
+
+    def __len__(self):
+        return len(self._t)
+
+    def agregar_bloque(self, t, y):
+        """Agrega muestras: t de forma (m,) e y de forma (m, num_canales)."""
+        t = np.asarray(t, dtype=np.float64).reshape(-1)
+        y = np.asarray(y, dtype=np.float64).reshape(-1, self.num_canales)
+        if len(t) == 0:
+            return
+        self._t.extender(t)
+        self._y.extender(y)
+        self._propagar()
+
+    def _propagar(self):
+        """Completa los bloques nuevos de cada nivel a partir del nivel anterior."""
+        f = self.factor
+        nivel = 0
+        while True:
+            if nivel == 0:
+                n_fuente = len(self._t)
+            else:
+                n_fuente = len(self._niveles[nivel - 1][0])
+            if n_fuente < f:
+                return
+            if nivel == len(self._niveles):
+                self._niveles.append(tuple(_ArregloCreciente((self.num_canales,), 256)
+                                           for _ in range(4)))
+            t_min, y_min, t_max, y_max = self._niveles[nivel]
+            hechos = len(t_min)
+            completos = n_fuente // f
+            if completos > hechos:
+                a, b = hechos * f, completos * f
+                if nivel == 0:
+                    yb = self._y.vista(a, b)
+                    tb = np.broadcast_to(self._t.vista(a, b)[:, None], yb.shape)
+                    fuentes = (tb, yb, tb, yb)
+                else:
+                    fuentes = tuple(arr.vista(a, b) for arr in self._niveles[nivel - 1])
+                forma = (-1, f, self.num_canales)
+                ft_min, fy_min, ft_max, fy_max = (arr.reshape(forma) for arr in fuentes)
+                i_min = fy_min.argmin(axis=1)[:, None, :]
+                i_max = fy_max.argmax(axis=1)[:, None, :]
+                t_min.extender(np.take_along_axis(ft_min, i_min, axis=1)[:, 0])
+                y_min.extender(np.take_along_axis(fy_min, i_min, axis=1)[:, 0])
+                t_max.extender(np.take_along_axis(ft_max, i_max, axis=1)[:, 0])
+                y_max.extender(np.take_along_axis(fy_max, i_max, axis=1)[:, 0])
+            nivel += 1
+
+    def consultar(self, t0, t1, max_puntos):
+        """
+        Devuelve (t, y) del intervalo [t0, t1] con como mucho ~max_puntos por canal.
+
+        Ambos arreglos tienen forma (m, num_canales): cada canal tiene sus
+        propios instantes porque el mínimo y el máximo caen en muestras distintas.
+        """
+        tiempos = self._t.vista()
+        i0 = int(np.searchsorted(tiempos, t0, side='left'))
+        i1 = int(np.searchsorted(tiempos, t1, side='right'))
+        n = i1 - i0
+        if n <= max_puntos:
+            y = self._y.vista(i0, i1)
+            return np.broadcast_to(tiempos[i0:i1, None], y.shape), y
+
+        # Nivel más grueso que aún entrega max_puntos/2 bloques en el intervalo
+        nivel = int(math.floor(math.log(2 * n / max_puntos, self.factor)))
+        nivel = max(0, min(nivel, len(self._niveles)))
+        if nivel == 0:
+            y = self._y.vista(i0, i1)
+            t = np.broadcast_to(tiempos[i0:i1, None], y.shape)
+            idx = indices_minmax(y, max_puntos)
+            return np.take_along_axis(t, idx, axis=0), np.take_along_axis(y, idx, axis=0)
+
+        tam = self.factor ** nivel
+        t_min, y_min, t_max, y_max = self._niveles[nivel - 1]
+        j0 = i0 // tam
+        j1 = min(-(-i1 // tam), len(t_min))
+        tmn, ymn = t_min.vista(j0, j1), y_min.vista(j0, j1)
+        tmx, ymx = t_max.vista(j0, j1), y_max.vista(j0, j1)
+        # Intercalar min y max de cada bloque en orden temporal
+        primero_min = tmn <= tmx
+        t = np.stack([np.where(primero_min, tmn, tmx), np.where(primero_min, tmx, tmn)], axis=1)
+        y = np.stack([np.where(primero_min, ymn, ymx), np.where(primero_min, ymx, ymn)], axis=1)
+        t = t.reshape(-1, self.num_canales)
+        y = y.reshape(-1, self.num_canales)
+
+        # Muestras del final que todavía no forman un bloque completo en este nivel
+        cubiertas = j1 * tam
+        if cubiertas < i1:
+            y_resto = self._y.vista(max(cubiertas, i0), i1)
+            t_resto = np.broadcast_to(tiempos[max(cubiertas, i0):i1, None], y_resto.shape)
+            idx = indices_minmax(y_resto, max(2, 2 * len(y_resto) // tam))
+            t = np.concatenate([t, np.take_along_axis(t_resto, idx, axis=0)])
+            y = np.concatenate([y, np.take_along_axis(y_resto, idx, axis=0)])
+        if len(y) > max_puntos:
+            # El nivel elegido puede dar hasta `factor` veces más puntos: recortar
+            idx = indices_minmax(y, max_puntos)
+            t, y = np.take_along_axis(t, idx, axis=0), np.take_along_axis(y, idx, axis=0)
+        return t, y
@@ -0,0 +1,348 @@
+"""
+Grabación binaria de sesiones serie y reproducción con memoria mapeada.
+
+FORMATO DEL ARCHIVO (.pidrec):
+- Cabecera de TAM_CABECERA bytes: la firma MAGIA seguida de un JSON (UTF-8)
+  con KP/KI/KD, los parámetros de la planta (K, T, L), el puerto, la fecha
+  de inicio y la lista de campos. El resto se rellena con espacios.
+- Registros de ancho fijo, uno por trama ">> ", con 9 float64 little-endian:
+  t (hora de llegada, segundos desde epoch) seguido de los 8 campos
+  temperatura,setpoint,error,out_p,out_i,out_d,out_total,salida.
+
+Como los registros son de ancho fijo y t es creciente, Grabacion abre el
+archivo con np.memmap y busca por tiempo con búsqueda binaria: una grabación
+de una semana se consulta sin cargarla en memoria. Si el programa se corta,
+un registro incompleto al final se ignora al leer y se recorta antes de
+volver a agregar.
+
+Uso por línea de comandos:
+    python grabacion.py info sesion.pidrec
+    python grabacion.py exportar sesion.pidrec salida.csv --desde 3600 --hasta 7200
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from lector_serial import extraer_bloques
+
+MAGIA = b'PIDREC01'
+TAM_CABECERA = 1024
+VERSION_FORMATO = 1
+
+CAMPOS = ('temperatura', 'setpoint', 'error', 'out_p', 'out_i', 'out_d', 'out_total', 'salida')
+DTYPE_REGISTRO = np.dtype([('t', '<f8')] + [(c, '<f8') for c in CAMPOS])
+# Un salto de tiempo mayor a esto entre dos tramas es un hueco (sesiones
+# agregadas al mismo archivo, cortes del puerto) [s]
+HUECO_MAXIMO = 2.0
+
+
+def _leer_cabecera(ruta):
+    """Lee y valida la cabecera de una grabación. Devuelve el diccionario JSON."""
+    with open(ruta, 'rb') as f:
+        crudo = f.read(TAM_CABECERA)
+    if len(crudo) < TAM_CABECERA or not crudo.startswith(MAGIA):
+        raise ValueError(f"{ruta} no es una grabación válida (.pidrec)")
+    return json.loads(crudo[len(MAGIA):].decode('utf-8').strip())
+
+
+class Grabador:
+    """
+    Agrega tramas a un archivo de grabación.
+
+    Las tramas se acumulan en memoria y se escriben en bloques de
+    `registros_por_bloque` (o al llamar a vaciar()/cerrar()). Si el archivo ya
+    existe, se siguen agregando registros a continuación: antes se recorta el
+    registro incompleto que haya dejado un corte, para no desalinear los
+    nuevos. La cabecera no se reescribe; si los parámetros de la sesión nueva
+    difieren de los guardados se avisa.
+    """
+
+    def __init__(self, ruta, parametros=None, registros_por_bloque=64):
+        self.ruta = ruta
+        self.registros_por_bloque = registros_por_bloque
+        self._pendientes = []
+        self._lock = threading.Lock()
+        nuevo = not os.path.exists(ruta) or os.path.getsize(ruta) == 0
+        if not nuevo:
+            self._preparar_agregado(parametros or {})
+        self._archivo = open(ruta, 'ab')
+        if nuevo:
+            self._escribir_cabecera(parametros or {})
+        self.registros = (os.path.getsize(ruta) - TAM_CABECERA) // DTYPE_REGISTRO.itemsize
+
+    def _preparar_agregado(self, parametros):
+        """Valida un archivo existente, recorta un registro incompleto y compara parámetros."""
+        cabecera = _leer_cabecera(self.ruta)
+        tam = os.path.getsize(self.ruta)
+        completo = TAM_CABECERA + (tam - TAM_CABECERA) // DTYPE_REGISTRO.itemsize * DTYPE_REGISTRO.itemsize
+        if tam > completo:
+            with open(self.ruta, 'r+b') as f:
+                f.truncate(completo)
+            print(f"⚠️ {self.ruta}: se descartaron {tam - completo} bytes de un registro incompleto")
+        # Misma representación que la cabecera (tuplas -> listas) antes de comparar
+        parametros = json.loads(json.dumps(parametros, ensure_ascii=False))
+        distintos = sorted(k for k, v in parametros.items() if cabecera.get(k) != v)
+        if distintos:
+            print(f"⚠️ {self.ruta}: la cabecera conserva los parámetros de la primera sesión; "
+                  f"difieren {', '.join(distintos)}")
+
+    def _escribir_cabecera(self, parametros):
+        cabecera = {
+            'version': VERSION_FORMATO,
+            'campos': ['t'] + list(CAMPOS),
+            'inicio': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        cabecera.update(parametros)
+        crudo = MAGIA + json.dumps(cabecera, ensure_ascii=False).encode('utf-8')
+        if len(crudo) > TAM_CABECERA:
+            raise ValueError("La cabecera de la grabación supera TAM_CABECERA bytes")
+        self._archivo.write(crudo.ljust(TAM_CABECERA, b' '))
+        self._archivo.flush()
+
+    def agregar(self, t, datos):
+        """Agrega una trama (t = hora de llegada, datos = 8 valores)."""
+        with self._lock:
+            self._pendientes.append((t, *datos))
+            if len(self._pendientes) >= self.registros_por_bloque:
+                self._vaciar()
+
+    def agregar_bloque(self, t, datos):
+        """Agrega varias tramas: t de forma (m,) y datos de forma (m, 8)."""
+        bloque = np.empty(len(t), dtype=DTYPE_REGISTRO)
+        bloque['t'] = t
+        for k, campo in enumerate(CAMPOS):
+            bloque[campo] = datos[:, k]
+        with self._lock:
+            self._vaciar()
+            self._archivo.write(bloque.tobytes())
+            self._archivo.flush()
+            self.registros += len(bloque)
+
+    def _vaciar(self):
+        if not self._pendientes:
+            return
+        bloque = np.array(self._pendientes, dtype=np.float64).astype('<f8', copy=False)
+        self._archivo.write(bloque.tobytes())
+        self._archivo.flush()
+        self.registros += len(self._pendientes)
+        self._pendientes = []
+
+    def vaciar(self):
+        """Escribe en disco las tramas pendientes."""
+        with self._lock:
+            self._vaciar()
+
+    def cerrar(self):
+        """Escribe lo pendiente y cierra el archivo."""
+        with self._lock:
+            if self._archivo.closed:
+                return
+            self._vaciar()
+            self._archivo.close()
+
+
+class Grabacion:
+    """
+    Grabación abierta en modo lectura con memoria mapeada.
+
+    `registros` es un np.memmap estructurado (campos 't' y CAMPOS): sólo se
+    leen del disco las páginas que realmente se consultan.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.cabecera = _leer_cabecera(ruta)
+        n = (os.path.getsize(ruta) - TAM_CABECERA) // DTYPE_REGISTRO.itemsize
+        if n > 0:
+            self.registros = np.memmap(ruta, dtype=DTYPE_REGISTRO, mode='r',
+                                       offset=TAM_CABECERA, shape=(n,))
+        else:
+            self.registros = np.empty(0, dtype=DTYPE_REGISTRO)
+
+    def __len__(self):
+        return len(self.registros)
+
+    @property
+    def t_inicio(self):
+        return float(self.registros['t'][0]) if len(self) else np.nan
+
+    @property
+    def duracion(self):
+        """Duración de la grabación en segundos."""
+        if len(self) < 2:
+            return 0.0
+        return float(self.registros['t'][-1] - self.registros['t'][0])
+
+    def buscar(self, t_relativo):
+        """Índice del primer registro con t >= t_inicio + t_relativo (búsqueda binaria)."""
+        return int(np.searchsorted(self.registros['t'], self.t_inicio + t_relativo, side='left'))
+
+    def entre(self, desde=0.0, hasta=None):
+        """Vista (sin copia) de los registros entre dos tiempos relativos al inicio."""
+        i0 = self.buscar(desde)
+        i1 = len(self) if hasta is None else self.buscar(hasta)
+        return self.registros[i0:i1]
+
+    def bloques(self, tam=65536, desde=0.0, hasta=None):
+        """Itera sobre la grabación en bloques de como mucho `tam` registros."""
+        vista = self.entre(desde, hasta)
+        for i in range(0, len(vista), tam):
+            yield vista[i:i + tam]
+
+    @staticmethod
+    def como_matriz(bloque):
+        """Convierte registros estructurados en (t, datos) con datos de forma (m, 8)."""
+        datos = np.empty((len(bloque), len(CAMPOS)), dtype=np.float64)
+        for k, campo in enumerate(CAMPOS):
+            datos[:, k] = bloque[campo]
+        return np.array(bloque['t'], dtype=np.float64), datos
+
+
+def leer_bloques(ruta, tam=65536):
+    """
+    Recorre una grabación completa en bloques de como mucho `tam` registros.
+
+    A diferencia de Grabacion.bloques() usa lecturas secuenciales en lugar de
+    np.memmap: las páginas mapeadas siguen contando en la memoria residente
+    mientras el archivo está abierto, y al recorrer archivos de varios GB
+    (informes por lotes) la memoria tiene que quedar constante. Un registro
+    incompleto al final se ignora.
+    """
+    _leer_cabecera(ruta)
+    ancho = DTYPE_REGISTRO.itemsize
+    with open(ruta, 'rb') as f:
+        f.seek(TAM_CABECERA)
+        while True:
+            crudo = f.read(tam * ancho)
+            n = len(crudo) // ancho
+            if n == 0:
+                return
+            yield np.frombuffer(crudo, dtype=DTYPE_REGISTRO, count=n)
+
+
+class ReproductorGrabacion(threading.Thread):
+    """
+    Reproduce una grabación con la misma interfaz que LectorSerial.
+
+    Entrega bloques (t, datos) con la hora original de cada trama a la
+    velocidad indicada: 1.0 = tiempo real, N = N veces más rápido y
+    0 = lo más rápido posible. En velocidad máxima espera a que el consumidor
+    vacíe el buffer en lugar de descartar muestras. Los huecos de más de
+    hueco_maximo segundos de grabación se saltean en lugar de esperarlos.
+    """
+
+    def __init__(self, ruta, velocidad=1.0, desde=0.0, hasta=None,
+                 max_pendientes=16, tam_lote=2048, hueco_maximo=HUECO_MAXIMO):
+        super().__init__(name='ReproductorGrabacion', daemon=True)
+        self.grabacion = Grabacion(ruta)
+        self.velocidad = velocidad
+        self.desde = desde
+        self.hasta = hasta
+        self.max_pendientes = max_pendientes
+        self.tam_lote = tam_lote
+        self.hueco_maximo = hueco_maximo
+        self.muestras = deque()
+        self.tramas_leidas = 0
+        self.errores_parseo = 0  # Las grabaciones sólo contienen tramas válidas
+        self.terminado = False
+        self._detener = threading.Event()
+
+    def run(self):
+        vista = self.grabacion.entre(self.desde, self.hasta)
+        n = len(vista)
+        if n == 0:
+            print(f"⚠️ La grabación {self.grabacion.ruta} no tiene datos en el rango pedido")
+            self.terminado = True
+            return
+        print(f"▶️  Reproduciendo {n} tramas de {self.grabacion.ruta} "
+              f"(velocidad: {'máxima' if self.velocidad <= 0 else f'{self.velocidad:g}x'})")
+        tiempos = vista['t']
+        t_rec0 = float(tiempos[0])
+        t_real0 = time.perf_counter()
+        i = 0
+        while i < n and not self._detener.is_set():
+            if self.velocidad <= 0:
+                # Velocidad máxima con contrapresión: no adelantarse al consumidor
+                # (max_pendientes se cuenta en bloques de hasta tam_lote tramas)
+                if len(self.muestras) >= self.max_pendientes:
+                    self._detener.wait(0.005)
+                    continue
+                fin = min(i + self.tam_lote, n)
+            else:
+                t_objetivo = t_rec0 + (time.perf_counter() - t_real0) * self.velocidad
+                fin = min(int(np.searchsorted(tiempos, t_objetivo, side='right')), i + self.tam_lote)
+                if fin <= i:
+                    adelanto = float(tiempos[i]) - t_objetivo
+                    if adelanto > self.hueco_maximo:
+                        # Hueco entre sesiones: seguir desde la próxima trama sin esperar
+                        t_rec0 += adelanto
+                        continue
+                    self._detener.wait(min(max(adelanto / self.velocidad, 0.001), 0.1))
+                    continue
+            self.muestras.append(Grabacion.como_matriz(vista[i:fin]))
+            self.tramas_leidas += fin - i
+            i = fin
+        self.terminado = True
+        print("⏹️  Fin de la reproducción")
+
+    def extraer(self):
+        """Devuelve y elimina las muestras pendientes como (t, datos), en orden."""
+        return extraer_bloques(self.muestras)
+
+    def detener(self, espera=1.0):
+        self._detener.set()
+        if self.is_alive():
+            self.join(espera)
+
+
+# --- HERRAMIENTAS DE LÍNEA DE COMANDOS ---
+
+def _cmd_info(args):
+    g = Grabacion(args.archivo)
+    print(f"Archivo: {g.ruta}")
+    for clave, valor in g.cabecera.items():
+        print(f"  {clave}: {valor}")
+    print(f"  registros: {len(g)}")
+    if len(g):
+        inicio = datetime.datetime.fromtimestamp(g.t_inicio)
+        print(f"  primera trama: {inicio.isoformat(timespec='seconds')}")
+        print(f"  duración: {datetime.timedelta(seconds=round(g.duracion))}")
+
+
+def _cmd_exportar(args):
+    g = Grabacion(args.archivo)
+    total = 0
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        f.write('t_relativo,' + ','.join(CAMPOS) + '\n')
+        for bloque in g.bloques(desde=args.desde, hasta=args.hasta):
+            t, datos = Grabacion.como_matriz(bloque)
+            tabla = np.column_stack([t - g.t_inicio, datos])
+            np.savetxt(f, tabla, delimiter=',', fmt='%.3f')
+            total += len(tabla)
+    print(f"✅ {total} registros exportados a {args.salida}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Herramientas para grabaciones .pidrec")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_info = sub.add_parser('info', help="Muestra la cabecera y la duración")
+    p_info.add_argument('archivo')
+    p_info.set_defaults(func=_cmd_info)
+    p_exp = sub.add_parser('exportar', help="Exporta un rango de tiempo a CSV")
+    p_exp.add_argument('archivo')
+    p_exp.add_argument('salida')
+    p_exp.add_argument('--desde', type=float, default=0.0, help="Segundos desde el inicio")
+    p_exp.add_argument('--hasta', type=float, default=None, help="Segundos desde el inicio")
+    p_exp.set_defaults(func=_cmd_exportar)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,573 @@
+"""
+Identificación del modelo FOPDT de la planta a partir de datos medidos.
+
+Los valores K, T y L de analisis.py son estimaciones a mano. Este módulo los
+ajusta con la temperatura y la salida PWM registradas (grabación .pidrec o
+sesión en vivo), con intervalos de confianza del 95%.
+
+MODELO DISCRETO:
+Con la entrada constante entre muestras (analogWrite se mantiene un período
+h) y L = (d + f)·h, d entero y 0 <= f < 1, la planta K/(T·s + 1)·e^(-L·s)
+discretizada exactamente es:
+
+    y[k+1] = a·y[k] + b1·u[k-d] + b2·u[k-d-1] + c
+
+    a  = e^(-h/T)
+    b1 = K·(1 - e^(-(1-f)·h/T))
+    b2 = K·(e^(-(1-f)·h/T) - a)
+    c  = (1 - a)·T_ambiente
+
+donde u es la salida en % de PWM (truncada a entero como en analogWrite).
+Es lineal en (a, b1, b2, c), así que para cada retardo entero candidato d se
+resuelve por mínimos cuadrados (ARX) y se queda el de menor residuo. De los
+coeficientes salen K = (b1 + b2)/(1 - a), T = -h/ln(a) y la fracción f.
+
+Hay cuatro formas de ajustar:
+- identificar_arx(): estimación inicial rápida por mínimos cuadrados.
+- AcumuladorARX: la misma estimación por bloques, para grabaciones que no
+  entran en memoria (acumula las ecuaciones normales de cada retardo).
+- refinar(): ajuste de error de salida (simula el modelo completo y compara
+  con la medición) con scipy.optimize.least_squares, menos sesgado por el
+  ruido de cuantización del ADC.
+- IdentificadorRLS: mínimos cuadrados recursivos con factor de olvido, un
+  filtro por retardo candidato, para seguir la planta durante la sesión.
+
+La temperatura del firmware pasa por un promedio de 3 muestras, que agrega
+cerca de un período de retardo: el L identificado lo incluye, igual que lo ve
+el lazo de control. Ese filtro arranca con ceros, así que las primeras
+lecturas después de un reinicio no son válidas y se descartan.
+
+Uso:
+    python identificacion.py sesion.pidrec --guardar modelo.json
+    python analisis.py --modelo modelo.json
+"""
+import argparse
+import json
+
+import numpy as np
+from scipy.optimize import least_squares
+from scipy.signal import lfilter
+
+from grabacion import Grabacion
+from nominales import PERIODO
+
+# Retardo máximo que se busca [s]
+MAX_RETARDO = 2.0
+# Factor de olvido por muestra del RLS (memoria efectiva de 1/(1-λ) muestras)
+FACTOR_OLVIDO = 0.998
+# Muestras del arranque del RLS que no cuentan en el error de predicción
+# (con P inicial enorme los primeros errores son del orden de la temperatura)
+ARRANQUE_RLS = 20
+# El modelo RLS no es válido antes de estas muestras...
+MUESTRAS_MINIMAS_RLS = 100
+# ...ni mientras la semiamplitud del IC 95% de K supere esta fracción de K
+INCERTIDUMBRE_MAXIMA_RLS = 0.2
+# Cuantil normal para los intervalos de confianza del 95%
+Z_95 = 1.959964
+# Escala de salida del firmware (analogWrite de 8 bits)
+SALIDA_MAX = 255.0
+# Muestras iniciales que se descartan (el filtro de 3 muestras arranca con ceros)
+DESCARTE_INICIAL = 3
+
+
+def entradas_desde_tramas(datos):
+    """
+    Extrae (y, u) de tramas del firmware (n, 8).
+
+    y: temperatura medida [°C]. u: salida aplicada en % de PWM, truncada a
+    entero como en analogWrite((int)salida).
+    """
+    return datos[:, 0].copy(), np.floor(datos[:, 7]) * (100.0 / SALIDA_MAX)
+
+
+def estimar_periodo(t):
+    """
+    Período medio entre tramas.
+
+    Las horas de llegada tienen jitter y varias tramas de un mismo bloque
+    comparten hora, así que se usa la duración total sobre el número de tramas.
+    """
+    if len(t) < 2 or t[-1] <= t[0]:
+        return PERIODO
+    return float(t[-1] - t[0]) / (len(t) - 1)
+
+
+class ModeloFOPDT:
+    """
+    Modelo K/(T·s + 1)·e^(-L·s) identificado, con T_ambiente como nivel base.
+
+    intervalos: diccionario {'K': (lo, hi), ...} con los intervalos del 95%
+    (vacío si no se pudieron calcular).
+    convergido: False si el estimador (RLS) todavía no tiene datos suficientes;
+    el modelo no es válido hasta entonces.
+    """
+
+    PARAMETROS = ('K', 'T', 'L', 'T_ambiente')
+
+    def __init__(self, K, T, L, T_ambiente, intervalos=None, rmse=np.nan, muestras=0,
+                 periodo=PERIODO, metodo='', convergido=True):
+        self.K = float(K)
+        self.T = float(T)
+        self.L = float(L)
+        self.T_ambiente = float(T_ambiente)
+        self.intervalos = intervalos or {}
+        self.rmse = float(rmse)
+        self.muestras = int(muestras)
+        self.periodo = float(periodo)
+        self.metodo = metodo
+        self.convergido = bool(convergido)
+
+    @property
+    def valido(self):
+        return bool(self.convergido and np.isfinite([self.K, self.T, self.L]).all()
+                    and self.K > 0 and self.T > 0 and self.L >= 0)
+
+    def como_dict(self):
+        return {'K': self.K, 'T': self.T, 'L': self.L, 'T_ambiente': self.T_ambiente,
+                'intervalos': {p: list(v) for p, v in self.intervalos.items()},
+                'rmse': self.rmse, 'muestras': self.muestras, 'periodo': self.periodo,
+                'metodo': self.metodo, 'convergido': self.convergido}
+
+    def guardar(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(self.como_dict(), f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, encoding='utf-8') as f:
+            d = json.load(f)
+        d['intervalos'] = {p: tuple(v) for p, v in d.get('intervalos', {}).items()}
+        return cls(**d)
+
+    def __str__(self):
+        lineas = [f"Modelo FOPDT ({self.metodo}, {self.muestras} muestras, "
+                  f"RMSE {self.rmse:.3f} °C{'' if self.convergido else ', sin converger'})"]
+        unidades = {'K': '°C/%', 'T': 's', 'L': 's', 'T_ambiente': '°C'}
+        for p in self.PARAMETROS:
+            texto = f"   {p:>10} = {getattr(self, p):8.4f} {unidades[p]}"
+            if p in self.intervalos:
+                lo, hi = self.intervalos[p]
+                texto += f"   (IC 95%: {lo:.4f} … {hi:.4f})"
+            lineas.append(texto)
+        return "\n".join(lineas)
+
+
+# ----------------------------------------------------------------------
+# Conversión entre coeficientes ARX y parámetros físicos
+# ----------------------------------------------------------------------
+
+def _fisicos_desde_arx(theta, d, periodo):
+    """(a, b1, b2, c) y retardo entero d -> [K, T, L, T_ambiente] (nan si no es FOPDT)."""
+    a, b1, b2, c = theta
+    if not 0.0 < a < 1.0:
+        return np.full(4, np.nan)
+    b = b1 + b2
+    K = b / (1.0 - a)
+    T = -periodo / np.log(a)
+    # b2/b = (e^(-(1-f)h/T) - a)/(1 - a): fracción del retardo dentro de la muestra
+    r = np.clip(b2 / b, 0.0, 1.0) if b != 0 else 0.0
+    f = 1.0 + T / periodo * np.log(a + r * (1.0 - a))
+    L = (d + np.clip(f, 0.0, 1.0)) * periodo
+    return np.array([K, T, L, c / (1.0 - a)])
+
+
+def _intervalos_delta(theta, cov, d, periodo):
+    """Intervalos del 95% de K, T, L, T_ambiente propagando cov(theta) (método delta)."""
+    base = _fisicos_desde_arx(theta, d, periodo)
+    if not np.isfinite(base).all() or not np.isfinite(cov).all():
+        return {}
+    J = np.empty((4, 4))
+    for j in range(4):
+        paso = 1e-6 * max(abs(theta[j]), 1e-3)
+        desplazado = theta.copy()
+        desplazado[j] += paso
+        J[:, j] = (_fisicos_desde_arx(desplazado, d, periodo) - base) / paso
+    sigma = np.sqrt(np.maximum(np.diag(J @ cov @ J.T), 0.0))
+    if not np.isfinite(sigma).all():
+        return {}
+    return {p: (v - Z_95 * s, v + Z_95 * s)
+            for p, v, s in zip(ModeloFOPDT.PARAMETROS, base, sigma)}
+
+
+def _retrasar(u, d):
+    """u desplazada d muestras (u[k-d]); antes del registro se repite el primer valor."""
+    if d == 0:
+        return u
+    return np.concatenate((np.full(d, u[0]), u[:-d]))
+
+
+def _regresores(y, u, d):
+    """Matriz de regresores [y[k], u[k-d], u[k-d-1], 1] y objetivo y[k+1]."""
+    n = len(y) - 1
+    phi = np.empty((n, 4))
+    phi[:, 0] = y[:-1]
+    phi[:, 1] = _retrasar(u, d)[:-1]
+    phi[:, 2] = _retrasar(u, d + 1)[:-1]
+    phi[:, 3] = 1.0
+    return phi, y[1:]
+
+
+# ----------------------------------------------------------------------
+# Identificación por lotes
+# ----------------------------------------------------------------------
+
+def identificar_arx(y, u, periodo=PERIODO, max_retardo=MAX_RETARDO):
+    """
+    Estimación por mínimos cuadrados con búsqueda del retardo entero.
+
+    Para cada d en 0..max_retardo/periodo resuelve el ARX de 2 coeficientes
+    de entrada y se queda con el de menor residuo. Los intervalos se obtienen
+    de la covarianza de mínimos cuadrados por el método delta.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    u = np.asarray(u, dtype=np.float64)
+    max_d = min(int(round(max_retardo / periodo)), len(y) - 6)
+    if max_d < 0:
+        raise ValueError("Muy pocas muestras para identificar el modelo")
+    mejor = None
+    for d in range(max_d + 1):
+        phi, objetivo = _regresores(y, u, d)
+        theta, _, rango, _ = np.linalg.lstsq(phi, objetivo, rcond=None)
+        residuo = objetivo - phi @ theta
+        sse = float(residuo @ residuo)
+        if rango == 4 and 0.0 < theta[0] < 1.0 and (mejor is None or sse < mejor[0]):
+            mejor = (sse, d, theta, phi)
+    if mejor is None:
+        raise ValueError("Los datos no tienen excitación suficiente para identificar "
+                         "un modelo de primer orden (¿PWM constante?)")
+    sse, d, theta, phi = mejor
+    gl = max(len(phi) - 4, 1)
+    cov = sse / gl * np.linalg.inv(phi.T @ phi)
+    K, T, L, T_amb = _fisicos_desde_arx(theta, d, periodo)
+    return ModeloFOPDT(K, T, L, T_amb, _intervalos_delta(theta, cov, d, periodo),
+                       rmse=np.sqrt(sse / len(phi)), muestras=len(y), periodo=periodo,
+                       metodo='ARX')
+
+
+def simular_fopdt(K, T, L, T_ambiente, u, y0, periodo=PERIODO):
+    """
+    Respuesta del modelo discreto exacto a la entrada u (% PWM) desde y[0] = y0.
+
+    Admite L no múltiplo del período (reparte la entrada entre dos muestras).
+    """
+    a = np.exp(-periodo / T)
+    d = int(np.floor(L / periodo))
+    f = L / periodo - d
+    e1 = np.exp(-(1.0 - f) * periodo / T)
+    v = K * ((1.0 - e1) * _retrasar(u, d) + (e1 - a) * _retrasar(u, d + 1)) \
+        + (1.0 - a) * T_ambiente
+    # y[k+1] = a·y[k] + v[k]  ->  filtro IIR de primer orden
+    y = np.empty(len(u))
+    y[0] = y0
+    y[1:] = lfilter([1.0], [1.0, -a], v[:-1]) + y0 * a ** np.arange(1, len(u))
+    return y
+
+
+def refinar(y, u, inicial, periodo=PERIODO, max_retardo=MAX_RETARDO):
+    """
+    Ajuste de error de salida partiendo de un modelo inicial (p.ej. el ARX).
+
+    Minimiza sum((y - simular_fopdt(...))²) sobre K, T, L y T_ambiente con
+    least_squares. Los intervalos salen de la jacobiana en el óptimo:
+    cov = s²·(JᵀJ)⁻¹.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    u = np.asarray(u, dtype=np.float64)
+
+    def residuos(p):
+        return simular_fopdt(p[0], p[1], p[2], p[3], u, y[0], periodo) - y
+
+    x0 = np.array([inicial.K, inicial.T, min(max(inicial.L, 0.0), max_retardo),
+                   inicial.T_ambiente])
+    inferior = [-np.inf, periodo / 20, 0.0, -np.inf]
+    superior = [np.inf, np.inf, max_retardo, np.inf]
+    x0 = np.clip(x0, np.add(inferior, 1e-9), np.subtract(superior, 1e-9))
+    # El residuo es lineal a tramos en L: paso de diferencias finitas de ~1% del período
+    escala = np.array([max(abs(x0[0]), 1e-3), max(x0[1], periodo), periodo,
+                       max(abs(x0[3]), 1.0)])
+    r = least_squares(residuos, x0, bounds=(inferior, superior), x_scale=escala,
+                      diff_step=1e-2 * periodo / escala)
+    n = len(y)
+    sse = float(r.fun @ r.fun)
+    intervalos = {}
+    try:
+        cov = sse / max(n - 4, 1) * np.linalg.inv(r.jac.T @ r.jac)
+        sigma = np.sqrt(np.maximum(np.diag(cov), 0.0))
+        intervalos = {p: (v - Z_95 * s, v + Z_95 * s)
+                      for p, v, s in zip(ModeloFOPDT.PARAMETROS, r.x, sigma)}
+    except np.linalg.LinAlgError:
+        pass
+    return ModeloFOPDT(*r.x, intervalos=intervalos, rmse=np.sqrt(sse / n), muestras=n,
+                       periodo=periodo, metodo='error de salida')
+
+
+def identificar(t, y, u, periodo=None, max_retardo=MAX_RETARDO, refinado=True,
+                descarte=DESCARTE_INICIAL):
+    """Identifica el modelo: estimación ARX y, si refinado=True, ajuste de error de salida."""
+    if periodo is None:
+        periodo = estimar_periodo(t)
+    y = np.asarray(y, dtype=np.float64)[descarte:]
+    u = np.asarray(u, dtype=np.float64)[descarte:]
+    modelo = identificar_arx(y, u, periodo, max_retardo)
+    if refinado and modelo.valido:
+        modelo = refinar(y, u, modelo, periodo, max_retardo)
+    return modelo
+
+
+def identificar_grabacion(ruta, desde=0.0, hasta=None, periodo=None,
+                          max_retardo=MAX_RETARDO, refinado=True):
+    """Identifica el modelo con un tramo de una grabación .pidrec."""
+    g = Grabacion(ruta)
+    t, datos = Grabacion.como_matriz(g.entre(desde, hasta))
+    y, u = entradas_desde_tramas(datos)
+    return identificar(t, y, u, periodo, max_retardo, refinado,
+                       descarte=DESCARTE_INICIAL if desde <= 0 else 0)
+
+
+# ----------------------------------------------------------------------
+# Identificación por bloques (grabaciones que no entran en memoria)
+# ----------------------------------------------------------------------
+
+class AcumuladorARX:
+    """
+    identificar_arx() sobre una serie que llega por bloques.
+
+    Para cada retardo candidato acumula ΦᵀΦ (4x4), Φᵀy e yᵀy; el resultado es
+    el mismo que con la serie completa, pero la memoria no depende de su
+    largo. cortar() marca un hueco en los datos: la muestra siguiente no se
+    usa como continuación de la anterior.
+    """
+
+    def __init__(self, periodo=PERIODO, max_retardo=MAX_RETARDO, descarte=DESCARTE_INICIAL):
+        self.periodo = periodo
+        self.max_d = int(round(max_retardo / periodo))
+        n = self.max_d + 1
+        self.A = np.zeros((n, 4, 4))
+        self.b = np.zeros((n, 4))
+        self.yy = 0.0
+        self.ecuaciones = 0
+        self.muestras = 0
+        self._descarte = descarte
+        self._descartar = descarte
+        self._y_prev = None
+        self._u = None  # Últimas max_d + 2 salidas (u[k-d] y u[k-d-1] del primer regresor)
+
+    def cortar(self):
+        self._y_prev = None
+        self._u = None
+        self._descartar = self._descarte
+
+    def agregar_bloque(self, y, u):
+        """Agrega temperaturas [°C] y salidas [% PWM] consecutivas."""
+        y = np.asarray(y, dtype=np.float64)
+        u = np.asarray(u, dtype=np.float64)
+        if self._descartar:
+            quitar = min(self._descartar, len(y))
+            y, u = y[quitar:], u[quitar:]
+            self._descartar -= quitar
+        if len(y) == 0:
+            return
+        self.muestras += len(y)
+        historia = self.max_d + 2
+        if self._y_prev is None:
+            # Como _retrasar(): antes del registro se repite la primera salida
+            y_ext, u_ext, inicio = y, np.concatenate((np.full(historia, u[0]), u)), historia
+        else:
+            y_ext = np.concatenate(([self._y_prev], y))
+            u_ext, inicio = np.concatenate((self._u, u)), historia - 1
+        m = len(y_ext) - 1
+        self._y_prev = y_ext[-1]
+        self._u = u_ext[-historia:]
+        if m <= 0:
+            return
+        objetivo = y_ext[1:]
+        phi = np.empty((m, 4))
+        phi[:, 0] = y_ext[:-1]
+        phi[:, 3] = 1.0
+        for d in range(self.max_d + 1):
+            phi[:, 1] = u_ext[inicio - d:inicio - d + m]
+            phi[:, 2] = u_ext[inicio - d - 1:inicio - d - 1 + m]
+            self.A[d] += phi.T @ phi
+            self.b[d] += phi.T @ objetivo
+        self.yy += float(objetivo @ objetivo)
+        self.ecuaciones += m
+
+    def modelo(self, periodo=None):
+        """
+        ModeloFOPDT del retardo con menor residuo (como identificar_arx).
+
+        periodo: el período real de la grabación, si se conoce recién al final
+        (sólo afecta la conversión a K, T, L; no el ajuste).
+        """
+        periodo = periodo or self.periodo
+        mejor = None
+        for d in range(self.max_d + 1):
+            if np.linalg.matrix_rank(self.A[d]) < 4:
+                continue
+            theta = np.linalg.solve(self.A[d], self.b[d])
+            sse = max(self.yy - 2 * theta @ self.b[d] + theta @ self.A[d] @ theta, 0.0)
+            if 0.0 < theta[0] < 1.0 and (mejor is None or sse < mejor[0]):
+                mejor = (sse, d, theta)
+        if mejor is None:
+            raise ValueError("Los datos no tienen excitación suficiente para identificar "
+                             "un modelo de primer orden (¿PWM constante?)")
+        sse, d, theta = mejor
+        gl = max(self.ecuaciones - 4, 1)
+        cov = sse / gl * np.linalg.inv(self.A[d])
+        K, T, L, T_amb = _fisicos_desde_arx(theta, d, periodo)
+        return ModeloFOPDT(K, T, L, T_amb, _intervalos_delta(theta, cov, d, periodo),
+                           rmse=np.sqrt(sse / self.ecuaciones), muestras=self.muestras,
+                           periodo=periodo, metodo='ARX por bloques')
+
+
+# ----------------------------------------------------------------------
+# Identificación recursiva (en vivo)
+# ----------------------------------------------------------------------
+
+class IdentificadorRLS:
+    """
+    Mínimos cuadrados recursivos con factor de olvido, uno por retardo candidato.
+
+    Cada muestra actualiza en bloque (con NumPy) los D+1 filtros RLS del ARX
+    con d = 0..D; el modelo vigente es el del filtro con menor error de
+    predicción reciente (promedio exponencial con el mismo factor de olvido).
+    El coste por muestra es O(D), independiente de la duración de la sesión.
+
+    Los errores de las primeras `arranque` muestras no entran en ese promedio:
+    con la covarianza inicial grande son transitorios del arranque y
+    sesgarían la elección del retardo y el RMSE durante miles de muestras.
+    modelo() queda como no convergido (valido False) hasta tener
+    MUESTRAS_MINIMAS_RLS muestras y un IC de K más angosto que
+    INCERTIDUMBRE_MAXIMA_RLS.
+    """
+
+    def __init__(self, periodo=PERIODO, max_retardo=MAX_RETARDO, olvido=FACTOR_OLVIDO,
+                 covarianza_inicial=1e4, descarte=DESCARTE_INICIAL, arranque=ARRANQUE_RLS):
+        self.periodo = periodo
+        self.olvido = olvido
+        self.arranque = arranque
+        self.max_d = int(round(max_retardo / periodo))
+        n = self.max_d + 1
+        self.theta = np.tile([0.9, 0.0, 0.0, 0.0], (n, 1))
+        self.P = np.tile(np.eye(4) * covarianza_inicial, (n, 1, 1))
+        self.error_cuadratico = np.zeros(n)   # Error de predicción promedio por retardo
+        self.peso = 0.0
+        self.muestras = 0
+        self._descartar = descarte
+        # Historia de la entrada necesaria para u[k-d-1] y última temperatura
+        self._u = np.zeros(self.max_d + 3)
+        self._y_prev = None
+
+    def agregar(self, y, u):
+        """Agrega una muestra (temperatura [°C], salida [% PWM])."""
+        if self._descartar > 0:
+            self._descartar -= 1
+            return
+        self._u = np.roll(self._u, 1)
+        self._u[0] = u
+        if self._y_prev is None:
+            self._u[:] = u
+            self._y_prev = y
+            return
+        # Regresores de cada filtro: [y[k-1], u[k-1-d], u[k-2-d], 1]
+        phi = np.empty((self.max_d + 1, 4))
+        phi[:, 0] = self._y_prev
+        phi[:, 1] = self._u[1:self.max_d + 2]
+        phi[:, 2] = self._u[2:]
+        phi[:, 3] = 1.0
+        error = y - np.einsum('ij,ij->i', phi, self.theta)
+        P_phi = np.einsum('ijk,ik->ij', self.P, phi)
+        ganancia = P_phi / (self.olvido + np.einsum('ij,ij->i', phi, P_phi))[:, None]
+        self.theta += ganancia * error[:, None]
+        self.P = (self.P - ganancia[:, :, None] * P_phi[:, None, :]) / self.olvido
+        if self.muestras >= self.arranque:
+            self.error_cuadratico = self.olvido * self.error_cuadratico + error ** 2
+            self.peso = self.olvido * self.peso + 1.0
+        self._y_prev = y
+        self.muestras += 1
+
+    def agregar_bloque(self, y, u):
+        for yk, uk in zip(y, u):
+            self.agregar(yk, uk)
+
+    def agregar_tramas(self, datos):
+        """Agrega tramas del firmware (n, 8) tal como llegan del lector."""
+        self.agregar_bloque(*entradas_desde_tramas(datos))
+
+    @property
+    def retardo(self):
+        """Retardo entero (en muestras) del filtro que mejor predice con 0 < a < 1."""
+        a = self.theta[:, 0]
+        return int(np.argmin(np.where((a > 0) & (a < 1), self.error_cuadratico, np.inf)))
+
+    def modelo(self):
+        """ModeloFOPDT vigente (con intervalos por método delta sobre P)."""
+        d = self.retardo
+        theta = self.theta[d]
+        K, T, L, T_amb = _fisicos_desde_arx(theta, d, self.periodo)
+        varianza = self.error_cuadratico[d] / self.peso if self.peso else np.nan
+        # P aproxima (Σ λ^i·φφᵀ)⁻¹ sobre la ventana con olvido
+        cov = varianza * self.P[d]
+        intervalos = _intervalos_delta(theta.copy(), cov, d, self.periodo)
+        lo, hi = intervalos.get('K', (-np.inf, np.inf))
+        convergido = (self.muestras >= MUESTRAS_MINIMAS_RLS
+                      and (hi - lo) / 2 <= INCERTIDUMBRE_MAXIMA_RLS * abs(K))
+        return ModeloFOPDT(K, T, L, T_amb, intervalos, rmse=np.sqrt(varianza),
+                           muestras=self.muestras, periodo=self.periodo, metodo='RLS',
+                           convergido=convergido)
+
+
+# ----------------------------------------------------------------------
+# Línea de comandos
+# ----------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Identificación FOPDT desde una grabación .pidrec")
+    parser.add_argument('archivo')
+    parser.add_argument('--desde', type=float, default=0.0, help="Segundos desde el inicio")
+    parser.add_argument('--hasta', type=float, default=None, help="Segundos desde el inicio")
+    parser.add_argument('--periodo', type=float, default=None,
+                        help="Período de muestreo [s] (por defecto se estima de la grabación)")
+    parser.add_argument('--max-retardo', type=float, default=MAX_RETARDO)
+    parser.add_argument('--sin-refinar', action='store_true',
+                        help="Sólo la estimación ARX por mínimos cuadrados")
+    parser.add_argument('--guardar', metavar='JSON', help="Guarda el modelo para analisis.py --modelo")
+    parser.add_argument('--grafica', default=None, help="Archivo de imagen medición vs. modelo")
+    args = parser.parse_args(argv)
+
+    g = Grabacion(args.archivo)
+    t, datos = Grabacion.como_matriz(g.entre(args.desde, args.hasta))
+    y, u = entradas_desde_tramas(datos)
+    periodo = args.periodo or estimar_periodo(t)
+    descarte = DESCARTE_INICIAL if args.desde <= 0 else 0
+    print(f"📊 Identificando con {len(y) - descarte} tramas (período {periodo * 1000:.1f} ms)...")
+    modelo = identificar(t, y, u, periodo, args.max_retardo, refinado=not args.sin_refinar,
+                         descarte=descarte)
+    print(modelo)
+    y, u = y[descarte:], u[descarte:]
+    if args.guardar:
+        modelo.guardar(args.guardar)
+        print(f"✅ Modelo guardado en {args.guardar}")
+    if args.grafica:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        tiempo = np.arange(len(y)) * periodo
+        y_modelo = simular_fopdt(modelo.K, modelo.T, modelo.L, modelo.T_ambiente, u, y[0], periodo)
+        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 7), sharex=True)
+        ax1.plot(tiempo, y, 'r-', label='Medida')
+        ax1.plot(tiempo, y_modelo, 'k--', label='Modelo')
+        ax1.set_ylabel('Temperatura [°C]')
+        ax1.legend()
+        ax1.grid(True)
+        ax2.plot(tiempo, u, 'g-')
+        ax2.set_ylabel('Salida PWM [%]')
+        ax2.set_xlabel('Tiempo [s]')
+        ax2.grid(True)
+        fig.suptitle(f"K = {modelo.K:.3f} °C/%   T = {modelo.T:.2f} s   L = {modelo.L:.3f} s")
+        fig.savefig(args.grafica, dpi=120)
+        print(f"✅ Gráfica guardada en {args.grafica}")
+
+
+if __name__ == '__main__':
+    main()
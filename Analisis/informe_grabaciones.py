@@ -0,0 +1,447 @@
+"""
+Informe por lotes sobre un archivo de grabaciones .pidrec.
+
+analisis.py sólo muestra los últimos MAX_PUNTOS de una sesión; para comparar
+equipos y semanas de operación hay que recorrer todas las grabaciones. Este
+script:
+
+- busca los .pidrec de un directorio (recursivamente) y reparte los archivos
+  entre procesos (ProcessPoolExecutor, un archivo por tarea, con un número
+  acotado de tareas pendientes);
+- lee cada archivo en bloques secuenciales (grabacion.leer_bloques), así que
+  la memoria de cada proceso no depende del tamaño de la grabación;
+- por grabación calcula la calidad del control (error medio y RMS, IAE por
+  hora, tiempo dentro de la banda, saturación), el seguimiento del setpoint
+  (las métricas de cada escalón con MetricasEnLinea) y la planta identificada
+  (AcumuladorARX, el mismo ARX de identificacion.py por bloques);
+- los huecos de más de HUECO_MAXIMO segundos (sesiones agregadas al mismo
+  archivo, cortes del puerto) no se integran y cortan la identificación.
+
+El proceso principal escribe cada resultado en los CSV apenas llega. En
+memoria quedan una fila por grabación y, para los gráficos, una muestra de
+tamaño fijo de los escalones de cada equipo.
+
+Salida (en --salida):
+    informe.md      tablas por equipo, peores grabaciones y errores
+    corridas.csv    una fila por grabación
+    escalones.csv   una fila por escalón de setpoint
+    informe.png     K/T/L identificados, error RMS en el tiempo, sobreimpulso y establecimiento
+
+Uso:
+    python informe_grabaciones.py grabaciones/ --salida informe/ --procesos 4
+"""
+import argparse
+import csv
+import datetime
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+import numpy as np
+
+from buffer_circular import filas_desde_tramas
+from grabacion import Grabacion, leer_bloques, HUECO_MAXIMO
+from identificacion import AcumuladorARX, entradas_desde_tramas, PERIODO
+from metricas_online import MetricasEnLinea
+
+# Registros por bloque de lectura (65536 registros de 72 bytes = 4.5 MB)
+TAM_BLOQUE = 65536
+# Banda de tolerancia del informe: tiempo con |error| <= BANDA_INFORME [°C]
+BANDA_INFORME = 0.5
+# Escalones por equipo que se guardan para los gráficos (muestreo de reservorio)
+MUESTRA_ESCALONES = 5000
+# Grabaciones en la tabla de peor seguimiento
+PEORES = 10
+# Tareas pendientes por proceso (acota la memoria del proceso principal)
+TAREAS_POR_PROCESO = 2
+
+COLUMNAS_CORRIDA = (
+    'archivo', 'equipo', 'inicio', 'duracion_h', 'tramas', 'huecos', 'periodo_ms',
+    'temperatura_min', 'temperatura_max', 'error_medio', 'error_rms', 'iae_por_h', 'en_banda',
+    'saturacion', 'escalones', 'escalones_establecidos', 'sobreimpulso_mediana',
+    'sobreimpulso_max', 't_subida_mediana', 't_establecimiento_mediana', 't_establecimiento_p95',
+    'error_estacionario_mediana', 'K', 'K_lo', 'K_hi', 'T', 'T_lo', 'T_hi', 'L', 'L_lo', 'L_hi',
+    'T_ambiente', 'rmse_modelo', 'error')
+COLUMNAS_ESCALON = (
+    'archivo', 'equipo', 't0', 'y0', 'setpoint', 'salto', 'duracion', 'establecido',
+    'sobreimpulso', 't_subida', 't_establecimiento', 'error_estacionario', 'iae', 'ise', 'itae',
+    'saturacion')
+
+
+def _mediana(valores, q=50):
+    """Percentil q de los valores finitos (nan si no hay ninguno)."""
+    valores = np.asarray(valores, dtype=np.float64)
+    valores = valores[np.isfinite(valores)]
+    return float(np.percentile(valores, q)) if len(valores) else np.nan
+
+
+def nombre_equipo(ruta, cabecera):
+    """Zona (monitor_multi.py), puerto o, si no hay, el directorio de la grabación."""
+    return str(cabecera.get('zona') or cabecera.get('puerto')
+               or os.path.basename(os.path.dirname(os.path.abspath(ruta))))
+
+
+def analizar_grabacion(ruta, tam_bloque=TAM_BLOQUE, banda=BANDA_INFORME):
+    """
+    Recorre una grabación por bloques y devuelve (corrida, escalones).
+
+    corrida: dict con COLUMNAS_CORRIDA. escalones: lista de dicts con
+    COLUMNAS_ESCALON. Se ejecuta en los procesos del pool, así que sólo
+    devuelve tipos simples.
+    """
+    g = Grabacion(ruta)
+    equipo = nombre_equipo(ruta, g.cabecera)
+    corrida = dict.fromkeys(COLUMNAS_CORRIDA, np.nan)
+    corrida.update(archivo=ruta, equipo=equipo, tramas=len(g), huecos=0, escalones=0, error='')
+    if len(g) < 2:
+        corrida['error'] = 'sin tramas'
+        return corrida, []
+    t_inicio = g.t_inicio
+    del g  # Sólo hacía falta la cabecera y el primer registro
+    corrida['inicio'] = datetime.datetime.fromtimestamp(t_inicio).isoformat(timespec='seconds')
+
+    metricas = MetricasEnLinea(guardar_escalones=True)
+    arx = AcumuladorARX()
+    t_prev = None
+    tiempo = suma_error = suma_error2 = suma_abs = en_banda = 0.0
+    n_dt = 0
+    t_min, t_max = np.inf, -np.inf
+    for bloque in leer_bloques(ruta, tam_bloque):
+        t, datos = Grabacion.como_matriz(bloque)
+        dt = np.diff(t, prepend=t[0] if t_prev is None else t_prev)
+        t_prev = t[-1]
+        huecos = np.flatnonzero(dt > HUECO_MAXIMO)
+        corrida['huecos'] += len(huecos)
+        dt[huecos] = 0.0
+        # Tramos sin huecos: las integrales y el ARX no cruzan un corte
+        cortes = np.concatenate(([0], huecos, [len(t)]))
+        for k, (inicio, fin) in enumerate(zip(cortes[:-1], cortes[1:])):
+            if k > 0:
+                metricas.cortar()
+                arx.cortar()
+            if fin > inicio:
+                metricas.agregar_bloque(filas_desde_tramas(t[inicio:fin] - t_inicio,
+                                                           datos[inicio:fin]))
+                arx.agregar_bloque(*entradas_desde_tramas(datos[inicio:fin]))
+
+        error = datos[:, 1] - datos[:, 0]
+        tiempo += float(dt.sum())
+        n_dt += int(np.count_nonzero(dt))
+        suma_error += float(error @ dt)
+        suma_error2 += float((error * error) @ dt)
+        suma_abs += float(np.abs(error) @ dt)
+        en_banda += float(dt[np.abs(error) <= banda].sum())
+        t_min = min(t_min, float(datos[:, 0].min()))
+        t_max = max(t_max, float(datos[:, 0].max()))
+
+    periodo = tiempo / n_dt if n_dt else PERIODO
+    corrida.update(duracion_h=tiempo / 3600, periodo_ms=periodo * 1000,
+                   temperatura_min=t_min, temperatura_max=t_max)
+    if tiempo > 0:
+        corrida.update(error_medio=suma_error / tiempo, error_rms=np.sqrt(suma_error2 / tiempo),
+                       iae_por_h=suma_abs / (tiempo / 3600), en_banda=en_banda / tiempo,
+                       saturacion=metricas.saturacion_sesion)
+
+    escalones = list(metricas.historial)
+    if metricas.escalones:
+        escalones.append(metricas.escalon())
+    columnas = {c: np.array([e[c] for e in escalones], dtype=np.float64)
+                for c in ('sobreimpulso', 't_subida', 't_establecimiento', 'error_estacionario')}
+    corrida.update(
+        escalones=len(escalones),
+        escalones_establecidos=sum(e['establecido'] for e in escalones),
+        sobreimpulso_mediana=_mediana(columnas['sobreimpulso']),
+        sobreimpulso_max=_mediana(columnas['sobreimpulso'], 100),
+        t_subida_mediana=_mediana(columnas['t_subida']),
+        t_establecimiento_mediana=_mediana(columnas['t_establecimiento']),
+        t_establecimiento_p95=_mediana(columnas['t_establecimiento'], 95),
+        error_estacionario_mediana=_mediana(np.abs(columnas['error_estacionario'])))
+
+    try:
+        modelo = arx.modelo(periodo)
+    except ValueError:
+        modelo = None
+    if modelo is not None and modelo.valido:
+        corrida.update(K=modelo.K, T=modelo.T, L=modelo.L, T_ambiente=modelo.T_ambiente,
+                       rmse_modelo=modelo.rmse)
+        for p in ('K', 'T', 'L'):
+            if p in modelo.intervalos:
+                corrida[f'{p}_lo'], corrida[f'{p}_hi'] = modelo.intervalos[p]
+
+    for escalon in escalones:
+        escalon.update(archivo=ruta, equipo=equipo)
+    return corrida, escalones
+
+
+def _analizar(args):
+    """
+    Función de trabajo para el pool de procesos: nunca lanza, informa el error.
+
+    Un archivo que no se puede leer (OSError, ValueError) o cualquier otra
+    falla del análisis queda en la columna 'error' de su fila; el resto del
+    lote sigue.
+    """
+    ruta, tam_bloque, banda = args
+    t0 = time.perf_counter()
+    try:
+        corrida, escalones = analizar_grabacion(ruta, tam_bloque, banda)
+    except Exception as e:
+        corrida = dict.fromkeys(COLUMNAS_CORRIDA, np.nan)
+        if isinstance(e, (OSError, ValueError)):
+            error = str(e)
+        else:
+            # Falla inesperada: se guarda dónde ocurrió para poder reproducirla
+            marco = traceback.extract_tb(e.__traceback__)[-1]
+            error = f"{type(e).__name__}: {e} ({os.path.basename(marco.filename)}:{marco.lineno})"
+        corrida.update(archivo=ruta, equipo='', error=error)
+        escalones = []
+    return corrida, escalones, time.perf_counter() - t0
+
+
+def recorrer(rutas, procesos=1, tam_bloque=TAM_BLOQUE, banda=BANDA_INFORME):
+    """
+    Itera (corrida, escalones, segundos) de cada grabación, en el orden en que terminan.
+
+    Con procesos > 1 mantiene como mucho TAREAS_POR_PROCESO·procesos archivos
+    pendientes, así que la memoria no crece con el número de archivos.
+    """
+    tareas = ((ruta, tam_bloque, banda) for ruta in rutas)
+    if procesos <= 1:
+        for tarea in tareas:
+            yield _analizar(tarea)
+        return
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        pendientes = set()
+        for tarea in tareas:
+            pendientes.add(pool.submit(_analizar, tarea))
+            if len(pendientes) >= TAREAS_POR_PROCESO * procesos:
+                listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    yield futuro.result()
+        for futuro in as_completed(pendientes):
+            yield futuro.result()
+
+
+class Reservorio:
+    """Muestra uniforme de tamaño fijo de una secuencia de largo desconocido."""
+
+    def __init__(self, capacidad=MUESTRA_ESCALONES, semilla=0):
+        self.capacidad = capacidad
+        self.valores = []
+        self.vistos = 0
+        self._rng = np.random.default_rng(semilla)
+
+    def agregar(self, valor):
+        self.vistos += 1
+        if len(self.valores) < self.capacidad:
+            self.valores.append(valor)
+        else:
+            i = int(self._rng.integers(0, self.vistos))
+            if i < self.capacidad:
+                self.valores[i] = valor
+
+
+# ----------------------------------------------------------------------
+# Informe
+# ----------------------------------------------------------------------
+
+def _fmt(valor, formato='.2f'):
+    if isinstance(valor, str):
+        return valor
+    return '—' if valor is None or not np.isfinite(valor) else format(valor, formato)
+
+
+def _tabla(encabezados, filas):
+    """Tabla Markdown."""
+    lineas = ['| ' + ' | '.join(encabezados) + ' |',
+              '|' + '|'.join('---' for _ in encabezados) + '|']
+    lineas += ['| ' + ' | '.join(fila) + ' |' for fila in filas]
+    return '\n'.join(lineas)
+
+
+def resumen_por_equipo(corridas):
+    """{equipo: dict} con totales y medianas sobre las grabaciones de cada equipo."""
+    equipos = {}
+    for c in corridas:
+        if not c['error']:
+            equipos.setdefault(c['equipo'], []).append(c)
+    resumen = {}
+    for equipo, filas in sorted(equipos.items()):
+        def col(nombre):
+            return [f[nombre] for f in filas]
+        resumen[equipo] = {
+            'corridas': len(filas), 'horas': float(np.nansum(col('duracion_h'))),
+            'escalones': int(np.nansum(col('escalones'))),
+            **{nombre: _mediana(col(nombre)) for nombre in
+               ('error_rms', 'iae_por_h', 'en_banda', 'saturacion', 'sobreimpulso_mediana',
+                't_establecimiento_mediana', 'K', 'T', 'L')}}
+    return resumen
+
+
+def escribir_markdown(ruta, directorio, corridas, por_equipo, banda, imagen=None):
+    validas = [c for c in corridas if not c['error']]
+    errores = [c for c in corridas if c['error']]
+    horas = sum(c['duracion_h'] for c in validas if np.isfinite(c['duracion_h']))
+    tramas = sum(c['tramas'] for c in validas)
+    escalones = sum(c['escalones'] for c in validas)
+    partes = [
+        "# Informe de Grabaciones",
+        "",
+        f"Generado el {datetime.datetime.now().isoformat(timespec='seconds')} sobre `{directorio}`: "
+        f"{len(corridas)} grabaciones ({len(errores)} con errores), {horas:.1f} h, "
+        f"{tramas} tramas y {escalones} escalones de setpoint.",
+        "",
+        f"Las medianas son sobre las grabaciones de cada equipo. *En banda*: fracción del tiempo "
+        f"con |error| ≤ {banda:g} °C. K, T y L salen del ARX por bloques de cada grabación.",
+    ]
+    if imagen:
+        partes += ["", f"![Resumen]({imagen})"]
+
+    partes += ["", "## Por Equipo", "", _tabla(
+        ('Equipo', 'Corridas', 'Horas', 'Escalones', 'Error RMS [°C]', 'IAE/h', 'En banda',
+         'Saturación', 'Sobreimpulso [%]', 't establec. [s]', 'K [°C/%]', 'T [s]', 'L [s]'),
+        [(equipo, str(r['corridas']), _fmt(r['horas'], '.1f'), str(r['escalones']),
+          _fmt(r['error_rms'], '.3f'), _fmt(r['iae_por_h'], '.0f'), _fmt(r['en_banda'] * 100, '.1f') + '%',
+          _fmt(r['saturacion'] * 100, '.1f') + '%', _fmt(r['sobreimpulso_mediana'], '.1f'),
+          _fmt(r['t_establecimiento_mediana'], '.1f'), _fmt(r['K'], '.4f'), _fmt(r['T'], '.3f'),
+          _fmt(r['L'], '.3f'))
+         for equipo, r in por_equipo.items()])]
+
+    peores = sorted((c for c in validas if np.isfinite(c['error_rms'])),
+                    key=lambda c: c['error_rms'], reverse=True)[:PEORES]
+    partes += ["", f"## Grabaciones con Peor Seguimiento (error RMS, {len(peores)} de {len(validas)})",
+               "", _tabla(
+                   ('Archivo', 'Equipo', 'Inicio', 'Horas', 'Error RMS [°C]', 'En banda',
+                    'Saturación', 'Sobreimpulso máx. [%]', 'Huecos'),
+                   [(os.path.relpath(c['archivo'], directorio), c['equipo'], c['inicio'],
+                     _fmt(c['duracion_h'], '.2f'), _fmt(c['error_rms'], '.3f'),
+                     _fmt(c['en_banda'] * 100, '.1f') + '%', _fmt(c['saturacion'] * 100, '.1f') + '%',
+                     _fmt(c['sobreimpulso_max'], '.1f'), str(c['huecos']))
+                    for c in peores])]
+    partes += ["", "El detalle de todas las grabaciones está en `corridas.csv` y el de cada "
+               "escalón en `escalones.csv`."]
+    if errores:
+        partes += ["", "## Errores", ""]
+        partes += [f"- `{os.path.relpath(c['archivo'], directorio)}`: {c['error']}" for c in errores]
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(partes) + '\n')
+
+
+def graficar(corridas, muestras, ruta):
+    """K/T/L por equipo, error RMS de cada grabación en el tiempo y distribución de los escalones."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    validas = [c for c in corridas if not c['error']]
+    equipos = sorted({c['equipo'] for c in validas})
+    fig, ejes = plt.subplots(2, 3, figsize=(16, 9))
+    fig.suptitle(f"Informe de grabaciones ({len(validas)} grabaciones, {len(equipos)} equipos)",
+                 fontsize=14, fontweight='bold')
+
+    for ax, p, unidad in zip(ejes[0], ('K', 'T', 'L'), ('°C/%', 's', 's')):
+        valores = [[c[p] for c in validas if c['equipo'] == e and np.isfinite(c[p])]
+                   for e in equipos]
+        if any(valores):
+            ax.hist([v for v in valores], bins=30, stacked=True, label=equipos, alpha=0.8)
+        ax.set_title(f"{p} identificado [{unidad}]")
+        ax.set_ylabel('Grabaciones')
+        ax.grid(True, alpha=0.3)
+    if equipos:
+        ejes[0, 0].legend(fontsize=8)
+
+    ax = ejes[1, 0]
+    for equipo in equipos:
+        filas = [c for c in validas if c['equipo'] == equipo and np.isfinite(c['error_rms'])]
+        fechas = [datetime.datetime.fromisoformat(c['inicio']) for c in filas]
+        ax.plot(fechas, [c['error_rms'] for c in filas], 'o', markersize=4, label=equipo)
+    ax.set_title('Error RMS por grabación [°C]')
+    ax.tick_params(axis='x', labelrotation=30)
+    ax.grid(True, alpha=0.3)
+
+    for ax, clave, titulo in ((ejes[1, 1], 'sobreimpulso', 'Sobreimpulso por escalón [%]'),
+                              (ejes[1, 2], 't_establecimiento', 'Tiempo de establecimiento [s]')):
+        datos = [np.array([v[clave] for v in muestras[e].valores]) if e in muestras else np.empty(0)
+                 for e in equipos]
+        datos = [d[np.isfinite(d)] for d in datos]
+        if any(len(d) for d in datos):
+            ax.boxplot([d if len(d) else [np.nan] for d in datos], showfliers=False)
+            ax.set_xticks(range(1, len(equipos) + 1), equipos, rotation=30, ha='right')
+        ax.set_title(titulo)
+        ax.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    fig.savefig(ruta, dpi=110)
+    plt.close(fig)
+
+
+def buscar_grabaciones(directorio, patron='**/*.pidrec'):
+    return sorted(glob.glob(os.path.join(directorio, patron), recursive=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Informe por lotes (calidad del control, escalones y planta) de un directorio de .pidrec")
+    parser.add_argument('directorio', help="Directorio con las grabaciones (se busca recursivamente)")
+    parser.add_argument('--salida', default='informe', help="Directorio del informe")
+    parser.add_argument('--procesos', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help="Procesos en paralelo (uno por archivo)")
+    parser.add_argument('--patron', default='**/*.pidrec', help="Patrón de los archivos")
+    parser.add_argument('--banda', type=float, default=BANDA_INFORME,
+                        help="Tolerancia para el tiempo en banda [°C]")
+    parser.add_argument('--tam-bloque', type=int, default=TAM_BLOQUE,
+                        help="Registros por bloque de lectura")
+    args = parser.parse_args(argv)
+
+    rutas = buscar_grabaciones(args.directorio, args.patron)
+    if not rutas:
+        print(f"⚠️ No hay grabaciones {args.patron} en {args.directorio}")
+        return 1
+    os.makedirs(args.salida, exist_ok=True)
+    tam_total = sum(os.path.getsize(r) for r in rutas)
+    print(f"📊 {len(rutas)} grabaciones ({tam_total / 2**20:.0f} MB), {args.procesos} proceso(s)")
+
+    corridas = []
+    muestras = {}
+    t0 = time.perf_counter()
+    with open(os.path.join(args.salida, 'corridas.csv'), 'w', newline='', encoding='utf-8') as f_c, \
+            open(os.path.join(args.salida, 'escalones.csv'), 'w', newline='', encoding='utf-8') as f_e:
+        csv_corridas = csv.DictWriter(f_c, COLUMNAS_CORRIDA)
+        csv_escalones = csv.DictWriter(f_e, COLUMNAS_ESCALON, extrasaction='ignore')
+        csv_corridas.writeheader()
+        csv_escalones.writeheader()
+        for i, (corrida, escalones, segundos) in enumerate(
+                recorrer(rutas, args.procesos, args.tam_bloque, args.banda), 1):
+            csv_corridas.writerow(corrida)
+            csv_escalones.writerows(escalones)
+            corridas.append(corrida)
+            reservorio = muestras.setdefault(corrida['equipo'], Reservorio())
+            for escalon in escalones:
+                reservorio.agregar({'sobreimpulso': escalon['sobreimpulso'],
+                                    't_establecimiento': escalon['t_establecimiento']})
+            nombre = os.path.relpath(corrida['archivo'], args.directorio)
+            if corrida['error']:
+                print(f"   [{i}/{len(rutas)}] ⚠️ {nombre}: {corrida['error']}")
+            else:
+                print(f"   [{i}/{len(rutas)}] {nombre}: {corrida['duracion_h']:.2f} h, "
+                      f"{corrida['tramas']} tramas, {corrida['escalones']} escalones, "
+                      f"error RMS {_fmt(corrida['error_rms'], '.3f')} °C ({segundos:.1f} s)")
+    dt = time.perf_counter() - t0
+    print(f"✅ {len(rutas)} grabaciones en {dt:.1f} s ({tam_total / 2**20 / dt:.0f} MB/s)")
+
+    por_equipo = resumen_por_equipo(corridas)
+    imagen = None
+    if any(not c['error'] for c in corridas):
+        imagen = 'informe.png'
+        graficar(corridas, muestras, os.path.join(args.salida, imagen))
+    escribir_markdown(os.path.join(args.salida, 'informe.md'), args.directorio, corridas,
+                      por_equipo, args.banda, imagen)
+    print(f"💾 Informe en {os.path.join(args.salida, 'informe.md')} "
+          f"(corridas.csv, escalones.csv{', ' + imagen if imagen else ''})")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
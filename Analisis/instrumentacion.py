@@ -0,0 +1,207 @@
+"""
+Contadores, temporizadores y perfilado del lazo en vivo.
+
+Cuando la gráfica se atrasa hace falta saber si la culpa es del puerto, del
+parseo o del dibujo. Instrumentacion junta, con coste de un perf_counter()
+por medición:
+
+- contadores (bytes, tramas, tramas malformadas, frames): total y tasa por
+  segundo en el último intervalo;
+- temporizadores (lectura del puerto, parseo, consumo, set_data, dibujo):
+  tiempo medio y máximo por llamada y fracción del tiempo real que ocupan;
+- medidores (tramas pendientes en la cola, fps pedido y del temporizador):
+  el último valor.
+
+Cada nombre lo escribe un solo hilo (el lector o el de la GUI), así que no
+hace falta lock. instantanea() devuelve un diccionario plano que se guarda
+como una línea JSON (RegistroJSONL) o se muestra en el recuadro de la figura
+(texto_recuadro).
+
+Perfilado opcional:
+- perfilar(ruta): cProfile del hilo que lo llama (la GUI), guardado en un
+  .prof para pstats/snakeviz.
+- MuestreadorPilas: muestrea cada pocos milisegundos la pila de TODOS los
+  hilos (incluido el lector) y guarda las pilas en formato "colapsado"
+  (una línea "hilo;archivo:función;... cuenta"), la entrada de flamegraph.pl
+  o speedscope.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+INTERVALO = 1.0  # Segundos entre instantáneas
+INTERVALO_MUESTREO = 0.005  # Segundos entre muestras de MuestreadorPilas
+PROFUNDIDAD_PILA = 40
+
+
+class Instrumentacion:
+    """Contadores, temporizadores y medidores con instantáneas por intervalo."""
+
+    def __init__(self):
+        self.t_inicio = time.perf_counter()
+        self._t_previo = self.t_inicio
+        self._contadores = defaultdict(int)
+        self._contadores_previos = {}
+        self._tiempos = defaultdict(float)
+        self._llamadas = defaultdict(int)
+        self._maximos = defaultdict(float)
+        self._previos = {}
+        self._valores = {}
+
+    def sumar(self, nombre, n=1):
+        """Suma n al contador `nombre`."""
+        self._contadores[nombre] += n
+
+    def registrar(self, nombre, dt):
+        """Agrega una duración dt [s] al temporizador `nombre`."""
+        self._tiempos[nombre] += dt
+        self._llamadas[nombre] += 1
+        if dt > self._maximos[nombre]:
+            self._maximos[nombre] = dt
+
+    @contextmanager
+    def medir(self, nombre):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nombre, time.perf_counter() - t0)
+
+    def fijar(self, nombre, valor):
+        """Guarda el valor actual del medidor `nombre`."""
+        self._valores[nombre] = valor
+
+    def instantanea(self):
+        """
+        Estado desde la instantánea anterior como diccionario plano:
+        <contador>_total, <contador>_por_s, <temporizador>_ms (medio),
+        <temporizador>_max_ms, <temporizador>_uso (fracción del intervalo) y
+        los medidores con su nombre.
+        """
+        ahora = time.perf_counter()
+        dt = max(ahora - self._t_previo, 1e-9)
+        datos = {'t': round(time.time(), 3), 'sesion_s': round(ahora - self.t_inicio, 3),
+                 'intervalo_s': round(dt, 3)}
+        for nombre, total in list(self._contadores.items()):
+            datos[f'{nombre}_total'] = total
+            datos[f'{nombre}_por_s'] = (total - self._contadores_previos.get(nombre, 0)) / dt
+            self._contadores_previos[nombre] = total
+        for nombre in list(self._tiempos):
+            tiempo, llamadas = self._tiempos[nombre], self._llamadas[nombre]
+            tiempo_previo, llamadas_previas = self._previos.get(nombre, (0.0, 0))
+            n = llamadas - llamadas_previas
+            datos[f'{nombre}_ms'] = 1000.0 * (tiempo - tiempo_previo) / n if n else 0.0
+            datos[f'{nombre}_max_ms'] = 1000.0 * self._maximos[nombre]
+            datos[f'{nombre}_uso'] = (tiempo - tiempo_previo) / dt
+            self._previos[nombre] = (tiempo, llamadas)
+            self._maximos[nombre] = 0.0
+        datos.update(self._valores)
+        self._t_previo = ahora
+        return datos
+
+
+def texto_recuadro(datos):
+    """Resumen de una instantánea para el recuadro sobre la figura."""
+    def tasa(nombre):
+        return datos.get(f'{nombre}_por_s', 0.0)
+
+    def ms(nombre):
+        return f"{datos.get(f'{nombre}_ms', 0.0):5.1f}/{datos.get(f'{nombre}_max_ms', 0.0):5.1f}"
+
+    return "\n".join([
+        f"serie   {tasa('bytes') / 1024:6.1f} kB/s {tasa('tramas'):7.1f} tramas/s  "
+        f"malformadas {datos.get('malformadas_total', 0)}  cola {datos.get('cola_tramas', 0)} tramas",
+        f"lectura {datos.get('lectura_uso', 0.0) * 100:3.0f}% (esperando)  parseo {ms('parseo')} ms",
+        f"consumo {ms('consumo')} ms  set_data {ms('set_data')} ms  dibujo {ms('dibujo')} ms",
+        f"fps     {tasa('frames'):5.1f} reales / {datos.get('fps_pedido', 0.0):5.1f} pedidos"
+        + (f" (temporizador {datos['fps_temporizador']:.1f})" if 'fps_temporizador' in datos else '')
+        + (f"  reloj {datos['deriva_ppm']:+.0f} ppm" if 'deriva_ppm' in datos else ''),
+    ])
+
+
+class RegistroJSONL:
+    """Agrega una línea JSON por instantánea a un archivo (se vacía en cada línea)."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._archivo = open(ruta, 'a', encoding='utf-8')
+
+    def escribir(self, datos):
+        self._archivo.write(json.dumps(datos) + '\n')
+        self._archivo.flush()
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+@contextmanager
+def perfilar(ruta):
+    """cProfile del hilo actual mientras dura el bloque; guarda las estadísticas en `ruta`."""
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield perfil
+    finally:
+        perfil.disable()
+        perfil.dump_stats(ruta)
+        print(f"💾 Perfil del hilo principal guardado en {ruta} "
+              f"(python -m pstats {ruta})")
+
+
+class MuestreadorPilas(threading.Thread):
+    """
+    Perfilador por muestreo de todos los hilos (sin instrumentar el código).
+
+    Cada `intervalo` segundos lee sys._current_frames() y cuenta la pila de
+    cada hilo. Coste fijo por muestra, independiente de cuántas funciones se
+    llamen, así que puede quedar activo durante toda la sesión.
+    """
+
+    def __init__(self, ruta, intervalo=INTERVALO_MUESTREO, profundidad=PROFUNDIDAD_PILA):
+        super().__init__(name='MuestreadorPilas', daemon=True)
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.profundidad = profundidad
+        self.pilas = Counter()
+        self.muestras = 0
+        self._detener = threading.Event()
+
+    def run(self):
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo):
+            nombres = {h.ident: h.name for h in threading.enumerate()}
+            for ident, marco in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = []
+                while marco is not None and len(pila) < self.profundidad:
+                    codigo = marco.f_code
+                    pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                    marco = marco.f_back
+                pila.append(nombres.get(ident, str(ident)))
+                self.pilas[';'.join(reversed(pila))] += 1
+            self.muestras += 1
+
+    def funciones_propias(self, n=10):
+        """Las n funciones que más muestras tienen en el tope de la pila."""
+        propias = Counter()
+        for pila, cuenta in self.pilas.items():
+            propias[pila.rsplit(';', 1)[-1]] += cuenta
+        return propias.most_common(n)
+
+    def detener(self):
+        """Termina el muestreo y guarda las pilas colapsadas."""
+        self._detener.set()
+        if self.is_alive():
+            self.join(1.0)
+        with open(self.ruta, 'w', encoding='utf-8') as f:
+            for pila, cuenta in self.pilas.most_common():
+                f.write(f"{pila} {cuenta}\n")
+        print(f"💾 {self.muestras} muestras de pila guardadas en {self.ruta}")
+        for funcion, cuenta in self.funciones_propias():
+            print(f"   {cuenta / max(self.muestras, 1):6.1%}  {funcion}")
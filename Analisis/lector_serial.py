@@ -0,0 +1,172 @@
+"""
+Lector serial en segundo plano para el análisis en vivo del controlador PID.
+
+El hilo LectorSerial es el único dueño de serial.Serial: abre el puerto,
+lee las líneas del firmware, las convierte en números y las deja en un
+buffer compartido con la hora de llegada de cada muestra. La animación de
+matplotlib sólo consume lo que ya está parseado, así que un redibujado lento
+no llena el buffer del sistema operativo ni hace perder tramas ">> ".
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import serial
+
+from parser_tramas import ParserTramas, CAMPOS_TRAMA
+from reloj_dispositivo import RelojDispositivo
+
+# Máximo de bloques pendientes antes de descartar los más antiguos
+MAX_PENDIENTES = 10000
+
+
+def extraer_bloques(cola):
+    """
+    Vacía una cola de bloques (t, datos) y los une en un solo par de arreglos.
+
+    Devuelve (t, datos) con t de forma (n,) y datos de forma (n, 8); ambos
+    vacíos si no había nada pendiente.
+    """
+    bloques = []
+    while True:
+        try:
+            bloques.append(cola.popleft())
+        except IndexError:
+            break
+    if not bloques:
+        return np.empty(0), np.empty((0, CAMPOS_TRAMA))
+    if len(bloques) == 1:
+        return bloques[0]
+    return (np.concatenate([t for t, _ in bloques]),
+            np.concatenate([datos for _, datos in bloques]))
+
+
+class LectorSerial(threading.Thread):
+    """
+    Hilo que lee el puerto serial de forma continua y guarda las muestras.
+
+    Cada lectura del puerto trae un bloque de bytes que ParserTramas convierte
+    de una vez en un arreglo (n, 8). El bloque se guarda como una tupla
+    (t_llegada, datos), donde t_llegada es un arreglo (n,) con time.time() del
+    momento en que llegaron los bytes. Si el firmware envía millis (trama
+    extendida), RelojDispositivo los convierte y t_llegada pasa a ser la hora
+    de cada medición. El buffer es un deque: append() y popleft() son atómicos
+    en CPython, por lo que productor y consumidor no necesitan lock.
+    Si se pasa un Grabador, cada trama también se guarda en disco desde este hilo.
+    Si se pasa una Instrumentacion (instrumentacion.py), se miden la lectura
+    del puerto, el parseo y los bytes, tramas y tramas malformadas.
+    """
+
+    def __init__(self, puerto, baud_rate, max_intentos=10, max_pendientes=MAX_PENDIENTES,
+                 grabador=None, instrumentacion=None):
+        super().__init__(name='LectorSerial', daemon=True)
+        self.puerto = puerto
+        self.baud_rate = baud_rate
+        self.max_intentos = max_intentos
+        self.grabador = grabador  # Grabador opcional (grabacion.py) para guardar la sesión
+        self.instrumentacion = instrumentacion
+        self.muestras = deque(maxlen=max_pendientes)
+        self.ser = None
+        self.intentos = 0
+        self.parser = ParserTramas()
+        self.reloj = RelojDispositivo()
+        self._detener = threading.Event()
+
+    @property
+    def tramas_leidas(self):
+        return self.parser.tramas
+
+    @property
+    def errores_parseo(self):
+        return self.parser.malformadas
+
+    # ------------------------------------------------------------------
+    # Conexión
+    # ------------------------------------------------------------------
+
+    def _conectar(self):
+        """Intenta abrir el puerto hasta max_intentos veces. Devuelve True si conectó."""
+        while not self._detener.is_set() and self.intentos < self.max_intentos:
+            try:
+                self.ser = serial.Serial(self.puerto, self.baud_rate, timeout=0.1)
+                print(f"✅ Conectado al puerto {self.puerto}")
+                return True
+            except serial.SerialException as e:
+                self.intentos += 1
+                if self.intentos == 1:  # Solo mostrar el error la primera vez
+                    print(f"⚠️ Error al abrir el puerto {self.puerto}: {e}")
+                    print("   Asegúrate de que SimulIDE esté corriendo y el puerto sea correcto.")
+                    print("   Reintentando...")
+            except Exception as e:
+                self.intentos += 1
+                if self.intentos == 1:
+                    print(f"⚠️ Error inesperado: {e}")
+            self._detener.wait(0.5)
+        return False
+
+    # ------------------------------------------------------------------
+    # Bucle de lectura
+    # ------------------------------------------------------------------
+
+    def run(self):
+        if not self._conectar():
+            return
+        parser = self.parser
+        inst = self.instrumentacion
+        try:
+            while not self._detener.is_set():
+                t0 = time.perf_counter()
+                try:
+                    # Espera el primer byte como máximo el timeout del puerto (0.1 s)
+                    # y luego se lleva todo lo que ya esté en el buffer del sistema
+                    crudo = self.ser.read(max(self.ser.in_waiting, 1))
+                except serial.SerialException as e:
+                    print(f"⚠️ Error de comunicación serial: {e}")
+                    break
+                t1 = time.perf_counter()
+                if inst is not None:
+                    inst.registrar('lectura', t1 - t0)
+                if not crudo:
+                    continue
+                t_llegada = time.time()
+                malformadas = parser.malformadas
+                datos = parser.alimentar(crudo)
+                if inst is not None:
+                    inst.registrar('parseo', time.perf_counter() - t1)
+                    inst.sumar('bytes', len(crudo))
+                    inst.sumar('tramas', len(datos))
+                    inst.sumar('malformadas', parser.malformadas - malformadas)
+                # Debug: mostrar que hubo tramas que no se pudieron parsear (solo al inicio)
+                if parser.malformadas > malformadas and parser.tramas == len(datos):
+                    print(f"⚠️ Error parseando {parser.malformadas - malformadas} trama(s)")
+                if len(datos) == 0:
+                    continue
+                t = np.full(len(datos), t_llegada)
+                if parser.millis is not None:
+                    t = self.reloj.convertir(parser.millis, t)
+                self.muestras.append((t, datos))
+                if self.grabador is not None:
+                    self.grabador.agregar_bloque(t, datos)
+        finally:
+            self.cerrar()
+
+    # ------------------------------------------------------------------
+    # Interfaz para el consumidor (hilo de la GUI)
+    # ------------------------------------------------------------------
+
+    def extraer(self):
+        """Devuelve y elimina las muestras pendientes como (t, datos), en orden de llegada."""
+        return extraer_bloques(self.muestras)
+
+    def detener(self, espera=1.0):
+        """Pide al hilo que termine y espera a que cierre el puerto."""
+        self._detener.set()
+        if self.is_alive():
+            self.join(espera)
+
+    def cerrar(self):
+        """Cierra el puerto serial si está abierto."""
+        if self.ser is not None and hasattr(self.ser, 'is_open') and self.ser.is_open:
+            self.ser.close()
+            print("✅ Puerto serial cerrado.")
@@ -0,0 +1,226 @@
+"""
+Métricas de calidad del control calculadas en línea, muestra a muestra.
+
+metricas_respuesta() (simulador.py) recorre la respuesta completa; en una
+sesión en vivo de horas eso no se puede repetir en cada frame. MetricasEnLinea
+guarda sólo acumuladores y actualiza todo con coste O(1) por muestra:
+
+- Cada cambio de setpoint (y el arranque) abre un escalón nuevo, medido desde
+  la temperatura que había en ese instante.
+- Sobreimpulso: máxima excursión más allá del setpoint, en % del salto.
+- Tiempo de subida (10-90%): primeros cruces de cada nivel.
+- Tiempo de establecimiento: primera muestra después de la última que estuvo
+  fuera de la banda ±banda·|salto| (provisional mientras siga corriendo).
+- Error estacionario: promedio del error desde que la temperatura entró en la
+  banda por última vez.
+- IAE / ISE / ITAE: integrales del error (rectángulos con el dt entre muestras).
+- Saturación: fracción del tiempo con la salida PWM en 0% o 100%, tanto del
+  escalón actual como de toda la sesión.
+
+Los bloques que llegan del lector se procesan con NumPy de una vez; un bloque
+sólo se parte si dentro de él cambia el setpoint.
+
+Con guardar_escalones=True, las métricas de cada escalón terminado quedan en
+`historial` (para recorrer grabaciones completas, ver informe_grabaciones.py).
+"""
+import numpy as np
+
+from buffer_circular import COL_TIEMPO, COL_TEMPERATURA, COL_SETPOINT, COL_PWM
+
+# Banda de establecimiento (fracción del salto)
+BANDA = 0.02
+# Banda mínima en °C: con saltos muy chicos el 2% queda por debajo de la resolución del ADC
+BANDA_MINIMA = 0.1
+# Saltos de setpoint menores a esto no abren un escalón nuevo [°C]
+TOLERANCIA_SETPOINT = 1e-6
+# Margen para considerar la salida saturada [% de PWM]
+MARGEN_SATURACION = 0.5
+
+
+class MetricasEnLinea:
+    """
+    Acumuladores de las métricas del escalón actual y de la sesión.
+
+    Uso:
+        metricas = MetricasEnLinea()
+        metricas.agregar_bloque(filas)   # filas con las columnas de BufferCircular
+        print(metricas.texto())
+    """
+
+    def __init__(self, banda=BANDA, banda_minima=BANDA_MINIMA, guardar_escalones=False):
+        self.banda = banda
+        self.banda_minima = banda_minima
+        self.escalones = 0
+        self.historial = [] if guardar_escalones else None
+        # Totales de la sesión
+        self.tiempo_sesion = 0.0
+        self.tiempo_saturado_sesion = 0.0
+        self._t_prev = None
+        self._nuevo_escalon(np.nan, np.nan, np.nan)
+
+    def _nuevo_escalon(self, t0, y0, setpoint):
+        self.t0 = t0
+        self.y0 = y0
+        self.setpoint = setpoint
+        self.salto = setpoint - y0
+        self._signo = 1.0 if self.salto >= 0 else -1.0
+        self._ancho_banda = max(self.banda * abs(self.salto), self.banda_minima)
+        self._pico = -np.inf          # Máxima excursión (con signo) más allá del setpoint
+        self._t_10 = np.nan
+        self._t_90 = np.nan
+        self._t_dentro = np.nan       # Primera muestra tras la última fuera de banda
+        self._suma_error_dentro = 0.0
+        self._n_dentro = 0
+        self.iae = 0.0
+        self.ise = 0.0
+        self.itae = 0.0
+        self.tiempo = 0.0
+        self.tiempo_saturado = 0.0
+
+    # ------------------------------------------------------------------
+    # Actualización
+    # ------------------------------------------------------------------
+
+    def agregar_bloque(self, filas):
+        """Procesa muestras nuevas: filas (m, 8) con las columnas de BufferCircular."""
+        if len(filas) == 0:
+            return
+        sp = filas[:, COL_SETPOINT]
+        # Índices donde cambia el setpoint (respecto del escalón actual o de la fila anterior)
+        cambios = np.flatnonzero(np.abs(np.diff(sp)) > TOLERANCIA_SETPOINT) + 1
+        if np.isnan(self.setpoint) or abs(sp[0] - self.setpoint) > TOLERANCIA_SETPOINT:
+            cambios = np.concatenate(([0], cambios))
+        inicio = 0
+        for corte in cambios:
+            if corte > inicio:
+                self._procesar_tramo(filas[inicio:corte])
+            if self.historial is not None and self.escalones:
+                self.historial.append(self.escalon())
+            self._nuevo_escalon(filas[corte, COL_TIEMPO], filas[corte, COL_TEMPERATURA],
+                                sp[corte])
+            self.escalones += 1
+            inicio = corte
+        self._procesar_tramo(filas[inicio:])
+
+    def cortar(self):
+        """Indica un hueco en los datos: el tiempo hasta la próxima muestra no se integra."""
+        self._t_prev = None
+
+    def _procesar_tramo(self, filas):
+        """Actualiza los acumuladores con un tramo de setpoint constante."""
+        t = filas[:, COL_TIEMPO]
+        y = filas[:, COL_TEMPERATURA]
+        pwm = filas[:, COL_PWM]
+        m = len(t)
+        t_prev = t[0] if self._t_prev is None else self._t_prev
+        dt = np.diff(t, prepend=t_prev)
+        self._t_prev = t[-1]
+
+        error = self.setpoint - y
+        abs_error = np.abs(error)
+        self.iae += float(np.dot(abs_error, dt))
+        self.ise += float(np.dot(error * error, dt))
+        self.itae += float(np.dot((t - self.t0) * abs_error, dt))
+
+        duracion = float(dt.sum())
+        saturado = float(dt[(pwm <= MARGEN_SATURACION) | (pwm >= 100.0 - MARGEN_SATURACION)].sum())
+        self.tiempo += duracion
+        self.tiempo_saturado += saturado
+        self.tiempo_sesion += duracion
+        self.tiempo_saturado_sesion += saturado
+
+        self._pico = max(self._pico, float(np.max(self._signo * (y - self.setpoint))))
+
+        if abs(self.salto) > self._ancho_banda and np.isnan(self._t_90):
+            avance = (y - self.y0) / self.salto
+            if np.isnan(self._t_10):
+                llego = np.flatnonzero(avance >= 0.1)
+                if len(llego):
+                    self._t_10 = t[llego[0]]
+            llego = np.flatnonzero(avance >= 0.9)
+            if len(llego):
+                self._t_90 = t[llego[0]]
+
+        fuera = np.flatnonzero(abs_error > self._ancho_banda)
+        if len(fuera):
+            k = fuera[-1] + 1
+            self._t_dentro = t[k] if k < m else np.nan
+            self._suma_error_dentro = float(error[k:].sum())
+            self._n_dentro = m - k
+        else:
+            if np.isnan(self._t_dentro):
+                self._t_dentro = t[0]
+            self._suma_error_dentro += float(error.sum())
+            self._n_dentro += m
+
+    # ------------------------------------------------------------------
+    # Resultados
+    # ------------------------------------------------------------------
+
+    @property
+    def sobreimpulso(self):
+        """Sobreimpulso del escalón actual [%] (nan si el salto es menor que la banda)."""
+        if abs(self.salto) <= self._ancho_banda or not np.isfinite(self._pico):
+            return np.nan
+        return max(self._pico, 0.0) / abs(self.salto) * 100
+
+    @property
+    def t_subida(self):
+        return self._t_90 - self._t_10
+
+    @property
+    def t_establecimiento(self):
+        return self._t_dentro - self.t0
+
+    @property
+    def error_estacionario(self):
+        return self._suma_error_dentro / self._n_dentro if self._n_dentro else np.nan
+
+    @property
+    def saturacion(self):
+        """Fracción del tiempo del escalón actual con la salida saturada (0-1)."""
+        return self.tiempo_saturado / self.tiempo if self.tiempo > 0 else 0.0
+
+    @property
+    def saturacion_sesion(self):
+        return self.tiempo_saturado_sesion / self.tiempo_sesion if self.tiempo_sesion > 0 else 0.0
+
+    def resumen(self):
+        """Diccionario con las métricas del escalón actual (mismas claves que metricas_respuesta)."""
+        return {
+            'sobreimpulso': self.sobreimpulso,
+            't_subida': self.t_subida,
+            't_establecimiento': self.t_establecimiento,
+            'error_estacionario': self.error_estacionario,
+            'iae': self.iae,
+            'ise': self.ise,
+            'itae': self.itae,
+            'saturacion': self.saturacion,
+            'saturacion_sesion': self.saturacion_sesion,
+        }
+
+    def escalon(self):
+        """Métricas del escalón actual con su inicio, salto y duración."""
+        datos = {'t0': self.t0, 'y0': self.y0, 'setpoint': self.setpoint, 'salto': self.salto,
+                 'duracion': self.tiempo, 'establecido': bool(self._n_dentro)}
+        datos.update(self.resumen())
+        del datos['saturacion_sesion']
+        return datos
+
+    def texto(self):
+        """Resumen en pocas líneas para mostrar sobre la gráfica."""
+        if np.isnan(self.setpoint):
+            return "Esperando datos..."
+
+        def fmt(valor, formato):
+            return '—' if np.isnan(valor) else format(valor, formato)
+
+        establecido = '' if self._n_dentro else ' (en curso)'
+        return (f"Escalón {self.escalones}: {self.y0:.2f} → {self.setpoint:.2f} °C\n"
+                f"Sobreimpulso: {fmt(self.sobreimpulso, '.1f')} %   "
+                f"t subida: {fmt(self.t_subida, '.1f')} s\n"
+                f"t establec.: {fmt(self.t_establecimiento, '.1f')} s{establecido}   "
+                f"e ss: {fmt(self.error_estacionario, '+.3f')} °C\n"
+                f"IAE {self.iae:.1f}   ISE {self.ise:.1f}   ITAE {self.itae:.0f}\n"
+                f"Saturación PWM: {self.saturacion * 100:.0f} % "
+                f"(sesión {self.saturacion_sesion * 100:.0f} %)")
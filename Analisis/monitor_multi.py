@@ -0,0 +1,427 @@
+"""
+Monitor de varios controladores (una zona del invernadero por equipo) a la vez.
+
+analisis.py sigue un solo puerto. Aquí un único bucle asyncio atiende N
+fuentes en paralelo, cada una con su parser, su buffer circular, sus
+métricas en línea y (opcionalmente) su grabación:
+
+- Puertos serie (COM3, /dev/ttyUSB0, o un pty de prueba): se abren con
+  timeout=0 y se sondean sin bloquear. pyserial no tiene API asyncio y el
+  sondeo funciona igual en Windows.
+- Sockets TCP (tcp://host:puerto): con asyncio.open_connection, para
+  conversores serie-TCP o el servidor de telemetría.
+
+Si una fuente falla o se desconecta, se reintenta para siempre con espera
+exponencial con jitter (BACKOFF_INICIAL .. BACKOFF_MAX) en lugar de rendirse
+a los MAX_INTENTOS_SERIAL intentos. Un error inesperado de un equipo (una
+trama que rompe las métricas, la grabación...) se informa con su traza, queda
+visible en el estado y también se reintenta: nunca detiene en silencio la
+tarea de ese equipo ni afecta a los demás.
+
+El tablero es una grilla de gráficas con el eje de tiempo compartido y se
+dibuja desde el mismo bucle asyncio con RenderizadorBlit: todo corre en un
+solo hilo, sin locks, y con 10 o más equipos sigue respondiendo porque en
+cada frame sólo se redibujan las líneas (decimadas al ancho en píxeles); los
+textos de estado, que son lo más caro de dibujar, se reescriben una vez por
+segundo, y el intervalo entre frames se adapta al tiempo de dibujo.
+
+Uso:
+    python monitor_multi.py zona1=COM3 zona2=COM4 zona3=tcp://192.168.0.20:4000
+    python monitor_multi.py /dev/pts/3 /dev/pts/5 --sin-ventana --grabar-dir sesiones/
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+import traceback
+
+import numpy as np
+import serial
+
+from parser_tramas import ParserTramas
+from reloj_dispositivo import RelojDispositivo
+from buffer_circular import (BufferCircular, filas_desde_tramas, COL_TIEMPO, COL_TEMPERATURA,
+                             COL_SETPOINT, COL_PWM)
+from metricas_online import MetricasEnLinea
+from decimacion import decimar_minmax, puntos_por_ancho
+from grabacion import Grabador
+from nominales import PERIODO, parametros_nominales
+
+BAUD_RATE = 9600
+VENTANA = 60.0  # Segundos visibles en el tablero
+MAX_PUNTOS = math.ceil(VENTANA / PERIODO)  # Muestras por equipo en el buffer (una ventana)
+# Espera entre sondeos de un puerto serie sin datos [s]
+INTERVALO_SONDEO = 0.02
+# Espera entre reintentos de conexión: exponencial entre estos límites [s]
+BACKOFF_INICIAL = 0.5
+BACKOFF_MAX = 30.0
+# Sin datos durante este tiempo, el equipo se muestra como detenido [s]
+TIEMPO_SIN_DATOS = 5.0
+# Cada cuánto se reescriben los textos de estado del tablero [s]
+INTERVALO_TEXTOS = 1.0
+# Bytes por lectura de un socket
+TAM_LECTURA = 4096
+
+
+def separar_origen(especificacion):
+    """'zona1=COM3' -> ('zona1', 'COM3'); sin nombre se usa el origen."""
+    nombre, igual, origen = especificacion.partition('=')
+    if not igual:
+        return especificacion, especificacion
+    return nombre, origen
+
+
+def direccion_tcp(origen):
+    """'tcp://host:puerto' -> (host, puerto). Lanza ValueError si está mal formada."""
+    host, _, puerto = origen[len('tcp://'):].rpartition(':')
+    if not host or not puerto.isdigit() or not 0 < int(puerto) < 65536:
+        raise ValueError(f"origen TCP inválido: {origen!r} (se espera tcp://host:puerto)")
+    return host, int(puerto)
+
+
+def espera_reintento(intentos, inicial=BACKOFF_INICIAL, maximo=BACKOFF_MAX):
+    """Espera exponencial con jitter (50-100% del valor) para el intento número `intentos`."""
+    base = min(maximo, inicial * 2 ** max(intentos - 1, 0))
+    return base * random.uniform(0.5, 1.0)
+
+
+class Dispositivo:
+    """
+    Un controlador monitoreado: fuente de datos, parser, buffer, métricas y grabación.
+
+    origen: nombre de puerto serie o 'tcp://host:puerto'.
+    t_referencia: hora (time.time()) que se toma como t = 0 en el buffer; es
+    la misma para todos los equipos para que compartan el eje de tiempo.
+    """
+
+    def __init__(self, nombre, origen, t_referencia, baud_rate=BAUD_RATE,
+                 max_puntos=MAX_PUNTOS, grabador=None):
+        if origen.startswith('tcp://'):
+            direccion_tcp(origen)  # Valida al crear el equipo, no en cada reintento
+        self.nombre = nombre
+        self.origen = origen
+        self.t_referencia = t_referencia
+        self.baud_rate = baud_rate
+        self.parser = ParserTramas()
+        self.reloj = RelojDispositivo()  # Sólo se usa si el firmware envía millis
+        self.buffer = BufferCircular(max_puntos)
+        self.metricas = MetricasEnLinea()
+        self.grabador = grabador
+        self.estado = 'conectando'
+        self.reconexiones = 0
+        self.fallos = 0  # Errores inesperados (no de conexión)
+        self.intentos = 0
+        self.ultimo_error = ''
+        self.t_ultimo_dato = None
+
+    # ------------------------------------------------------------------
+    # Datos
+    # ------------------------------------------------------------------
+
+    def procesar(self, crudo):
+        """Parsea un bloque de bytes y actualiza buffer, métricas y grabación."""
+        t_llegada = time.time()
+        datos = self.parser.alimentar(crudo)
+        if len(datos) == 0:
+            return 0
+        t = np.full(len(datos), t_llegada)
+        if self.parser.millis is not None:
+            t = self.reloj.convertir(self.parser.millis, t)
+        filas = filas_desde_tramas(t - self.t_referencia, datos)
+        self.buffer.agregar_bloque(filas)
+        self.metricas.agregar_bloque(filas)
+        if self.grabador is not None:
+            self.grabador.agregar_bloque(t, datos)
+        self.t_ultimo_dato = t_llegada
+        return len(datos)
+
+    @property
+    def sin_datos(self):
+        """True si está conectado pero hace más de TIEMPO_SIN_DATOS que no llega nada."""
+        return (self.estado == 'conectado' and self.t_ultimo_dato is not None and
+                time.time() - self.t_ultimo_dato > TIEMPO_SIN_DATOS)
+
+    def resumen(self):
+        """Una línea de estado: temperatura, setpoint, PWM, métricas y contadores."""
+        estado = 'sin datos' if self.sin_datos else self.estado
+        linea = f"{self.nombre:>12} [{estado:^11}] {self.parser.tramas:>7} tramas"
+        if len(self.buffer):
+            linea += (f" | T={self.buffer.ultimo(COL_TEMPERATURA):6.2f}°C "
+                      f"SP={self.buffer.ultimo(COL_SETPOINT):5.2f}°C "
+                      f"PWM={self.buffer.ultimo(COL_PWM):3.0f}%")
+            m = self.metricas
+            if m.escalones:
+                sobre = '—' if np.isnan(m.sobreimpulso) else f"{m.sobreimpulso:.1f}%"
+                linea += f" | sobreimp. {sobre} IAE {m.iae:.1f} sat {m.saturacion * 100:.0f}%"
+        if self.reloj.listo:
+            linea += f" | reloj {self.reloj.deriva_ppm:+.0f} ppm"
+        if self.parser.malformadas:
+            linea += f" | {self.parser.malformadas} malformadas"
+        if self.reconexiones:
+            linea += f" | {self.reconexiones} reconexiones"
+        if self.fallos:
+            linea += f" | {self.fallos} fallos"
+        if self.ultimo_error and self.estado != 'conectado':
+            linea += f" | {self.ultimo_error}"
+        return linea
+
+    # ------------------------------------------------------------------
+    # Conexión y lectura
+    # ------------------------------------------------------------------
+
+    async def ejecutar(self, detener):
+        """Conecta, lee hasta que la fuente falle y reintenta con backoff hasta `detener`."""
+        while not detener.is_set():
+            try:
+                if self.origen.startswith('tcp://'):
+                    await self._leer_tcp(detener)
+                else:
+                    await self._leer_serial(detener)
+            except (OSError, serial.SerialException, asyncio.IncompleteReadError) as e:
+                self.ultimo_error = str(e)
+            except Exception as e:
+                # Un error propio (parser, métricas, grabación): informar y reintentar
+                self.fallos += 1
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+                print(f"❌ {self.nombre}: error inesperado\n{traceback.format_exc()}")
+            if detener.is_set():
+                break
+            # Se perdió la conexión (o no se pudo abrir): esperar y reintentar
+            if self.estado == 'conectado':
+                self.reconexiones += 1
+                print(f"⚠️ {self.nombre}: conexión perdida ({self.ultimo_error or 'cerrada'})")
+            elif self.intentos == 0:
+                print(f"⚠️ {self.nombre}: no se pudo abrir {self.origen}: {self.ultimo_error}")
+            self.estado = 'reconectando'
+            self.parser.reiniciar()
+            self.intentos += 1
+            try:
+                await asyncio.wait_for(detener.wait(), espera_reintento(self.intentos))
+            except asyncio.TimeoutError:
+                pass
+        self.estado = 'detenido'
+
+    def _conectado(self):
+        if self.intentos or self.reconexiones:
+            print(f"✅ {self.nombre}: conectado a {self.origen}")
+        self.estado = 'conectado'
+        self.intentos = 0
+        self.ultimo_error = ''
+
+    async def _leer_serial(self, detener):
+        # Abrir un puerto puede tardar (sobre todo en Windows): fuera del bucle
+        ser = await asyncio.to_thread(serial.Serial, self.origen, self.baud_rate, timeout=0)
+        self._conectado()
+        try:
+            while not detener.is_set():
+                pendientes = ser.in_waiting
+                if pendientes:
+                    self.procesar(ser.read(pendientes))
+                else:
+                    await asyncio.sleep(INTERVALO_SONDEO)
+        finally:
+            ser.close()
+
+    async def _leer_tcp(self, detener):
+        lector, escritor = await asyncio.open_connection(*direccion_tcp(self.origen))
+        self._conectado()
+        try:
+            while not detener.is_set():
+                crudo = await lector.read(TAM_LECTURA)
+                if not crudo:
+                    break  # El otro extremo cerró la conexión
+                self.procesar(crudo)
+        finally:
+            escritor.close()
+
+
+class TableroMulti:
+    """
+    Grilla de gráficas (temperatura y setpoint por equipo) con blitting.
+
+    Todas las gráficas comparten el eje X (tiempo desde el inicio del
+    monitor), así que mover la ventana de tiempo cuesta un solo redibujado
+    completo para toda la grilla.
+    """
+
+    def __init__(self, dispositivos, ventana=VENTANA):
+        import matplotlib.pyplot as plt
+        from renderizador import RenderizadorBlit
+
+        self.plt = plt
+        self.dispositivos = dispositivos
+        self.ventana = ventana
+        self.cerrado = False
+        n = len(dispositivos)
+        columnas = math.ceil(math.sqrt(n))
+        filas = math.ceil(n / columnas)
+        self.fig, ejes = plt.subplots(filas, columnas, figsize=(4.5 * columnas, 2.8 * filas),
+                                      sharex=True, squeeze=False)
+        self.fig.suptitle('Monitor de Controladores PID', fontsize=14)
+        ejes = ejes.ravel()
+        for ax in ejes[n:]:
+            ax.set_visible(False)
+
+        self.ejes = ejes[:n]
+        self.lineas = []
+        artistas = []
+        textos = []
+        for ax, disp in zip(self.ejes, dispositivos):
+            ax.set_title(disp.nombre, fontsize=10)
+            ax.grid(True)
+            ax.set_ylim(20, 35)
+            temp, = ax.plot([], [], 'r-', lw=1)
+            sp, = ax.plot([], [], 'b--', lw=1)
+            texto = ax.text(0.01, 0.97, '', transform=ax.transAxes, va='top', ha='left',
+                            fontsize=7, family='monospace',
+                            bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+            self.lineas.append((temp, sp, texto))
+            artistas += [temp, sp]
+            textos.append(texto)
+        self.ejes[0].set_xlim(0, ventana)
+        for ax in ejes[-columnas:]:
+            ax.set_xlabel('Tiempo [s]')
+        self.fig.tight_layout()
+        self.fig.canvas.mpl_connect('close_event', self._al_cerrar)
+        self._t_textos = 0.0
+        self.renderizador = RenderizadorBlit(self.fig, artistas, self.actualizar, lentos=textos)
+
+    def _al_cerrar(self, evento):
+        self.cerrado = True
+
+    def mostrar(self):
+        self.plt.show(block=False)
+
+    @staticmethod
+    def texto_estado(disp):
+        estado = 'SIN DATOS' if disp.sin_datos else disp.estado.upper()
+        if disp.ultimo_error and disp.estado != 'conectado':
+            estado += f"  ({disp.ultimo_error})"
+        if len(disp.buffer) == 0:
+            return estado
+        m = disp.metricas
+        sobre = '—' if np.isnan(m.sobreimpulso) else f"{m.sobreimpulso:.1f}%"
+        return (f"{estado}  T={disp.buffer.ultimo(COL_TEMPERATURA):.2f}°C  "
+                f"PWM={disp.buffer.ultimo(COL_PWM):.0f}%\n"
+                f"sobreimp. {sobre}  IAE {m.iae:.0f}  sat {m.saturacion * 100:.0f}%")
+
+    def actualizar(self):
+        """Actualiza todas las líneas; devuelve los rangos para la histéresis de ejes."""
+        rangos = []
+        t_fin = 0.0
+        max_puntos = puntos_por_ancho(self.ejes[0])
+        ahora = time.perf_counter()
+        textos = ahora - self._t_textos >= INTERVALO_TEXTOS
+        if textos:
+            self._t_textos = ahora
+            self.renderizador.refrescar_lentos()
+        for ax, disp, (temp, sp, texto) in zip(self.ejes, self.dispositivos, self.lineas):
+            if textos:
+                texto.set_text(self.texto_estado(disp))
+            if len(disp.buffer) == 0:
+                continue
+            datos = disp.buffer.ventana()
+            t = datos[:, COL_TIEMPO]
+            temp.set_data(*decimar_minmax(t, datos[:, COL_TEMPERATURA], max_puntos))
+            sp.set_data(*decimar_minmax(t, datos[:, COL_SETPOINT], max_puntos))
+            t_fin = max(t_fin, t[-1])
+            lo = min(disp.buffer.minimo(COL_TEMPERATURA, COL_SETPOINT), 20)
+            hi = max(disp.buffer.maximo(COL_TEMPERATURA, COL_SETPOINT), 35)
+            rangos.append((ax, 'y', lo - 1, hi + 1))
+        # Eje X compartido: basta con ajustar el primero
+        t_inicio = max(0.0, t_fin - self.ventana)
+        rangos.append((self.ejes[0], 'x', t_inicio, max(t_fin, t_inicio + self.ventana)))
+        return rangos
+
+
+def _tarea_terminada(disp, tarea):
+    """Informa si la tarea de un equipo terminó por una excepción (no debería: ejecutar() reintenta)."""
+    if tarea.cancelled() or tarea.exception() is None:
+        return
+    e = tarea.exception()
+    disp.estado = 'error'
+    disp.ultimo_error = f"{type(e).__name__}: {e}"
+    print(f"❌ {disp.nombre}: la tarea terminó y el equipo ya no se actualiza\n"
+          + ''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+
+
+async def monitorear(dispositivos, tablero=None, intervalo_estado=1.0):
+    """
+    Atiende todos los dispositivos y el tablero (o la consola) hasta Ctrl+C o cerrar la ventana.
+    """
+    detener = asyncio.Event()
+    tareas = []
+    for d in dispositivos:
+        tarea = asyncio.create_task(d.ejecutar(detener))
+        tarea.add_done_callback(lambda tarea, d=d: _tarea_terminada(d, tarea))
+        tareas.append(tarea)
+    try:
+        if tablero is not None:
+            tablero.mostrar()
+            while not tablero.cerrado:
+                tablero.renderizador.frame()
+                await asyncio.sleep(tablero.renderizador.intervalo_ms / 1000.0)
+        else:
+            while True:
+                await asyncio.sleep(intervalo_estado)
+                print(f"--- {time.strftime('%H:%M:%S')} ---")
+                for d in dispositivos:
+                    print(d.resumen())
+    finally:
+        detener.set()
+        await asyncio.gather(*tareas, return_exceptions=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Monitor asyncio de varios controladores PID a la vez",
+        epilog="Cada fuente es un puerto serie (COM3, /dev/ttyUSB0) o tcp://host:puerto, "
+               "opcionalmente con nombre: zona1=COM3")
+    parser.add_argument('fuentes', nargs='+', metavar='FUENTE')
+    parser.add_argument('--baud', type=int, default=BAUD_RATE)
+    parser.add_argument('--ventana', type=float, default=VENTANA, help="Segundos visibles")
+    parser.add_argument('--grabar-dir', metavar='DIR',
+                        help="Graba cada equipo en DIR/<nombre>.pidrec")
+    parser.add_argument('--sin-ventana', action='store_true',
+                        help="Sin gráficos: resumen por consola cada segundo")
+    args = parser.parse_args(argv)
+
+    t_referencia = time.time()
+    dispositivos = []
+    for especificacion in args.fuentes:
+        nombre, origen = separar_origen(especificacion)
+        if origen.startswith('tcp://'):
+            try:
+                direccion_tcp(origen)
+            except ValueError as e:
+                parser.error(str(e))
+        grabador = None
+        if args.grabar_dir:
+            os.makedirs(args.grabar_dir, exist_ok=True)
+            nombre_archivo = ''.join(c if c.isalnum() or c in '-_' else '_' for c in nombre)
+            grabador = Grabador(os.path.join(args.grabar_dir, nombre_archivo + '.pidrec'),
+                                {'puerto': origen, 'baud_rate': args.baud, 'zona': nombre,
+                                 **parametros_nominales()})
+        dispositivos.append(Dispositivo(nombre, origen, t_referencia, args.baud,
+                                        max_puntos=math.ceil(args.ventana / PERIODO),
+                                        grabador=grabador))
+
+    print(f"📡 Monitoreando {len(dispositivos)} equipo(s): "
+          + ", ".join(f"{d.nombre} ({d.origen})" for d in dispositivos))
+    tablero = None if args.sin_ventana else TableroMulti(dispositivos, args.ventana)
+    try:
+        asyncio.run(monitorear(dispositivos, tablero))
+    except KeyboardInterrupt:
+        print("\n⚠️ Interrupción del usuario")
+    finally:
+        for d in dispositivos:
+            if d.grabador is not None:
+                d.grabador.cerrar()
+                print(f"💾 {d.nombre}: {d.grabador.registros} tramas grabadas en {d.grabador.ruta}")
+        print("✅ Monitor finalizado.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Valores nominales del controlador PID, de la planta (invernadero) y del muestreo.
+
+Es el único lugar donde se definen; analisis.py, el simulador, la sintonía,
+la identificación, los análisis de márgenes y el monitor multi-equipo los
+importan de aquí.
+Si cambias los parámetros del PID en el firmware, actualiza también estos valores.
+"""
+
+# Período de muestreo del firmware (PERIODO_MS = 100) [s]
+PERIODO = 0.1
+
+# Parámetros del Controlador PID (de los archivos .ino y .md)
+KP = 1.8
+KI = 5.4
+KD = 0.31
+
+# Parámetros estimados de la Planta (Invernadero)
+# (se pueden reemplazar por un modelo identificado: --modelo o --identificar)
+K = 0.35   # Ganancia (°C / % PWM)
+T = 1.0    # Constante de Tiempo (segundos)
+L = 0.1    # Tiempo muerto / Retardo (segundos)
+
+
+def parametros_nominales():
+    """{'KP', 'KI', 'KD', 'K', 'T', 'L'} para las cabeceras de grabación y los informes."""
+    return {'KP': KP, 'KI': KI, 'KD': KD, 'K': K, 'T': T, 'L': L}
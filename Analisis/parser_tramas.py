@@ -0,0 +1,166 @@
+"""
+Parser vectorizado del formato de tramas ">> " del firmware.
+
+El camino línea a línea (decode, strip, startswith, replace, split y un
+float() por campo) es el cuello de botella a baudios altos y al procesar
+grabaciones grandes. Aquí se parte de un bloque de bytes crudo (lo que
+devuelve ser.read(ser.in_waiting) o un bloque de archivo), se separan las
+líneas completas, se filtran las tramas de datos y se convierten TODAS a la
+vez en un arreglo NumPy (n, 8) con una única conversión de NumPy.
+
+La línea incompleta del final se guarda y se antepone al bloque siguiente.
+Las líneas que no son datos (mensajes de arranque del firmware) y las tramas
+mal formadas se cuentan en lugar de descartarse en silencio.
+
+Formato extendido: si el firmware se compila con ENVIAR_MILLIS, cada trama
+trae un 9° campo con millis() del momento de la medición. Los datos siguen
+siendo (n, 8); los millis se devuelven aparte (NaN en las tramas que no los
+traen) para convertirlos a hora del host con reloj_dispositivo.py.
+"""
+import numpy as np
+
+# Prefijo que marca las líneas de datos enviadas por el firmware
+PREFIJO_DATOS = ">> "
+# Número de campos de cada trama:
+# temperatura,setpoint,error,out_p,out_i,out_d,out_total,salida
+CAMPOS_TRAMA = 8
+# Trama extendida: los mismos campos más millis() del firmware
+CAMPOS_TRAMA_EXTENDIDA = CAMPOS_TRAMA + 1
+# Longitud máxima de una línea incompleta; más allá se considera basura y se descarta
+MAX_RESTO = 4096
+
+_PREFIJO_BYTES = PREFIJO_DATOS.encode('ascii')
+_SIN_DATOS = np.empty((0, CAMPOS_TRAMA), dtype=np.float64)
+
+
+def parsear_linea(linea):
+    """
+    Convierte una línea ">> t,sp,e,p,i,d,total,salida" en una lista de 8 floats.
+
+    Acepta también la trama extendida (9° campo con millis), que se ignora.
+    Devuelve None si la línea no es de datos o está incompleta.
+    Lanza ValueError si los campos no son numéricos.
+    """
+    if not linea.startswith(PREFIJO_DATOS):
+        return None
+    partes = linea[len(PREFIJO_DATOS):].split(',')
+    if len(partes) not in (CAMPOS_TRAMA, CAMPOS_TRAMA_EXTENDIDA):
+        return None
+    return [float(p) for p in partes[:CAMPOS_TRAMA]]
+
+
+def _convertir(cuerpos, campos=CAMPOS_TRAMA):
+    """
+    Convierte los cuerpos de trama (bytes sin prefijo, `campos` campos cada uno) a (n, campos).
+
+    Devuelve (datos, malformadas). Primero intenta convertir todo el bloque de
+    una vez; si algún valor no es numérico, repite trama por trama para
+    quedarse con las válidas. Cada cuerpo ya trae exactamente `campos` campos.
+    """
+    if not cuerpos:
+        return np.empty((0, campos)), 0
+    try:
+        # Lanza ValueError con texto no numérico (np.fromstring sólo avisaría y
+        # filtrar sus avisos toca estado global, no apto para el hilo lector)
+        return np.array(b','.join(cuerpos).split(b','), dtype=np.float64).reshape(-1, campos), 0
+    except ValueError:
+        pass
+    filas = []
+    for cuerpo in cuerpos:
+        try:
+            filas.append([float(p) for p in cuerpo.split(b',')])
+        except ValueError:
+            continue
+    if not filas:
+        return np.empty((0, campos)), len(cuerpos)
+    return np.array(filas, dtype=np.float64), len(cuerpos) - len(filas)
+
+
+def parsear_bloque(crudo, resto=b''):
+    """
+    Parsea todas las tramas completas de un bloque de bytes.
+
+    crudo: bytes recién leídos.
+    resto: línea incompleta que quedó del bloque anterior.
+    Devuelve (datos, resto, malformadas, no_datos, millis):
+    - datos: arreglo float64 (n, 8) con las tramas válidas, en orden.
+    - resto: bytes después del último salto de línea (pasar en la próxima llamada).
+    - malformadas: líneas ">> " con un número de campos distinto de 8 o 9 o valores no numéricos.
+    - no_datos: líneas no vacías sin el prefijo ">> ".
+    - millis: arreglo (n,) con el 9° campo (NaN si la trama no lo trae), o None
+      si ninguna trama del bloque es extendida.
+    """
+    bloque = resto + crudo if resto else crudo
+    fin = bloque.rfind(b'\n')
+    if fin < 0:
+        if len(bloque) > MAX_RESTO:
+            # Flujo sin saltos de línea (baudios incorrectos, ruido): descartar
+            return _SIN_DATOS, b'', 0, 1, None
+        return _SIN_DATOS, bloque, 0, 0, None
+    resto = bloque[fin + 1:]
+    if bloque.startswith(_PREFIJO_BYTES) and bloque.count(b'\n') == 1:
+        # Caso en vivo: una sola trama por lectura, sin el armado de listas
+        cuerpo = bloque[len(_PREFIJO_BYTES):fin].rstrip(b'\r')
+        if cuerpo.count(b',') == CAMPOS_TRAMA - 1:
+            datos, no_numericas = _convertir([cuerpo])
+            return datos, resto, no_numericas, 0, None
+    completas = bloque[:fin].replace(b'\r', b'').split(b'\n')
+
+    n_prefijo = len(_PREFIJO_BYTES)
+    cuerpos = [linea[n_prefijo:] for linea in completas if linea.startswith(_PREFIJO_BYTES)]
+    no_datos = 0
+    if len(cuerpos) < len(completas):
+        no_datos = sum(1 for linea in completas if linea.strip()) - len(cuerpos)
+    comas = [c.count(b',') for c in cuerpos]
+    if comas.count(CAMPOS_TRAMA - 1) == len(comas):
+        # Caso habitual (y el único en lecturas chicas): sólo tramas de 8 campos
+        datos, no_numericas = _convertir(cuerpos)
+        return datos, resto, no_numericas, no_datos, None
+    validos = [c for c, k in zip(cuerpos, comas) if k == CAMPOS_TRAMA - 1]
+    extendidas = comas.count(CAMPOS_TRAMA_EXTENDIDA - 1)
+    if not extendidas:
+        malformadas = len(cuerpos) - len(validos)
+        datos, no_numericas = _convertir(validos)
+        return datos, resto, malformadas + no_numericas, no_datos, None
+
+    # Hay tramas con millis: las de 8 campos se completan con NaN
+    validos = [c + b',nan' if k == CAMPOS_TRAMA - 1 else c
+               for c, k in zip(cuerpos, comas)
+               if k in (CAMPOS_TRAMA - 1, CAMPOS_TRAMA_EXTENDIDA - 1)]
+    malformadas = len(cuerpos) - len(validos)
+    datos, no_numericas = _convertir(validos, CAMPOS_TRAMA_EXTENDIDA)
+    return (datos[:, :CAMPOS_TRAMA], resto, malformadas + no_numericas, no_datos,
+            datos[:, CAMPOS_TRAMA])
+
+
+class ParserTramas:
+    """
+    Parser con estado: guarda la línea incompleta entre bloques y lleva contadores.
+
+    Uso:
+        parser = ParserTramas()
+        datos = parser.alimentar(ser.read(ser.in_waiting))
+    """
+
+    def __init__(self):
+        self.resto = b''
+        self.tramas = 0
+        self.malformadas = 0
+        self.no_datos = 0
+        self.millis = None  # millis (n,) de las tramas del último bloque, o None
+
+    def alimentar(self, crudo):
+        """
+        Parsea un bloque de bytes y devuelve las tramas completas como (n, 8).
+
+        Los millis de las tramas extendidas quedan en self.millis.
+        """
+        datos, self.resto, malformadas, no_datos, self.millis = parsear_bloque(crudo, self.resto)
+        self.tramas += len(datos)
+        self.malformadas += malformadas
+        self.no_datos += no_datos
+        return datos
+
+    def reiniciar(self):
+        """Descarta la línea incompleta (por ejemplo, al reconectar el puerto)."""
+        self.resto = b''
@@ -0,0 +1,149 @@
+"""
+Hora de medición de cada muestra a partir de millis() del firmware.
+
+Sin marca de tiempo del dispositivo, cada muestra lleva la hora en que el
+host la leyó: las tramas que llegan en el mismo bloque quedan con la misma
+hora y la latencia variable del puerto (USB, planificador, lecturas en
+bloque) aparece como ruido en todas las derivadas, tiempos y en el dt de la
+identificación. Con la trama extendida (millis como 9° campo), RelojDispositivo
+estima en línea la relación entre el reloj del Arduino y el del host:
+
+    t_host ≈ piso + (1 + deriva) · (t_dispositivo - t0)
+
+- millis es un unsigned long de 32 bits: da la vuelta cada ~49.7 días. Un
+  salto hacia atrás de más de media vuelta es una vuelta (se suma 2^32 ms);
+  un salto hacia atrás menor es un reinicio del firmware y reinicia el ajuste.
+- deriva: pendiente por mínimos cuadrados con olvido exponencial en el
+  tiempo del dispositivo, así que la memoria no depende de la tasa de tramas
+  (los resonadores cerámicos de los Arduino se desvían hasta ~0.5%).
+- piso: la latencia sólo puede retrasar la llegada, así que el desfase es la
+  envolvente inferior de (t_llegada - (1 + deriva)·(t_dispositivo - t0)).
+  Sube lentamente (RELAJACION) para seguir los errores de la deriva.
+
+El resultado es monótono y nunca posterior a la hora de llegada.
+"""
+import numpy as np
+
+VUELTA_MILLIS = 2 ** 32  # millis() de 32 bits [ms]
+OLVIDO = 0.999  # Factor de olvido por segundo del ajuste de la deriva (memoria de ~17 min)
+RELAJACION = 2e-4  # Cuánto sube el piso por segundo sin muestras más bajas [s/s]
+MIN_SPAN = 10.0  # Segundos de datos antes de estimar la deriva
+MAX_DERIVA = 0.02  # Deriva máxima admitida (2%)
+
+
+class RelojDispositivo:
+    """Convierte millis() del firmware a hora del host (time.time()) en línea."""
+
+    def __init__(self, olvido=OLVIDO, relajacion=RELAJACION):
+        self.olvido = olvido
+        self.relajacion = relajacion
+        self.reinicios = 0
+        self.vueltas = 0
+        self._ultimo_t = -np.inf  # Se conserva entre reinicios: la salida sigue siendo monótona
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._ultimo_millis = None
+        self._desplazamiento = 0.0  # ms sumados por las vueltas de millis
+        self._t0_disp = None
+        self._t0_host = None
+        # Sumas ponderadas (con olvido) para la pendiente: peso, x, y, xx, xy
+        self._sumas = np.zeros(5)
+        self._x_sumas = 0.0
+        self._span = 0.0
+        self.deriva = 0.0
+        self.piso = None
+        self._x_piso = 0.0
+
+    @property
+    def listo(self):
+        """True cuando ya hay datos suficientes para estimar la deriva."""
+        return self._span >= MIN_SPAN
+
+    @property
+    def deriva_ppm(self):
+        return self.deriva * 1e6
+
+    def _saltos(self, m):
+        """Clasifica el salto anterior a cada muestra: (vuelta, reinicio) como arreglos bool."""
+        previo = m[0] if self._ultimo_millis is None else self._ultimo_millis
+        saltos = np.diff(np.concatenate(([previo], m)))
+        vuelta = saltos < -VUELTA_MILLIS / 2
+        return vuelta, (saltos < 0) & ~vuelta
+
+    def desenrollar(self, millis):
+        """millis (n,) sin reinicios -> segundos continuos del dispositivo."""
+        m = np.asarray(millis, dtype=np.float64)
+        vuelta, _ = self._saltos(m)
+        self.vueltas += int(vuelta.sum())
+        desplazamiento = self._desplazamiento + np.cumsum(vuelta) * VUELTA_MILLIS
+        self._desplazamiento = float(desplazamiento[-1])
+        self._ultimo_millis = float(m[-1])
+        return (m + desplazamiento) / 1000.0
+
+    def _ajustar_deriva(self, x, y):
+        """Actualiza la pendiente y(x) con olvido exponencial (vectorizado por bloque)."""
+        x_fin = float(x[-1])
+        pesos = self.olvido ** (x_fin - x)
+        nuevas = np.array([pesos.sum(), pesos @ x, pesos @ y, pesos @ (x * x), pesos @ (x * y)])
+        self._sumas = self._sumas * self.olvido ** max(x_fin - self._x_sumas, 0.0) + nuevas
+        self._x_sumas = x_fin
+        w, sx, sy, sxx, sxy = self._sumas
+        self._span = max(self._span, x_fin)
+        varianza = sxx * w - sx * sx
+        if self.listo and varianza > 0:
+            pendiente = (sxy * w - sx * sy) / varianza
+            self.deriva = float(np.clip(pendiente - 1.0, -MAX_DERIVA, MAX_DERIVA))
+
+    def _convertir_tramo(self, millis, llegada):
+        """Convierte un tramo sin reinicios del firmware."""
+        segundos = self.desenrollar(millis)
+        if self._t0_disp is None:
+            self._t0_disp, self._t0_host = segundos[0], llegada[0]
+        x = segundos - self._t0_disp
+        # Las tramas leídas juntas comparten la hora de llegada, que sólo es la
+        # de la última: las anteriores llegaron antes y sesgarían la pendiente
+        ultimas = np.append(llegada[1:] != llegada[:-1], True)
+        self._ajustar_deriva(x[ultimas], llegada[ultimas] - self._t0_host)
+
+        base = self._t0_host + (1.0 + self.deriva) * x
+        residuo = float((llegada - base).min())
+        if self.piso is None:
+            self.piso = residuo
+        else:
+            relajado = self.piso + self.relajacion * max(float(x[-1]) - self._x_piso, 0.0)
+            self.piso = min(relajado, residuo)
+        self._x_piso = float(x[-1])
+
+        t = np.minimum(base + self.piso, llegada)
+        # Monótona entre bloques (la búsqueda por tiempo de las grabaciones lo necesita)
+        t = np.maximum.accumulate(np.concatenate(([self._ultimo_t], t)))[1:]
+        self._ultimo_t = float(t[-1])
+        return t
+
+    def convertir(self, millis, t_llegada):
+        """
+        Hora del host de cada muestra.
+
+        millis: arreglo (n,) del 9° campo (NaN en tramas sin millis).
+        t_llegada: arreglo (n,) con la hora de llegada (time.time()).
+        Las tramas sin millis conservan su hora de llegada.
+        """
+        millis = np.asarray(millis, dtype=np.float64)
+        t_llegada = np.asarray(t_llegada, dtype=np.float64)
+        resultado = t_llegada.copy()
+        indices = np.flatnonzero(~np.isnan(millis))
+        # Un reinicio del firmware corta el bloque en tramos con ajustes independientes
+        while len(indices):
+            m = millis[indices]
+            _, reinicio = self._saltos(m)
+            reinicio[0] = reinicio[0] and self._ultimo_millis is not None
+            cortes = np.flatnonzero(reinicio)
+            fin = int(cortes[0]) if len(cortes) else len(m)
+            if fin == 0:
+                self.reinicios += 1
+                self._reiniciar()
+                continue
+            resultado[indices[:fin]] = self._convertir_tramo(m[:fin], t_llegada[indices[:fin]])
+            indices = indices[fin:]
+        return resultado
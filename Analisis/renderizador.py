@@ -0,0 +1,189 @@
+"""
+Renderizador con blitting y presupuesto de tiempo para el tablero en vivo.
+
+Con FuncAnimation(blit=False) y set_xlim/set_ylim en cada frame, matplotlib
+redibuja la figura completa (ejes, rejilla, textos) 20 veces por segundo.
+RenderizadorBlit en cambio:
+
+1. Guarda el fondo de la figura (todo lo que no son las líneas de datos) y en
+   cada frame sólo lo restaura y dibuja las líneas encima (blitting).
+2. Sólo cambia los límites de los ejes cuando los datos salen de una banda de
+   histéresis; sólo entonces hace un redibujado completo y vuelve a guardar
+   el fondo.
+3. Mide cuánto tarda cada frame y alarga el intervalo del temporizador si
+   el dibujo ocupa más de una fracción del tiempo (presupuesto). Nunca va más
+   rápido que el intervalo pedido.
+4. Los artistas que cambian poco (textos de estado: dibujar glifos es mucho
+   más caro que una línea) van en una capa "lenta" que se pinta sobre el fondo
+   guardado sólo cuando se pide con refrescar_lentos().
+"""
+import time
+
+
+def limites_con_histeresis(actual, lo, hi, holgura_inf=0.1, holgura_sup=0.1, contraccion=0.5):
+    """
+    Decide si hay que cambiar los límites de un eje.
+
+    actual: (lim_inf, lim_sup) que tiene hoy el eje.
+    lo, hi: rango que ocupan los datos.
+    Devuelve los nuevos límites, o None si los datos siguen dentro de la banda.
+    Se amplía cuando los datos se salen y se contrae cuando ocupan menos de la
+    fracción `contraccion` del rango visible. Al cambiar se deja una holgura
+    (fracción del rango de datos) para no volver a cambiar en el frame siguiente.
+    """
+    lim_inf, lim_sup = actual
+    rango_datos = max(hi - lo, 1e-9)
+    fuera = lo < lim_inf or hi > lim_sup
+    muy_holgado = rango_datos < contraccion * (lim_sup - lim_inf)
+    if not (fuera or muy_holgado):
+        return None
+    return lo - holgura_inf * rango_datos, hi + holgura_sup * rango_datos
+
+
+class RenderizadorBlit:
+    """
+    Bucle de dibujo con blitting, histéresis de ejes e intervalo adaptativo.
+
+    fig: figura de matplotlib.
+    lineas: artistas que cambian en cada frame (se marcan como animados).
+    actualizar: función sin argumentos que actualiza los datos de las líneas y
+        devuelve una lista de tuplas (ax, 'x' | 'y', lo, hi) con el rango que
+        ocupan los datos en cada eje.
+    intervalo_ms: intervalo pedido del temporizador; es el mínimo, el ajuste
+        por presupuesto sólo lo alarga.
+    presupuesto: fracción máxima del tiempo dedicada a dibujar (0.5 = la mitad).
+    lentos: artistas que sólo se redibujan tras refrescar_lentos().
+    instrumentacion: Instrumentacion opcional; mide 'dibujo' y cuenta 'frames'.
+    """
+
+    # Holguras por dimensión: en X (tiempo) sólo se deja espacio hacia adelante
+    HOLGURAS = {'x': (0.0, 0.25), 'y': (0.1, 0.1)}
+
+    def __init__(self, fig, lineas, actualizar, intervalo_ms=50, presupuesto=0.5,
+                 intervalo_max_ms=1000, lentos=(), instrumentacion=None):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.lineas = list(lineas)
+        self.lentos = list(lentos)
+        self.instrumentacion = instrumentacion
+        self.actualizar = actualizar
+        self.presupuesto = presupuesto
+        self.intervalo_pedido_ms = intervalo_ms
+        self.intervalo_max_ms = max(intervalo_max_ms, intervalo_ms)
+        self.intervalo_ms = intervalo_ms  # Intervalo actual del temporizador
+        self._fondo = None
+        self._fondo_lentos = None  # Fondo + capa lenta
+        self._lentos_sucios = True
+        self._timer = None
+        # Estadísticas de dibujo
+        self.tiempo_frame_medio = 0.0  # Promedio exponencial del tiempo por frame [s]
+        self.frames = 0
+        self.redibujados_completos = 0
+
+        for linea in self.lineas + self.lentos:
+            linea.set_animated(True)
+        # Cada redibujado completo (propio, por cambio de tamaño, zoom...) renueva el fondo
+        self._cid = self.canvas.mpl_connect('draw_event', self._al_dibujar)
+
+    # ------------------------------------------------------------------
+    # Blitting
+    # ------------------------------------------------------------------
+
+    def _al_dibujar(self, evento):
+        """Guarda el fondo recién dibujado y pinta las líneas encima."""
+        self._fondo = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._componer_lentos()
+        self._dibujar_lineas()
+
+    def _componer_lentos(self):
+        """Pinta la capa lenta sobre el fondo y guarda el resultado."""
+        if not self.lentos:
+            self._fondo_lentos = self._fondo
+        else:
+            self.canvas.restore_region(self._fondo)
+            for artista in self.lentos:
+                self.fig.draw_artist(artista)
+            self._fondo_lentos = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._lentos_sucios = False
+
+    def refrescar_lentos(self):
+        """Pide redibujar la capa lenta en el próximo frame."""
+        self._lentos_sucios = True
+
+    def _dibujar_lineas(self):
+        for linea in self.lineas:
+            linea.axes.draw_artist(linea)
+
+    def _aplicar_limites(self, rangos):
+        """Aplica la histéresis a cada eje. Devuelve True si cambió algún límite."""
+        cambio = False
+        for ax, dim, lo, hi in rangos:
+            actual = ax.get_xlim() if dim == 'x' else ax.get_ylim()
+            holgura_inf, holgura_sup = self.HOLGURAS[dim]
+            nuevos = limites_con_histeresis(actual, lo, hi, holgura_inf, holgura_sup)
+            if nuevos is None:
+                continue
+            if dim == 'x':
+                ax.set_xlim(*nuevos)
+            else:
+                ax.set_ylim(*nuevos)
+            cambio = True
+        return cambio
+
+    def frame(self):
+        """Actualiza datos y dibuja un frame. Devuelve el tiempo empleado [s]."""
+        t0 = time.perf_counter()
+        rangos = self.actualizar() or []
+        t_dibujo = time.perf_counter()
+        if self._aplicar_limites(rangos) or self._fondo is None:
+            # Redibujado completo: _al_dibujar guarda el fondo y dibuja las líneas
+            self.canvas.draw()
+            self.redibujados_completos += 1
+        else:
+            if self._lentos_sucios:
+                self._componer_lentos()
+            self.canvas.restore_region(self._fondo_lentos)
+            self._dibujar_lineas()
+        self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+        fin = time.perf_counter()
+        dt = fin - t0
+        if self.instrumentacion is not None:
+            self.instrumentacion.registrar('dibujo', fin - t_dibujo)
+            self.instrumentacion.sumar('frames')
+        self.frames += 1
+        self._adaptar_intervalo(dt)
+        return dt
+
+    # ------------------------------------------------------------------
+    # Intervalo adaptativo
+    # ------------------------------------------------------------------
+
+    def _adaptar_intervalo(self, dt):
+        """Alarga el intervalo pedido lo necesario para que dibujar no supere el presupuesto."""
+        if self.frames == 1:
+            self.tiempo_frame_medio = dt
+        else:
+            self.tiempo_frame_medio = 0.9 * self.tiempo_frame_medio + 0.1 * dt
+        objetivo = 1000.0 * self.tiempo_frame_medio / self.presupuesto
+        self.intervalo_ms = int(min(max(objetivo, self.intervalo_pedido_ms), self.intervalo_max_ms))
+        if self._timer is not None:
+            self._timer.interval = self.intervalo_ms
+
+    # ------------------------------------------------------------------
+    # Temporizador
+    # ------------------------------------------------------------------
+
+    def iniciar(self):
+        """Arranca el temporizador del backend (llamar antes de plt.show())."""
+        self._timer = self.canvas.new_timer(interval=self.intervalo_ms)
+        self._timer.add_callback(self.frame)
+        self._timer.start()
+        return self._timer
+
+    def detener(self):
+        """Detiene el temporizador y desconecta el evento de dibujo."""
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        self.canvas.mpl_disconnect(self._cid)
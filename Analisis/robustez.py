@@ -0,0 +1,376 @@
+"""
+Robustez del lazo PID por Monte Carlo, con el retardo exacto.
+
+analizar_estabilidad() usa una sola planta nominal y aproxima el tiempo
+muerto con Padé de 1er orden, que casi nunca deja cruzar la fase por -180°.
+Aquí se muestrean miles de plantas (K, T, L) alrededor de la nominal y, para
+cada una, se evalúa
+
+    L(jω) = Gc(jω) · K/(T·jω + 1) · e^(-L·jω)
+
+con el retardo exacto sobre una grilla densa de frecuencias. Por muestra se
+obtienen GM, PM (barrido_ganancias.margenes_mag_fase) y el pico de
+sensibilidad Ms = max |1/(1 + L(jω))| = 1 / (distancia mínima de L(jω) a -1).
+
+CACHÉ:
+ln|Gp(jω)| y ∠Gp(jω) de todas las plantas se calculan una sola vez
+(RespuestasPlantas, float32, una fila por planta). En escala logarítmica el
+lazo es la suma de planta y controlador, así que evaluar otras ganancias
+sólo cuesta calcular Gc(jω) sobre la grilla (un vector) y sumarlo. Lo mismo
+vale para las envolventes de Nyquist: los percentiles por frecuencia de la
+planta se guardan y el controlador sólo los desplaza.
+
+Las plantas se muestrean con distribución log-normal (siempre positivas)
+con la dispersión relativa de cada parámetro; con --modelo la dispersión sale
+de los intervalos del 95% del modelo identificado (identificacion.py).
+
+Uso:
+    python robustez.py --muestras 10000 --dispersion 0.15 0.2 0.3 --grafica robustez.png
+    python robustez.py --modelo modelo.json --ganancias 1.8,5.4,0.31 --ganancias 1.2,3,0.2
+"""
+import argparse
+import time
+
+import numpy as np
+
+import nominales
+from barrido_ganancias import grilla_omega, respuesta_controlador, margenes_mag_fase
+
+# Incertidumbre por defecto: desviación relativa (1σ) de K, T y L
+DISPERSION = (0.15, 0.2, 0.3)
+MUESTRAS = 10000
+
+# Grilla densa de frecuencias [rad/s]: el retardo exacto da una vuelta de
+# fase cada 2π/L rad/s, así que hace falta resolución también a alta frecuencia
+OMEGA_MIN = 1e-2
+OMEGA_MAX = 1e3
+PUNTOS_OMEGA = 1000
+
+# Filas por bloque al evaluar (acota la memoria temporal a bloque x frecuencias)
+TAM_BLOQUE = 1000
+
+# Límites de robustez del informe (GM y PM son los de sintonia.py)
+GM_MIN_DB = 6.0
+PM_MIN = 45.0
+MS_MAX = 2.0
+
+# Percentiles de las envolventes de Nyquist
+PERCENTILES_ENVOLVENTE = (5.0, 95.0)
+# Curvas individuales que se dibujan en el diagrama de Nyquist
+CURVAS_NYQUIST = 150
+
+
+def muestrear_plantas(n, nominal=(nominales.K, nominales.T, nominales.L), dispersion=DISPERSION,
+                      semilla=0):
+    """
+    n plantas (K, T, L) log-normales con mediana `nominal` y desviación relativa `dispersion`.
+
+    Devuelve tres arreglos (n,). La primera muestra es siempre la planta nominal.
+    """
+    rng = np.random.default_rng(semilla)
+    nominal = np.asarray(nominal, dtype=np.float64)
+    sigma = np.log1p(np.asarray(dispersion, dtype=np.float64))
+    muestras = nominal * np.exp(sigma * rng.standard_normal((n, 3)))
+    muestras[0] = nominal
+    return muestras[:, 0], muestras[:, 1], muestras[:, 2]
+
+
+def dispersion_de_modelo(modelo, defecto=DISPERSION):
+    """Dispersión relativa de K, T y L a partir de los intervalos del 95% de un ModeloFOPDT."""
+    from identificacion import Z_95
+
+    dispersion = []
+    for p, d in zip(('K', 'T', 'L'), defecto):
+        valor = getattr(modelo, p)
+        if p in modelo.intervalos and valor > 0:
+            lo, hi = modelo.intervalos[p]
+            dispersion.append((hi - lo) / (2 * Z_95 * valor))
+        else:
+            dispersion.append(d)
+    return tuple(dispersion)
+
+
+class RespuestasPlantas:
+    """
+    ln|Gp(jω)| y ∠Gp(jω) [grados] de N plantas FOPDT con retardo exacto.
+
+    Se calculan una vez al crear el objeto; evaluar() y envolvente() los
+    reutilizan para cualquier juego de ganancias.
+    """
+
+    def __init__(self, K, T, L, omega=None):
+        self.K, self.T, self.L = (np.asarray(x, dtype=np.float64) for x in (K, T, L))
+        self.omega = grilla_omega(OMEGA_MIN, OMEGA_MAX, PUNTOS_OMEGA) if omega is None else omega
+        w = self.omega[None, :]
+        Tw = self.T[:, None] * w
+        # Forma cerrada: la fase sale continua sin desenrollar
+        self.log_mag = (np.log(self.K)[:, None] - 0.5 * np.log1p(Tw ** 2)).astype(np.float32)
+        self.fase = np.degrees(-np.arctan(Tw) - self.L[:, None] * w).astype(np.float32)
+        self._envolventes = {}
+
+    def __len__(self):
+        return len(self.K)
+
+    @property
+    def bytes(self):
+        return self.log_mag.nbytes + self.fase.nbytes
+
+    def envolvente(self, percentiles=PERCENTILES_ENVOLVENTE):
+        """Percentiles por frecuencia de ln|Gp| y ∠Gp, cada uno (len(percentiles), w)."""
+        clave = tuple(percentiles)
+        if clave not in self._envolventes:
+            self._envolventes[clave] = (np.percentile(self.log_mag, clave, axis=0),
+                                        np.percentile(self.fase, clave, axis=0))
+        return self._envolventes[clave]
+
+
+def _controlador(omega, KP, KI, KD):
+    """ln|Gc(jω)| y ∠Gc(jω) [grados] sobre la grilla (la fase de un PID está en ±90°)."""
+    gc = respuesta_controlador(omega, KP, KI, KD).reshape(-1)
+    return np.log(np.abs(gc)), np.degrees(np.angle(gc))
+
+
+def evaluar(respuestas, KP, KI, KD, tam_bloque=TAM_BLOQUE):
+    """
+    Márgenes y pico de sensibilidad del lazo con cada planta de `respuestas`.
+
+    Devuelve un dict de arreglos (n,): 'gm' (lineal), 'gm_db', 'pm' [°], 'wcg',
+    'wcp', 'ms', 'w_ms' [rad/s] y 'estable' (GM > 1 y PM > 0).
+    """
+    omega = respuestas.omega
+    log_mag_c, fase_c = _controlador(omega, KP, KI, KD)
+    n = len(respuestas)
+    resultado = {c: np.empty(n) for c in ('gm', 'pm', 'wcg', 'wcp', 'ms', 'w_ms')}
+    for i in range(0, n, tam_bloque):
+        j = min(i + tam_bloque, n)
+        log_mag = respuestas.log_mag[i:j] + log_mag_c
+        fase = respuestas.fase[i:j] + fase_c
+        gm, pm, wcg, wcp = margenes_mag_fase(log_mag, fase, omega)
+        # |1 + L|² = 1 + 2·|L|·cos∠L + |L|², sin pasar por números complejos
+        mag = np.exp(log_mag)
+        distancia2 = 1.0 + 2.0 * mag * np.cos(np.radians(fase)) + mag * mag
+        k = np.argmin(distancia2, axis=1)
+        resultado['ms'][i:j] = 1.0 / np.sqrt(distancia2[np.arange(j - i), k])
+        resultado['w_ms'][i:j] = omega[k]
+        for nombre, valor in (('gm', gm), ('pm', pm), ('wcg', wcg), ('wcp', wcp)):
+            resultado[nombre][i:j] = valor
+    with np.errstate(divide='ignore'):
+        resultado['gm_db'] = 20 * np.log10(resultado['gm'])
+    resultado['estable'] = (resultado['gm'] > 1.0) & (resultado['pm'] > 0.0)
+    return resultado
+
+
+def envolvente_nyquist(respuestas, KP, KI, KD, percentiles=PERCENTILES_ENVOLVENTE):
+    """
+    Envolvente de L(jω) sobre todas las plantas.
+
+    Devuelve (magnitud, fase [°]), cada uno (len(percentiles), w): para cada
+    frecuencia, la región entre esos percentiles de |L| y de ∠L contiene la
+    mayoría de las plantas (la "plantilla" de esa frecuencia).
+    """
+    log_mag_p, fase_p = respuestas.envolvente(percentiles)
+    log_mag_c, fase_c = _controlador(respuestas.omega, KP, KI, KD)
+    return np.exp(log_mag_p + log_mag_c), fase_p + fase_c
+
+
+def lazo(respuestas, filas, KP, KI, KD):
+    """L(jω) complejo de las plantas indicadas (para graficar), forma (len(filas), w)."""
+    log_mag_c, fase_c = _controlador(respuestas.omega, KP, KI, KD)
+    log_mag = respuestas.log_mag[filas] + log_mag_c
+    fase = np.radians(respuestas.fase[filas] + fase_c)
+    return np.exp(log_mag) * np.exp(1j * fase)
+
+
+def resumen(resultado, gm_min_db=GM_MIN_DB, pm_min=PM_MIN, ms_max=MS_MAX):
+    """Probabilidades de incumplir cada límite y percentiles de GM, PM y Ms (como dict)."""
+    estable = resultado['estable']
+    datos = {'muestras': len(estable), 'inestables': float(np.mean(~estable)),
+             'gm_bajo': float(np.mean(resultado['gm_db'] < gm_min_db)),
+             'pm_bajo': float(np.mean(resultado['pm'] < pm_min)),
+             'ms_alto': float(np.mean(resultado['ms'] > ms_max))}
+    for nombre in ('gm_db', 'pm', 'ms'):
+        valores = resultado[nombre][estable]
+        valores = valores[np.isfinite(valores)]
+        if len(valores):
+            datos[nombre] = dict(zip(('min', 'p1', 'p5', 'p50', 'p95', 'p99', 'max'),
+                                     np.percentile(valores, (0, 1, 5, 50, 95, 99, 100)).tolist()))
+    return datos
+
+
+def imprimir_resumen(datos, respuestas, resultado, gm_min_db=GM_MIN_DB, pm_min=PM_MIN,
+                     ms_max=MS_MAX):
+    n = datos['muestras']
+    print(f"   Inestables: {datos['inestables']:.2%}   GM < {gm_min_db:g} dB: {datos['gm_bajo']:.2%}   "
+          f"PM < {pm_min:g}°: {datos['pm_bajo']:.2%}   Ms > {ms_max:g}: {datos['ms_alto']:.2%}")
+    print(f"   {'(estables)':>12}" + "".join(f"{c:>9}" for c in ('mín', 'p1', 'p5', 'p50',
+                                                                  'p95', 'p99', 'máx')))
+    for nombre, etiqueta in (('gm_db', 'GM [dB]'), ('pm', 'PM [°]'), ('ms', 'Ms')):
+        if nombre in datos:
+            print(f"   {etiqueta:>12}" + "".join(f"{v:9.2f}" for v in datos[nombre].values()))
+    # Peor caso: la planta con mayor Ms (o una inestable, si las hay)
+    peor = int(np.argmax(np.where(resultado['estable'], resultado['ms'], np.inf)))
+    estado = "inestable" if not resultado['estable'][peor] else f"Ms = {resultado['ms'][peor]:.2f}"
+    print(f"   Peor planta de {n}: K = {respuestas.K[peor]:.4f}, T = {respuestas.T[peor]:.3f} s, "
+          f"L = {respuestas.L[peor]:.3f} s ({estado}, GM = {resultado['gm_db'][peor]:.1f} dB, "
+          f"PM = {resultado['pm'][peor]:.1f}°)")
+    return peor
+
+
+def graficar(respuestas, resultado, ganancias, ruta=None, mostrar=True, ms_max=MS_MAX,
+             curvas=CURVAS_NYQUIST, semilla=0):
+    """Histogramas de GM, PM y Ms y diagrama de Nyquist con las plantillas de la incertidumbre."""
+    import matplotlib.pyplot as plt
+
+    KP, KI, KD = ganancias
+    estable = resultado['estable']
+    fig = plt.figure(figsize=(15, 9))
+    fig.suptitle(f"Robustez Monte Carlo ({len(respuestas)} plantas, retardo exacto) — "
+                 f"KP={KP:g} KI={KI:g} KD={KD:g}", fontsize=14, fontweight='bold')
+    ax_gm = fig.add_subplot(2, 3, 1)
+    ax_pm = fig.add_subplot(2, 3, 2)
+    ax_ms = fig.add_subplot(2, 3, 3)
+    ax_ny = fig.add_subplot(2, 3, (4, 5))
+    ax_bode = fig.add_subplot(2, 3, 6)
+
+    for ax, nombre, titulo, limite in ((ax_gm, 'gm_db', 'Margen de Ganancia [dB]', GM_MIN_DB),
+                                       (ax_pm, 'pm', 'Margen de Fase [°]', PM_MIN),
+                                       (ax_ms, 'ms', 'Pico de sensibilidad Ms', ms_max)):
+        valores = resultado[nombre][estable]
+        valores = valores[np.isfinite(valores)]
+        ax.hist(valores, bins=60, color='steelblue', alpha=0.8)
+        ax.axvline(limite, color='r', linestyle='--', linewidth=1.5, label=f'límite {limite:g}')
+        ax.axvline(resultado[nombre][0], color='k', linewidth=1.5, label='nominal')
+        ax.set_title(titulo)
+        ax.legend(fontsize=8)
+        ax.grid(True, alpha=0.3)
+
+    # Nyquist: algunas plantas al azar, la nominal, la peor y las plantillas
+    rng = np.random.default_rng(semilla)
+    filas = rng.choice(len(respuestas), size=min(curvas, len(respuestas)), replace=False)
+    for curva in lazo(respuestas, filas, KP, KI, KD):
+        ax_ny.plot(curva.real, curva.imag, color='gray', alpha=0.15, linewidth=0.6)
+    peor = int(np.argmax(np.where(estable, resultado['ms'], np.inf)))
+    nominal, peor_curva = lazo(respuestas, [0, peor], KP, KI, KD)
+    ax_ny.plot(nominal.real, nominal.imag, 'b-', linewidth=2, label='Nominal')
+    ax_ny.plot(peor_curva.real, peor_curva.imag, 'r-', linewidth=1.5,
+               label=f'Peor planta (Ms = {resultado["ms"][peor]:.2f})')
+
+    magnitud, fase = envolvente_nyquist(respuestas, KP, KI, KD)
+    # Plantillas alrededor del cruce de ganancia nominal, donde se decide la robustez
+    wcp = resultado['wcp'][0]
+    for w in np.geomspace(wcp / 4, wcp * 4, 9):
+        k = int(np.argmin(np.abs(respuestas.omega - w)))
+        m = np.linspace(magnitud[0, k], magnitud[1, k], 20)
+        a = np.radians(np.linspace(fase[0, k], fase[1, k], 20))
+        borde = np.concatenate([m[0] * np.exp(1j * a), m * np.exp(1j * a[-1]),
+                                m[-1] * np.exp(1j * a[::-1]), m[::-1] * np.exp(1j * a[0])])
+        ax_ny.fill(borde.real, borde.imag, color='orange', alpha=0.35, linewidth=0)
+    banda = f'p{PERCENTILES_ENVOLVENTE[0]:g}–p{PERCENTILES_ENVOLVENTE[1]:g}'
+    ax_ny.fill([], [], color='orange', alpha=0.35, label=f'Plantillas {banda}')
+
+    circulo = np.exp(1j * np.linspace(0, 2 * np.pi, 200))
+    ax_ny.plot(-1 + circulo.real / ms_max, circulo.imag / ms_max, 'r--', linewidth=1,
+               label=f'Ms = {ms_max:g}')
+    ax_ny.plot(-1, 0, 'r+', markersize=14, markeredgewidth=2)
+    ax_ny.set_xlim(-3, 1.5)
+    ax_ny.set_ylim(-2.5, 1)
+    ax_ny.set_aspect('equal')
+    ax_ny.set_xlabel('Re L(jω)')
+    ax_ny.set_ylabel('Im L(jω)')
+    ax_ny.set_title('Diagrama de Nyquist')
+    ax_ny.legend(loc='lower right', fontsize=8)
+    ax_ny.grid(True, alpha=0.3)
+
+    # Envolvente de |L(jω)| en frecuencia
+    omega = respuestas.omega
+    ax_bode.fill_between(omega, 20 * np.log10(magnitud[0]), 20 * np.log10(magnitud[1]),
+                         color='orange', alpha=0.5, label=banda)
+    ax_bode.semilogx(omega, 20 * np.log10(np.abs(nominal)), 'b-', linewidth=1.5, label='Nominal')
+    ax_bode.axhline(0, color='k', linewidth=0.8)
+    ax_bode.set_xlabel('ω [rad/s]')
+    ax_bode.set_ylabel('|L(jω)| [dB]')
+    ax_bode.set_title('Envolvente de magnitud')
+    ax_bode.legend(fontsize=8)
+    ax_bode.grid(True, which='both', alpha=0.3)
+
+    plt.tight_layout()
+    if ruta:
+        fig.savefig(ruta, dpi=120)
+        print(f"✅ Gráfica guardada en {ruta}")
+    if mostrar:
+        plt.show()
+    return fig
+
+
+def leer_ganancias(texto):
+    """Convierte 'KP,KI,KD' en una tupla de 3 floats."""
+    partes = texto.split(',')
+    if len(partes) != 3:
+        raise argparse.ArgumentTypeError(f"Ganancias inválidas {texto!r}: use 'KP,KI,KD'")
+    return tuple(float(p) for p in partes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Robustez del PID por Monte Carlo sobre la incertidumbre de la planta")
+    parser.add_argument('--ganancias', type=leer_ganancias, action='append', metavar='KP,KI,KD',
+                        help="Ganancias a evaluar (se puede repetir; por defecto las del firmware)")
+    parser.add_argument('--modelo', metavar='JSON',
+                        help="Modelo identificado: nominal y dispersión desde sus intervalos del 95%%")
+    parser.add_argument('--K', type=float, default=nominales.K)
+    parser.add_argument('--T', type=float, default=nominales.T)
+    parser.add_argument('--L', type=float, default=nominales.L)
+    parser.add_argument('--dispersion', type=float, nargs=3, default=None, metavar=('K', 'T', 'L'),
+                        help=f"Desviación relativa de K, T y L (por defecto {DISPERSION})")
+    parser.add_argument('--muestras', type=int, default=MUESTRAS)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--puntos', type=int, default=PUNTOS_OMEGA, help="Frecuencias de la grilla")
+    parser.add_argument('--ms-max', type=float, default=MS_MAX, help="Límite de Ms del informe")
+    parser.add_argument('--salida', default=None, help="Archivo .npz con las muestras y resultados")
+    parser.add_argument('--grafica', default=None, help="Archivo de imagen (primer juego de ganancias)")
+    parser.add_argument('--sin-ventana', action='store_true', help="No abrir la ventana de gráficos")
+    args = parser.parse_args(argv)
+
+    nominal = (args.K, args.T, args.L)
+    dispersion = args.dispersion
+    if args.modelo:
+        from identificacion import ModeloFOPDT
+        modelo = ModeloFOPDT.cargar(args.modelo)
+        nominal = (modelo.K, modelo.T, modelo.L)
+        if dispersion is None:
+            dispersion = dispersion_de_modelo(modelo)
+    dispersion = tuple(dispersion or DISPERSION)
+    ganancias = args.ganancias or [(nominales.KP, nominales.KI, nominales.KD)]
+
+    print(f"📊 {args.muestras} plantas alrededor de K={nominal[0]:.4f} T={nominal[1]:.3f} s "
+          f"L={nominal[2]:.3f} s (dispersión {', '.join(f'{d:.0%}' for d in dispersion)})")
+    t0 = time.perf_counter()
+    K, T, L = muestrear_plantas(args.muestras, nominal, dispersion, args.semilla)
+    omega = grilla_omega(OMEGA_MIN, OMEGA_MAX, args.puntos)
+    respuestas = RespuestasPlantas(K, T, L, omega)
+    print(f"   Respuestas en frecuencia ({args.puntos} frecuencias, retardo exacto): "
+          f"{time.perf_counter() - t0:.2f} s, {respuestas.bytes / 2**20:.0f} MB en caché")
+
+    resultados = []
+    for KP, KI, KD in ganancias:
+        t0 = time.perf_counter()
+        resultado = evaluar(respuestas, KP, KI, KD)
+        dt = time.perf_counter() - t0
+        print(f"\n🔍 KP={KP:g} KI={KI:g} KD={KD:g} ({dt:.2f} s, {len(respuestas) / dt:.0f} plantas/s)")
+        imprimir_resumen(resumen(resultado, ms_max=args.ms_max), respuestas, resultado,
+                         ms_max=args.ms_max)
+        resultados.append(resultado)
+
+    if args.salida:
+        columnas = ('gm_db', 'pm', 'wcg', 'wcp', 'ms', 'w_ms', 'estable')
+        np.savez_compressed(args.salida, K=K, T=T, L=L, ganancias=np.array(ganancias),
+                            **{c: np.stack([r[c] for r in resultados]) for c in columnas})
+        print(f"\n💾 Resultados guardados en {args.salida} (una fila por juego de ganancias)")
+
+    if args.grafica or not args.sin_ventana:
+        graficar(respuestas, resultados[0], ganancias[0], ruta=args.grafica,
+                 mostrar=not args.sin_ventana, ms_max=args.ms_max, semilla=args.semilla)
+
+
+if __name__ == '__main__':
+    main()
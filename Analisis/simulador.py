@@ -0,0 +1,309 @@
+"""
+Simulador en lazo cerrado del firmware (calcular_pid) con la planta FOPDT.
+
+El análisis de estabilidad usa un modelo lineal con aproximación de Padé,
+pero el controlador real de temperature_pid.ino tiene no linealidades que
+cambian el sobreimpulso y el tiempo de establecimiento:
+
+- Derivativo sobre la medición, limitado a ±50.
+- Anti-windup condicional: zona muerta (|error| < 0.15), factor 1.5 si la
+  temperatura supera el setpoint con salida alta, descarga rápida (x1.2)
+  cuando está saturado arriba con error negativo, integral limitada a ±15.
+- Salida saturada entre 0 y 255 y truncada a entero por analogWrite().
+- Lectura del sensor con ADC de 10 bits y filtro de promedio de 3 muestras
+  (que arranca con ceros, igual que el firmware).
+
+Aquí se reproduce exactamente esa lógica en tiempo discreto (período de
+100 ms) y se la conecta a la planta K/(T·s + 1)·e^(-L·s) con una línea de
+retardo real (no Padé). Todo está vectorizado sobre escenarios: cada
+parámetro puede ser un arreglo de S valores (ganancias, planta, setpoint,
+perturbaciones) y se simulan los S casos a la vez.
+
+Uso:
+    python simulador.py --kp 1:3:5 --ki 3:8:5 --duracion 60
+"""
+import argparse
+
+import numpy as np
+
+from barrido_ganancias import leer_rango
+from nominales import KP, KI, KD, K, T, L, PERIODO
+
+# Constantes del firmware (temperature_pid.ino)
+SETPOINT = 28.0
+LIMITE_DERIVATIVO = 50.0
+LIMITE_INTEGRAL = 15.0
+ZONA_MUERTA = 0.15
+SALIDA_MAX = 255.0
+
+T_AMBIENTE = 20.0
+
+VARIABLES = ('temperatura', 'medida', 'setpoint', 'error', 'p', 'i', 'd', 'total', 'salida')
+
+
+def perfil_escalon(duracion, t_escalon, antes, despues, periodo=PERIODO):
+    """Perfil (1, N) que vale `antes` hasta t_escalon y `despues` desde entonces."""
+    t = np.arange(int(round(duracion / periodo))) * periodo
+    return np.where(t < t_escalon, antes, despues)[None, :]
+
+
+def _como_matriz(valor, S, N):
+    """Difunde un escalar, un arreglo (S,), (1, N) o (S, N) a la forma (S, N)."""
+    valor = np.asarray(valor, dtype=np.float64)
+    if valor.ndim == 1:
+        valor = valor[:, None]
+    return np.broadcast_to(valor, (S, N))
+
+
+class ResultadoSimulacion:
+    """
+    Trayectorias de una simulación.
+
+    t es (N,) y cada variable de VARIABLES es (S, N): temperatura real de la
+    planta, medida (después del ADC y del filtro), setpoint, error, p, i, d,
+    total (antes de saturar) y salida aplicada (0-255).
+    """
+
+    def __init__(self, t, **series):
+        self.t = t
+        for nombre in VARIABLES:
+            setattr(self, nombre, series[nombre])
+
+    @property
+    def escenarios(self):
+        return self.temperatura.shape[0]
+
+    def escenario(self, s):
+        """Trayectorias (N,) del escenario s como diccionario."""
+        return {nombre: getattr(self, nombre)[s] for nombre in VARIABLES}
+
+
+def simular(kp=KP, ki=KI, kd=KD, k=K, tau=T, retardo=L, setpoint=SETPOINT,
+            t_ambiente=T_AMBIENTE, perturbacion=0.0, duracion=60.0, temp_inicial=None,
+            periodo=PERIODO, subpasos=10, cuantizar_adc=True, filtrar=True):
+    """
+    Simula S escenarios del firmware en lazo cerrado con la planta FOPDT.
+
+    kp, ki, kd: ganancias (escalar o arreglo (S,)).
+    k, tau, retardo: planta K [°C/%PWM], T [s] y L [s] (escalar o (S,)).
+    setpoint, perturbacion: escalar, (S,), (1, N) o (S, N). La perturbación se
+        suma a la entrada de la planta en °C de régimen (p.ej. -3 = una
+        ventana abierta que enfría 3 °C en estado estacionario).
+    t_ambiente, temp_inicial: temperatura ambiente y de arranque [°C].
+    subpasos: pasos de integración de la planta por período de control; el
+        retardo se redondea a múltiplos de periodo/subpasos.
+    Devuelve un ResultadoSimulacion. Lanza ValueError si algún escenario no
+    tiene K > 0, T > 0 y L >= 0 (la perturbación se divide por K).
+    """
+    N = int(round(duracion / periodo))
+    escalares = [np.atleast_1d(np.asarray(x, dtype=np.float64))
+                 for x in (kp, ki, kd, k, tau, retardo, t_ambiente)]
+    # Número de escenarios: el largo de cualquier parámetro que sea arreglo
+    S = max([len(x) for x in escalares] +
+            [np.shape(v)[0] for v in (setpoint, perturbacion) if np.ndim(v) >= 1])
+    kp, ki, kd, k, tau, retardo, t_ambiente = (np.broadcast_to(x, (S,)) for x in escalares)
+    invalidos = np.flatnonzero(~((k > 0) & (tau > 0) & (retardo >= 0)))
+    if len(invalidos):
+        i = invalidos[0]
+        raise ValueError(f"Planta inválida en {len(invalidos)} escenario(s) (p.ej. #{i}: "
+                         f"K={k[i]:g}, T={tau[i]:g}, L={retardo[i]:g}); "
+                         f"se necesita K > 0, T > 0 y L >= 0")
+    sp = _como_matriz(setpoint, S, N)
+    pert = _como_matriz(perturbacion, S, N)
+    temp0 = t_ambiente if temp_inicial is None else np.broadcast_to(
+        np.asarray(temp_inicial, dtype=np.float64), (S,))
+
+    # --- Planta: discretización exacta (ZOH) y línea de retardo ---
+    dt_planta = periodo / subpasos
+    a = np.exp(-dt_planta / tau)
+    pasos_retardo = np.rint(retardo / dt_planta).astype(int)
+    largo = int(pasos_retardo.max()) + 1
+    historial_u = np.zeros((S, largo))   # Entrada de la planta (% PWM + perturbación)
+    filas = np.arange(S)
+    x = temp0 - t_ambiente               # Desvío respecto del ambiente [°C]
+    paso_planta = 0
+
+    # --- Estado del firmware ---
+    filtro = np.zeros((S, 3))
+    idx_filtro = 0
+    integral = np.zeros(S)
+
+    def leer_temperatura():
+        """analogRead + conversión + promedio de 3 muestras, como leer_temperatura()."""
+        nonlocal idx_filtro
+        temp = t_ambiente + x
+        if cuantizar_adc:
+            adc = np.clip(np.floor(temp * 1024.0 / 100.0), 0, 1023)
+            temp = (adc * 5.0 / 1024.0) * 20.0
+        if not filtrar:
+            return temp
+        filtro[:, idx_filtro] = temp
+        idx_filtro = (idx_filtro + 1) % 3
+        return filtro.sum(axis=1) / 3.0
+
+    # setup(): temp_anterior = leer_temperatura()
+    temp_anterior = leer_temperatura()
+
+    series = {nombre: np.empty((S, N)) for nombre in VARIABLES}
+    for n in range(N):
+        temp = leer_temperatura()
+        sp_n = sp[:, n]
+
+        # ---------------- calcular_pid() ----------------
+        error = sp_n - temp
+        error_abs = np.abs(error)
+        p = kp * error
+        d = np.clip(kd * ((temp_anterior - temp) / periodo), -LIMITE_DERIVATIVO, LIMITE_DERIVATIVO)
+        salida_temp = p + ki * integral + d
+        factor = np.where(error_abs < ZONA_MUERTA, error_abs / ZONA_MUERTA, 1.0)
+        factor = np.where((error < 0) & (salida_temp > 70.0), factor * 1.5, factor)
+        no_saturado = (salida_temp < SALIDA_MAX) & (salida_temp > 0.0)
+        saturado_alto = (salida_temp >= SALIDA_MAX) & (error < 0)
+        saturado_bajo = (salida_temp <= 0.0) & (error > 0)
+        integral += np.where(no_saturado, error * periodo * factor,
+                             np.where(saturado_alto, error * periodo * 1.2,
+                                      np.where(saturado_bajo, error * periodo, 0.0)))
+        np.clip(integral, -LIMITE_INTEGRAL, LIMITE_INTEGRAL, out=integral)
+        i = ki * integral
+        total = p + i + d
+        salida = np.clip(total, 0.0, SALIDA_MAX)
+        temp_anterior = temp
+        # -------------------------------------------------
+
+        series['temperatura'][:, n] = t_ambiente + x
+        series['medida'][:, n] = temp
+        series['setpoint'][:, n] = sp_n
+        series['error'][:, n] = error
+        series['p'][:, n] = p
+        series['i'][:, n] = i
+        series['d'][:, n] = d
+        series['total'][:, n] = total
+        series['salida'][:, n] = salida
+
+        # analogWrite((int)salida): PWM entero, convertido a % para la planta
+        u = np.floor(salida) * 100.0 / SALIDA_MAX + pert[:, n] / k
+        for _ in range(subpasos):
+            historial_u[:, paso_planta % largo] = u
+            u_retardada = historial_u[filas, (paso_planta - pasos_retardo) % largo]
+            x = a * x + (1.0 - a) * k * u_retardada
+            paso_planta += 1
+
+    return ResultadoSimulacion(np.arange(N) * periodo, **series)
+
+
+def metricas_respuesta(t, y, setpoint, banda=0.02, t_inicio=0.0):
+    """
+    Métricas de la respuesta a un escalón, vectorizadas sobre escenarios.
+
+    t: (N,), y: (S, N) temperatura, setpoint: escalar o (S,) valor final.
+    Se mide desde t_inicio (instante del escalón) con y0 = y en ese instante.
+    Devuelve un dict de arreglos (S,): sobreimpulso [%], t_subida (10-90%),
+    t_establecimiento (banda ±banda·|Δ|), error_estacionario (promedio del
+    último 10%), iae, ise, itae.
+    """
+    y = np.atleast_2d(y)
+    desde = int(np.searchsorted(t, t_inicio))
+    t = t[desde:] - t[desde]
+    y = y[:, desde:]
+    sp = np.broadcast_to(np.asarray(setpoint, dtype=np.float64), (y.shape[0],))[:, None]
+    y0 = y[:, :1]
+    salto = sp - y0
+    signo = np.where(salto >= 0, 1.0, -1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avance = (y - y0) / salto          # 0 al inicio, 1 en el setpoint
+
+    sobreimpulso = np.maximum(np.max(signo * (y - sp), axis=1) / np.abs(salto[:, 0]), 0) * 100
+
+    def primer_cruce(nivel):
+        llego = avance >= nivel
+        idx = np.argmax(llego, axis=1)
+        return np.where(llego.any(axis=1), t[idx], np.nan)
+    t_subida = primer_cruce(0.9) - primer_cruce(0.1)
+
+    fuera = np.abs(y - sp) > banda * np.abs(salto)
+    ultimo_fuera = y.shape[1] - 1 - np.argmax(fuera[:, ::-1], axis=1)
+    t_establecimiento = np.where(~fuera.any(axis=1), 0.0,
+                                 np.where(ultimo_fuera == y.shape[1] - 1, np.nan,
+                                          t[np.minimum(ultimo_fuera + 1, len(t) - 1)]))
+
+    cola = max(1, y.shape[1] // 10)
+    error = sp - y
+    dt = np.diff(t, prepend=t[0])
+    return {
+        'sobreimpulso': sobreimpulso,
+        't_subida': t_subida,
+        't_establecimiento': t_establecimiento,
+        'error_estacionario': error[:, -cola:].mean(axis=1),
+        'iae': np.sum(np.abs(error) * dt, axis=1),
+        'ise': np.sum(error ** 2 * dt, axis=1),
+        'itae': np.sum(t * np.abs(error) * dt, axis=1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Simulación en lazo cerrado del firmware PID con la planta FOPDT",
+        epilog="Cada parámetro acepta un valor o un rango 'inicio:fin:n'; "
+               "se simula el producto cartesiano de todos los rangos.")
+    parser.add_argument('--kp', type=leer_rango, default=np.array([KP]))
+    parser.add_argument('--ki', type=leer_rango, default=np.array([KI]))
+    parser.add_argument('--kd', type=leer_rango, default=np.array([KD]))
+    parser.add_argument('--K', type=leer_rango, default=np.array([K]))
+    parser.add_argument('--T', type=leer_rango, default=np.array([T]))
+    parser.add_argument('--L', type=leer_rango, default=np.array([L]))
+    parser.add_argument('--setpoint', type=float, default=SETPOINT)
+    parser.add_argument('--ambiente', type=float, default=T_AMBIENTE)
+    parser.add_argument('--duracion', type=float, default=60.0)
+    parser.add_argument('--perturbacion', type=float, default=0.0,
+                        help="Escalón de perturbación [°C de régimen] a mitad de la simulación")
+    parser.add_argument('--grafica', default=None, help="Archivo de imagen con las trayectorias")
+    parser.add_argument('--sin-ventana', action='store_true')
+    args = parser.parse_args(argv)
+
+    mallas = np.meshgrid(args.kp, args.ki, args.kd, args.K, args.T, args.L, indexing='ij')
+    kp, ki, kd, k, tau, retardo = (m.ravel() for m in mallas)
+    perturbacion = perfil_escalon(args.duracion, args.duracion / 2, 0.0, args.perturbacion)
+    print(f"📊 Simulando {len(kp)} escenario(s) de {args.duracion:g} s...")
+    try:
+        r = simular(kp, ki, kd, k, tau, retardo, setpoint=args.setpoint, t_ambiente=args.ambiente,
+                    perturbacion=perturbacion, duracion=args.duracion)
+    except ValueError as e:
+        parser.error(str(e))
+    fin_escalon = args.duracion / 2 if args.perturbacion else args.duracion
+    m = metricas_respuesta(r.t[r.t < fin_escalon], r.temperatura[:, r.t < fin_escalon],
+                           args.setpoint)
+
+    print(f"\n{'':>22}{'mín':>10}{'mediana':>10}{'máx':>10}")
+    for nombre, unidad in (('sobreimpulso', '%'), ('t_subida', 's'), ('t_establecimiento', 's'),
+                           ('error_estacionario', '°C'), ('itae', '')):
+        v = m[nombre]
+        print(f"{nombre + (f' [{unidad}]' if unidad else ''):>22}"
+              f"{np.nanmin(v):>10.3f}{np.nanmedian(v):>10.3f}{np.nanmax(v):>10.3f}")
+    sin_establecer = np.isnan(m['t_establecimiento']).sum()
+    if sin_establecer:
+        print(f"⚠️  {sin_establecer} escenario(s) no se establecen dentro de la banda del 2%")
+
+    if args.grafica or not args.sin_ventana:
+        import matplotlib.pyplot as plt
+        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+        fig.suptitle('Simulación del Firmware en Lazo Cerrado', fontsize=16)
+        mostrar = np.linspace(0, r.escenarios - 1, min(r.escenarios, 20)).astype(int)
+        ax1.plot(r.t, r.temperatura[mostrar].T, alpha=0.7)
+        ax1.axhline(args.setpoint, color='b', linestyle='--', label='Setpoint')
+        ax1.set_ylabel('Temperatura [°C]')
+        ax1.grid(True)
+        ax1.legend()
+        ax2.plot(r.t, r.salida[mostrar].T * 100.0 / SALIDA_MAX, alpha=0.7)
+        ax2.set_ylabel('Salida PWM [%]')
+        ax2.set_xlabel('Tiempo [s]')
+        ax2.grid(True)
+        plt.tight_layout()
+        if args.grafica:
+            fig.savefig(args.grafica, dpi=120)
+            print(f"✅ Gráfica guardada en {args.grafica}")
+        if not args.sin_ventana:
+            plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""
+Sintonía automática de las ganancias PID sobre el modelo FOPDT.
+
+Busca KP, KI y KD que minimicen
+
+    J = ITAE + PESO_SOBREIMPULSO · sobreimpulso[%]
+
+de la simulación en lazo cerrado del firmware (simulador.py, con todas sus
+no linealidades), sujeto a GM >= GM_MIN_DB y PM >= PM_MIN. Las restricciones
+se evalúan con barrido_ganancias.evaluar(), que da los mismos márgenes que
+ct.margin pero vectorizado; la solución final se verifica con ct.margin
+sobre el mismo modelo que usa analizar_estabilidad() (Padé de 1er orden).
+Con --retardo exacto las restricciones usan e^(-jωL) sin aproximar, que es
+más exigente: con Padé de 1er orden la fase casi nunca cruza -180°.
+
+BÚSQUEDA (método de entropía cruzada):
+1. Se evalúan N candidatos uniformes dentro de LIMITES más las ganancias
+   actuales del firmware.
+2. En cada iteración se toma la élite (el mejor 10%), se ajusta una normal a
+   esas ganancias y se muestrean N candidatos nuevos; la dispersión se achica
+   hasta la resolución de las constantes.
+Los candidatos que violan las restricciones no se descartan: se penalizan
+según cuánto les falta, para que la búsqueda sepa hacia dónde moverse.
+
+CACHÉ:
+Cada candidato se redondea a RESOLUCION (la precisión con la que se escriben
+las constantes en el .ino) antes de evaluarlo, y sus métricas se guardan con
+la clave (ganancias redondeadas, K, T, L, escenario). Los candidatos repetidos
+o vecinos que caen en la misma celda no se vuelven a simular, y la caché se
+puede guardar en disco (--cache) para reutilizarla entre ejecuciones. Se
+guardan las métricas y no el costo, así que cambiar los pesos o las
+restricciones no invalida la caché.
+
+Los lotes que faltan se simulan vectorizados y se reparten entre procesos
+(--procesos).
+
+Uso:
+    python sintonia.py --modelo modelo.json --procesos 4 --cache sintonia.npz
+    python sintonia.py --K 0.35 --T 1.0 --L 0.1 --gm-min 6 --pm-min 45
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import control as ct
+import numpy as np
+
+from barrido_ganancias import evaluar
+from simulador import simular, metricas_respuesta, perfil_escalon, SETPOINT, T_AMBIENTE
+# Ganancias actuales del firmware (punto de partida) y planta nominal
+from nominales import KP, KI, KD, K, T, L
+
+# Restricciones de robustez
+GM_MIN_DB = 6.0
+PM_MIN = 45.0
+# Peso del sobreimpulso [%] frente al ITAE
+PESO_SOBREIMPULSO = 5.0
+# Penalización por unidad de violación relativa de las restricciones
+PENALIZACION = 1e3
+
+# Espacio de búsqueda y resolución de las constantes del firmware (KP, KI, KD)
+LIMITES = np.array([[0.1, 10.0], [0.0, 20.0], [0.0, 2.0]])
+RESOLUCION = np.array([0.01, 0.01, 0.005])
+
+# Escenario simulado: escalón desde el ambiente hasta el setpoint
+DURACION = 60.0
+
+# Columnas del resultado de cada evaluación (lo que se guarda en la caché)
+COLUMNAS = ('itae', 'sobreimpulso', 't_establecimiento', 'gm_db', 'pm')
+_COL = {nombre: i for i, nombre in enumerate(COLUMNAS)}
+
+
+def cuantizar(ganancias):
+    """Redondea ganancias (n, 3) a la resolución de las constantes del firmware."""
+    return np.round(np.asarray(ganancias) / RESOLUCION) * RESOLUCION
+
+
+# Largo de las claves: 3 ganancias + K, T, L + setpoint, ambiente, duración,
+# perturbación + modelo de retardo
+LARGO_CLAVE = 11
+
+
+def _claves(ganancias, planta, escenario):
+    """
+    Claves enteras de la caché: ganancias en pasos de RESOLUCION, y planta y
+    escenario en millonésimas.
+    """
+    pasos = np.rint(np.asarray(ganancias) / RESOLUCION).astype(np.int64)
+    contexto = list(planta) + [escenario[c] for c in ('setpoint', 't_ambiente', 'duracion',
+                                                      'perturbacion')]
+    contexto.append(escenario['retardo'] == 'exacto')
+    contexto = tuple(np.rint(np.asarray(contexto, dtype=np.float64) * 1e6).astype(np.int64).tolist())
+    return [tuple(fila) + contexto for fila in pasos.tolist()]
+
+
+class CacheEvaluaciones:
+    """
+    Memoria de evaluaciones: clave (ganancias cuantizadas + planta) -> fila de COLUMNAS.
+
+    Se puede guardar y cargar como .npz para reutilizarla entre ejecuciones.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self.valores = {}
+        self.aciertos = 0
+        self.fallos = 0
+        if ruta and os.path.exists(ruta):
+            with np.load(ruta) as datos:
+                claves, valores = datos['claves'], datos['valores']
+            if claves.shape[1:] != (LARGO_CLAVE,) or valores.shape[1:] != (len(COLUMNAS),):
+                print(f"⚠️ La caché {ruta} tiene otro formato; se empieza de cero")
+                return
+            for clave, fila in zip(claves.tolist(), valores):
+                self.valores[tuple(clave)] = fila
+
+    def __len__(self):
+        return len(self.valores)
+
+    def guardar(self, ruta=None):
+        ruta = ruta or self.ruta
+        if not ruta or not self.valores:
+            return
+        claves = np.array(list(self.valores.keys()), dtype=np.int64)
+        valores = np.array(list(self.valores.values()), dtype=np.float64)
+        np.savez_compressed(ruta, claves=claves, valores=valores)
+
+
+def evaluar_candidatos(ganancias, planta, escenario):
+    """
+    Simula candidatos (n, 3) sobre una planta (K, T, L). Devuelve (n, len(COLUMNAS)).
+
+    escenario: dict con setpoint, t_ambiente, duracion, perturbacion (°C de
+    régimen, escalón a mitad de la simulación) y retardo ('pade' | 'exacto')
+    para los márgenes.
+    """
+    kp, ki, kd = ganancias.T
+    k, tau, retardo = planta
+    n = len(kp)
+    gm, pm, _, _ = evaluar(kp, ki, kd, np.full(n, k), np.full(n, tau), np.full(n, retardo),
+                           retardo=escenario['retardo'])
+    with np.errstate(divide='ignore'):
+        gm_db = 20 * np.log10(gm)
+
+    perturbacion = 0.0
+    if escenario['perturbacion']:
+        perturbacion = perfil_escalon(escenario['duracion'], escenario['duracion'] / 2,
+                                      0.0, escenario['perturbacion'])
+    r = simular(kp, ki, kd, k, tau, retardo, setpoint=escenario['setpoint'],
+                t_ambiente=escenario['t_ambiente'], perturbacion=perturbacion,
+                duracion=escenario['duracion'])
+    m = metricas_respuesta(r.t, r.temperatura, escenario['setpoint'])
+    return np.column_stack([m['itae'], np.nan_to_num(m['sobreimpulso'], nan=100.0),
+                            m['t_establecimiento'], gm_db, pm])
+
+
+def costo(resultados, gm_min_db=GM_MIN_DB, pm_min=PM_MIN):
+    """
+    Función objetivo para resultados (n, len(COLUMNAS)).
+
+    Devuelve (J, factible): J = ITAE + PESO_SOBREIMPULSO·sobreimpulso más
+    PENALIZACION por la violación relativa de GM y PM.
+    """
+    itae, sobreimpulso, _, gm_db, pm = np.asarray(resultados).T
+    violacion = (np.maximum(gm_min_db - gm_db, 0) / gm_min_db +
+                 np.maximum(pm_min - pm, 0) / pm_min)
+    violacion = np.nan_to_num(violacion, nan=1.0, posinf=1.0)
+    return itae + PESO_SOBREIMPULSO * sobreimpulso + PENALIZACION * violacion, violacion == 0
+
+
+def _evaluar_bloque(args):
+    """Función de trabajo para el pool de procesos (debe ser de nivel de módulo)."""
+    return evaluar_candidatos(*args)
+
+
+class Sintonizador:
+    """
+    Búsqueda de ganancias con caché y evaluación en paralelo.
+
+    planta: (K, T, L). escenario: ver evaluar_candidatos().
+    procesos: 1 = todo en este proceso; >1 reparte los lotes en un ProcessPoolExecutor.
+    """
+
+    def __init__(self, planta, escenario, cache=None, procesos=1, tam_bloque=64,
+                 gm_min_db=GM_MIN_DB, pm_min=PM_MIN):
+        self.planta = tuple(float(x) for x in planta)
+        self.escenario = escenario
+        self.cache = cache if cache is not None else CacheEvaluaciones()
+        self.procesos = procesos
+        self.tam_bloque = tam_bloque
+        self.gm_min_db = gm_min_db
+        self.pm_min = pm_min
+        self.evaluaciones = 0
+        self._pool = None
+
+    def __enter__(self):
+        if self.procesos > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.procesos)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def evaluar(self, ganancias):
+        """Evalúa candidatos (n, 3) usando la caché. Devuelve (ganancias cuantizadas, resultados)."""
+        ganancias = np.clip(cuantizar(ganancias), LIMITES[:, 0], LIMITES[:, 1])
+        claves = _claves(ganancias, self.planta, self.escenario)
+        faltan = {}
+        for i, clave in enumerate(claves):
+            if clave not in self.cache.valores and clave not in faltan:
+                faltan[clave] = i
+        self.cache.aciertos += len(claves) - len(faltan)
+        self.cache.fallos += len(faltan)
+
+        if faltan:
+            nuevas = ganancias[list(faltan.values())]
+            tareas = [(nuevas[i:i + self.tam_bloque], self.planta, self.escenario)
+                      for i in range(0, len(nuevas), self.tam_bloque)]
+            if self._pool is not None and len(tareas) > 1:
+                partes = list(self._pool.map(_evaluar_bloque, tareas))
+            else:
+                partes = [_evaluar_bloque(t) for t in tareas]
+            for clave, fila in zip(faltan, np.concatenate(partes)):
+                self.cache.valores[clave] = fila
+            self.evaluaciones += len(nuevas)
+
+        return ganancias, np.array([self.cache.valores[c] for c in claves])
+
+    def costo(self, resultados):
+        """(J, factible) con las restricciones de este sintonizador."""
+        return costo(resultados, self.gm_min_db, self.pm_min)
+
+    def sintonizar(self, inicial=(KP, KI, KD), candidatos=256, iteraciones=20,
+                   fraccion_elite=0.1, semilla=0, paciencia=4, verbose=True):
+        """
+        Búsqueda por entropía cruzada.
+
+        Devuelve (ganancias (3,), resultados (len(COLUMNAS),), J, factible) del mejor candidato.
+        """
+        rng = np.random.default_rng(semilla)
+        bajo, alto = LIMITES[:, 0], LIMITES[:, 1]
+        muestras = np.vstack([np.asarray(inicial, dtype=np.float64)[None, :],
+                              rng.uniform(bajo, alto, size=(candidatos - 1, 3))])
+        mejor_g, mejor_r, mejor_j = None, None, np.inf
+        sin_mejora = 0
+        n_elite = max(2, int(candidatos * fraccion_elite))
+        for it in range(iteraciones):
+            ganancias, resultados = self.evaluar(muestras)
+            j, _ = self.costo(resultados)
+            orden = np.argsort(j)
+            if mejor_r is None or j[orden[0]] < mejor_j - 1e-9:
+                mejor_g, mejor_r, mejor_j = ganancias[orden[0]], resultados[orden[0]], j[orden[0]]
+                sin_mejora = 0
+            else:
+                sin_mejora += 1
+            if verbose:
+                print(f"   iteración {it + 1:2d}: J = {mejor_j:9.3f}  "
+                      f"KP={mejor_g[0]:.2f} KI={mejor_g[1]:.2f} KD={mejor_g[2]:.3f}  "
+                      f"(caché: {len(self.cache)} puntos, {self.cache.aciertos} aciertos)")
+            elite = ganancias[orden[:n_elite]]
+            media = elite.mean(axis=0)
+            desvio = np.maximum(elite.std(axis=0), RESOLUCION)
+            if sin_mejora >= paciencia or np.all(desvio <= 2 * RESOLUCION):
+                break
+            muestras = np.clip(rng.normal(media, desvio, size=(candidatos, 3)), bajo, alto)
+            muestras[0] = mejor_g  # Conservar siempre el mejor
+        return mejor_g, mejor_r, mejor_j, bool(self.costo(mejor_r[None, :])[1][0])
+
+
+def verificar_con_control(ganancias, planta):
+    """GM [dB], PM [°] con ct.margin sobre el modelo de analizar_estabilidad() (Padé 1er orden)."""
+    kp, ki, kd = ganancias
+    k, tau, retardo = planta
+    s = ct.TransferFunction.s
+    n_pade, d_pade = ct.pade(retardo, 1)
+    L_s = (kp + ki / s + kd * s) * (k / (tau * s + 1)) * ct.TransferFunction(n_pade, d_pade)
+    gm, pm, _, _ = ct.margin(L_s)
+    gm_db = np.inf if np.isinf(gm) or np.isnan(gm) else 20 * np.log10(gm)
+    return gm_db, pm
+
+
+def constantes_firmware(ganancias, planta, resultado):
+    """Texto listo para pegar en temperature_pid.ino y en analisis.py."""
+    kp, ki, kd = ganancias
+    k, tau, retardo = planta
+    r = dict(zip(COLUMNAS, resultado))
+    gm = '∞' if np.isinf(r['gm_db']) else f"{r['gm_db']:.1f}"
+    encabezado = (f"Sintonía automática para K={k:.3f} T={tau:.2f} s L={retardo:.3f} s: "
+                  f"GM={gm} dB PM={r['pm']:.1f}° ITAE={r['itae']:.1f} "
+                  f"sobreimpulso={r['sobreimpulso']:.1f}%")
+    return (f"// {encabezado}\n"
+            f"const float KP = {kp:.2f};\n"
+            f"const float KI = {ki:.2f};\n"
+            f"const float KD = {kd:.3f};\n"
+            f"\n"
+            f"# {encabezado}\n"
+            f"KP = {kp:.2f}\n"
+            f"KI = {ki:.2f}\n"
+            f"KD = {kd:.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sintonía automática del PID sobre el modelo FOPDT")
+    parser.add_argument('--modelo', metavar='JSON',
+                        help="Modelo identificado (identificacion.py --guardar)")
+    parser.add_argument('--K', type=float, default=K)
+    parser.add_argument('--T', type=float, default=T)
+    parser.add_argument('--L', type=float, default=L)
+    parser.add_argument('--gm-min', type=float, default=GM_MIN_DB, help="GM mínimo [dB]")
+    parser.add_argument('--pm-min', type=float, default=PM_MIN, help="PM mínimo [°]")
+    parser.add_argument('--setpoint', type=float, default=SETPOINT)
+    parser.add_argument('--ambiente', type=float, default=T_AMBIENTE)
+    parser.add_argument('--duracion', type=float, default=DURACION)
+    parser.add_argument('--perturbacion', type=float, default=0.0,
+                        help="Escalón de perturbación [°C de régimen] a mitad de la simulación")
+    parser.add_argument('--retardo', choices=('pade', 'exacto'), default='pade',
+                        help="Modelo del retardo para las restricciones de GM/PM")
+    parser.add_argument('--candidatos', type=int, default=256, help="Candidatos por iteración")
+    parser.add_argument('--iteraciones', type=int, default=20)
+    parser.add_argument('--procesos', type=int, default=1, help="Procesos en paralelo")
+    parser.add_argument('--cache', default=None, help="Archivo .npz para guardar la caché")
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    planta = (args.K, args.T, args.L)
+    ambiente = args.ambiente
+    if args.modelo:
+        from identificacion import ModeloFOPDT
+        modelo = ModeloFOPDT.cargar(args.modelo)
+        planta = (modelo.K, modelo.T, modelo.L)
+        ambiente = modelo.T_ambiente
+    escenario = {'setpoint': args.setpoint, 't_ambiente': ambiente,
+                 'duracion': args.duracion, 'perturbacion': args.perturbacion,
+                 'retardo': args.retardo}
+
+    print(f"🔧 Sintonizando para K={planta[0]:.3f} T={planta[1]:.2f} s L={planta[2]:.3f} s "
+          f"(GM >= {args.gm_min:g} dB, PM >= {args.pm_min:g}°, {args.procesos} proceso(s))")
+    cache = CacheEvaluaciones(args.cache)
+    if len(cache):
+        print(f"   Caché cargada: {len(cache)} evaluaciones")
+    t0 = time.perf_counter()
+    with Sintonizador(planta, escenario, cache, args.procesos,
+                      gm_min_db=args.gm_min, pm_min=args.pm_min) as sintonizador:
+        actuales = sintonizador.evaluar(np.array([[KP, KI, KD]]))[1][0]
+        j_actual = sintonizador.costo(actuales[None, :])[0][0]
+        ganancias, resultado, j, factible = sintonizador.sintonizar(
+            candidatos=args.candidatos, iteraciones=args.iteraciones, semilla=args.semilla)
+    dt = time.perf_counter() - t0
+    cache.guardar()
+    print(f"✅ {sintonizador.evaluaciones} simulaciones nuevas en {dt:.1f} s "
+          f"({cache.aciertos} resueltas por la caché)")
+
+    print(f"\n{'':>22}{'actual':>12}{'sintonizado':>14}")
+    for nombre, unidad in (('itae', ''), ('sobreimpulso', '%'), ('t_establecimiento', 's'),
+                           ('gm_db', 'dB'), ('pm', '°')):
+        i = _COL[nombre]
+        print(f"{nombre + (f' [{unidad}]' if unidad else ''):>22}"
+              f"{actuales[i]:>12.2f}{resultado[i]:>14.2f}")
+    print(f"{'costo J':>22}{j_actual:>12.2f}{j:>14.2f}")
+
+    en_limite = [nombre for nombre, g, (lo, hi) in zip(('KP', 'KI', 'KD'), ganancias, LIMITES)
+                 if g <= lo + RESOLUCION.max() or g >= hi - RESOLUCION.max()]
+    if en_limite:
+        print(f"\n⚠️  {', '.join(en_limite)} quedó en el borde del espacio de búsqueda "
+              f"(LIMITES); puede convenir ampliarlo.")
+    if not factible:
+        print("\n⚠️  Ningún candidato cumple las restricciones de GM/PM; "
+              "se muestra el que menos las viola.")
+    gm_db, pm = verificar_con_control(ganancias, planta)
+    print(f"\n🔍 Verificación con ct.margin (Padé de 1er orden): GM = {gm_db:.2f} dB, PM = {pm:.2f}°")
+    print("\n📋 Constantes para el firmware y analisis.py:\n")
+    print(constantes_firmware(ganancias, planta, resultado))
+
+
+if __name__ == '__main__':
+    main()
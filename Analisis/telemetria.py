@@ -0,0 +1,402 @@
+"""
+Servidor de telemetría: publica por TCP las tramas del controlador.
+
+Sólo quien está frente a la máquina con matplotlib veía los datos. Aquí la
+captura corre sin ventana (LectorSerial o ReproductorGrabacion en su hilo) y
+un servidor asyncio reparte las tramas ya parseadas a los clientes que se
+suscriban, cada uno con su propia tasa y tamaño de lote:
+
+- Decimación: cada cliente pide una tasa máxima (hz) y recibe la primera
+  muestra de cada intervalo de 1/hz segundos.
+- Lotes: las muestras de cada cliente se juntan y se envían cada `lote`
+  segundos en un solo mensaje.
+- Contrapresión: cada cliente tiene su cola acotada (MAX_LOTES_PENDIENTES
+  bloques). Si un cliente lento no vacía su socket, se descartan sus bloques
+  más antiguos (y se le informa cuántas muestras perdió); ni la captura ni
+  los demás clientes esperan nunca por él.
+
+Protocolo: una línea JSON (UTF-8) por mensaje.
+    cliente -> servidor (opcional, primera línea):  {"hz": 5, "lote": 0.5}
+    servidor -> cliente:  {"tipo": "inicio", "campos": [...], "parametros": {...}}
+                          {"tipo": "lote", "t": [...], "datos": [[...], ...], "descartadas": 0}
+Un cliente que no envía nada en ESPERA_SUSCRIPCION segundos recibe las tramas
+en el formato del firmware (">> temperatura,setpoint,..."), así que también
+sirve como fuente tcp:// de monitor_multi.py.
+
+ClienteTelemetria se conecta al servidor y tiene la misma interfaz que
+LectorSerial: analisis.py --remoto host:puerto muestra el tablero completo
+desde otra máquina.
+
+Uso:
+    python telemetria.py --puerto COM1 --escuchar 0.0.0.0:4001 --grabar sesion.pidrec
+    python telemetria.py --reproducir sesion.pidrec --velocidad 10
+    python analisis.py --remoto 192.168.0.10:4001 --hz 5
+"""
+import argparse
+import asyncio
+import json
+import math
+import socket
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from lector_serial import LectorSerial, MAX_PENDIENTES, extraer_bloques
+from parser_tramas import PREFIJO_DATOS
+from grabacion import Grabador, ReproductorGrabacion, CAMPOS
+from nominales import parametros_nominales
+
+BAUD_RATE = 9600
+DIRECCION = '0.0.0.0:4001'
+# Cada cuánto se vacía el lector y se reparte a los clientes [s]
+PERIODO_PUBLICACION = 0.05
+# Tasa y lote por defecto de un cliente que no pide otra cosa
+HZ_DEFECTO = 0.0  # 0 = todas las muestras
+LOTE_DEFECTO = 0.2  # [s]
+# Bloques pendientes por cliente antes de descartar los más antiguos
+MAX_LOTES_PENDIENTES = 200
+# Tiempo que se espera la línea de suscripción antes de usar el formato del firmware [s]
+ESPERA_SUSCRIPCION = 0.5
+# Espera entre reintentos de conexión del cliente [s]
+ESPERA_RECONEXION = 2.0
+
+
+def separar_direccion(direccion, puerto_defecto=4001):
+    """'host:puerto' -> (host, puerto)."""
+    host, _, puerto = direccion.rpartition(':')
+    if not host:
+        return direccion, puerto_defecto
+    return host, int(puerto)
+
+
+def seleccionar_por_tasa(t, intervalo, ultimo_intervalo):
+    """
+    Índices de la primera muestra de cada intervalo de `intervalo` segundos.
+
+    ultimo_intervalo: número del último intervalo ya enviado (o None).
+    Devuelve (indices, ultimo_intervalo actualizado). Vectorizado.
+    """
+    if intervalo <= 0 or len(t) == 0:
+        return np.arange(len(t)), ultimo_intervalo
+    numero = np.floor(t / intervalo)
+    nuevo = np.empty(len(t), dtype=bool)
+    nuevo[0] = ultimo_intervalo is None or numero[0] > ultimo_intervalo
+    nuevo[1:] = numero[1:] > numero[:-1]
+    idx = np.flatnonzero(nuevo)
+    if len(idx):
+        ultimo_intervalo = numero[idx[-1]]
+    return idx, ultimo_intervalo
+
+
+def formatear_tramas(datos):
+    """Tramas en el formato del firmware ('>> a,b,...\\n') como bytes."""
+    lineas = [PREFIJO_DATOS + ','.join(f"{v:.2f}" for v in fila) for fila in datos.tolist()]
+    return ('\n'.join(lineas) + '\n').encode('ascii')
+
+
+class Suscriptor:
+    """
+    Un cliente conectado: su tasa, su lote y su cola acotada.
+
+    publicar() nunca bloquea: decima el bloque y lo deja en la cola; si la
+    cola está llena se descarta el bloque más antiguo. La tarea enviar() vacía
+    la cola a su ritmo.
+    """
+
+    def __init__(self, escritor, hz=HZ_DEFECTO, lote=LOTE_DEFECTO, formato='json',
+                 max_pendientes=MAX_LOTES_PENDIENTES):
+        self.escritor = escritor
+        self.direccion = escritor.get_extra_info('peername')
+        self.intervalo = 1.0 / hz if hz > 0 else 0.0
+        self.lote = lote
+        self.formato = formato
+        self.pendientes = deque(maxlen=max_pendientes)
+        self.hay_datos = asyncio.Event()
+        self.enviadas = 0
+        self.descartadas = 0
+        self._descartadas_sin_avisar = 0
+        self._ultimo_intervalo = None
+
+    def publicar(self, t, datos):
+        idx, self._ultimo_intervalo = seleccionar_por_tasa(t, self.intervalo, self._ultimo_intervalo)
+        if len(idx) == 0:
+            return
+        if len(idx) < len(t):
+            t, datos = t[idx], datos[idx]
+        if len(self.pendientes) == self.pendientes.maxlen:
+            perdidas = len(self.pendientes[0][0])
+            self.descartadas += perdidas
+            self._descartadas_sin_avisar += perdidas
+        self.pendientes.append((t, datos))
+        self.hay_datos.set()
+
+    def _mensaje(self):
+        bloques = list(self.pendientes)
+        self.pendientes.clear()
+        self.hay_datos.clear()
+        t = np.concatenate([b[0] for b in bloques])
+        datos = np.concatenate([b[1] for b in bloques])
+        self.enviadas += len(t)
+        if self.formato == 'tramas':
+            return formatear_tramas(datos)
+        mensaje = {'tipo': 'lote', 't': np.round(t, 3).tolist(),
+                   'datos': np.round(datos, 3).tolist(),
+                   'descartadas': self._descartadas_sin_avisar}
+        self._descartadas_sin_avisar = 0
+        return (json.dumps(mensaje) + '\n').encode('utf-8')
+
+    async def enviar(self, detener):
+        """Envía lotes hasta que el cliente se desconecte o se pida detener."""
+        while not detener.is_set():
+            await self.hay_datos.wait()
+            if self.lote > 0:
+                await asyncio.sleep(self.lote)  # Juntar las muestras del lote
+            self.escritor.write(self._mensaje())
+            # Sólo esta tarea espera a un cliente lento; mientras tanto su cola descarta
+            await self.escritor.drain()
+
+
+class ServidorTelemetria:
+    """
+    Reparte lo que captura `fuente` (LectorSerial o ReproductorGrabacion) a los clientes TCP.
+    """
+
+    def __init__(self, fuente, host, puerto, parametros=None, periodo=PERIODO_PUBLICACION):
+        self.fuente = fuente
+        self.host = host
+        self.puerto = puerto
+        self.parametros = parametros or {}
+        self.periodo = periodo
+        self.suscriptores = set()
+        self.tramas = 0
+        self.ultima = None
+        self._detener = None
+        self._tareas = set()  # Tareas _atender vivas, para cancelarlas al cerrar
+
+    async def _atender(self, lector, escritor):
+        """Lee la suscripción (si la hay), registra al cliente y envía hasta que se vaya."""
+        tarea = asyncio.current_task()
+        self._tareas.add(tarea)
+        try:
+            await self._suscribir(lector, escritor)
+        except asyncio.CancelledError:
+            # La cancela ejecutar() al cerrar; terminar sin error evita que
+            # asyncio registre un traceback por cada cliente
+            escritor.close()
+            if not self._detener.is_set():
+                raise
+        finally:
+            self._tareas.discard(tarea)
+
+    async def _suscribir(self, lector, escritor):
+        hz, lote, formato = HZ_DEFECTO, LOTE_DEFECTO, 'tramas'
+        try:
+            linea = await asyncio.wait_for(lector.readline(), ESPERA_SUSCRIPCION)
+            if not linea:  # Se conectó y se fue
+                escritor.close()
+                return
+            pedido = json.loads(linea) if linea.strip() else {}
+            hz = float(pedido.get('hz', hz))
+            lote = float(pedido.get('lote', lote))
+            if not (math.isfinite(hz) and math.isfinite(lote) and lote >= 0):
+                raise ValueError(f"hz={hz:g}, lote={lote:g} fuera de rango")
+            formato = 'json'
+        except asyncio.TimeoutError:
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"⚠️ Suscripción inválida de {escritor.get_extra_info('peername')}: {e}")
+            escritor.close()
+            return
+        suscriptor = Suscriptor(escritor, hz, lote, formato)
+        if formato == 'json':
+            inicio = {'tipo': 'inicio', 'campos': CAMPOS, 'parametros': self.parametros}
+            escritor.write((json.dumps(inicio) + '\n').encode('utf-8'))
+        self.suscriptores.add(suscriptor)
+        print(f"🔌 Cliente {suscriptor.direccion} ({formato}, "
+              f"{'todas las muestras' if hz <= 0 else f'{hz:g} Hz'}, lote {lote:g} s)")
+        try:
+            await suscriptor.enviar(self._detener)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.suscriptores.discard(suscriptor)
+            escritor.close()
+            aviso = f", {suscriptor.descartadas} descartadas" if suscriptor.descartadas else ""
+            print(f"🔌 Cliente {suscriptor.direccion} desconectado "
+                  f"({suscriptor.enviadas} muestras enviadas{aviso})")
+
+    def publicar(self, t, datos):
+        """Entrega un bloque a todos los suscriptores sin esperar a ninguno."""
+        self.tramas += len(t)
+        self.ultima = datos[-1]
+        for suscriptor in list(self.suscriptores):
+            suscriptor.publicar(t, datos)
+
+    async def ejecutar(self, intervalo_estado=5.0):
+        """Sirve hasta que la fuente termine (o Ctrl+C)."""
+        self._detener = asyncio.Event()
+        servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        print(f"📡 Publicando en {self.host}:{self.puerto}")
+        t_estado = time.monotonic()
+        try:
+            while self.fuente.is_alive() or self.fuente.muestras:
+                await asyncio.sleep(self.periodo)
+                t, datos = self.fuente.extraer()
+                if len(t):
+                    self.publicar(t, datos)
+                if time.monotonic() - t_estado >= intervalo_estado:
+                    t_estado = time.monotonic()
+                    print(self.estado())
+        finally:
+            self._detener.set()
+            servidor.close()
+            # Los clientes pueden estar esperando datos, juntando un lote o en drain():
+            # se cancelan y se esperan para que cada uno cierre su conexión
+            tareas = list(self._tareas)
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+            await servidor.wait_closed()
+
+    def estado(self):
+        linea = f"[{time.strftime('%H:%M:%S')}] {self.tramas} tramas, {len(self.suscriptores)} cliente(s)"
+        if self.ultima is not None:
+            linea += f" | T={self.ultima[0]:.2f}°C SP={self.ultima[1]:.2f}°C"
+        descartadas = sum(s.descartadas for s in self.suscriptores)
+        if descartadas:
+            linea += f" | {descartadas} muestras descartadas a clientes lentos"
+        return linea
+
+
+class ClienteTelemetria(threading.Thread):
+    """
+    Hilo que recibe la telemetría de un ServidorTelemetria.
+
+    Tiene la misma interfaz que LectorSerial (muestras, extraer(), detener(),
+    tramas_leidas, errores_parseo) para usarse como lector en analisis.py.
+    Los tiempos son la hora de llegada al servidor. Si la conexión se pierde
+    se reintenta cada ESPERA_RECONEXION segundos.
+    """
+
+    def __init__(self, host, puerto, hz=HZ_DEFECTO, lote=LOTE_DEFECTO,
+                 max_pendientes=MAX_PENDIENTES, grabador=None):
+        super().__init__(name='ClienteTelemetria', daemon=True)
+        self.host = host
+        self.puerto = puerto
+        self.hz = hz
+        self.lote = lote
+        self.grabador = grabador
+        self.muestras = deque(maxlen=max_pendientes)
+        self.parametros = {}
+        self.tramas_leidas = 0
+        self.errores_parseo = 0
+        self.descartadas = 0  # Muestras que el servidor no nos pudo enviar
+        self._sock = None
+        self._detener = threading.Event()
+
+    def run(self):
+        avisado = False
+        while not self._detener.is_set():
+            try:
+                self._sock = socket.create_connection((self.host, self.puerto), timeout=5.0)
+            except OSError as e:
+                if not avisado:
+                    print(f"⚠️ No se pudo conectar a {self.host}:{self.puerto}: {e}. Reintentando...")
+                    avisado = True
+                self._detener.wait(ESPERA_RECONEXION)
+                continue
+            print(f"✅ Conectado al servidor de telemetría {self.host}:{self.puerto}")
+            avisado = False
+            try:
+                self._sock.settimeout(None)
+                pedido = {'hz': self.hz, 'lote': self.lote}
+                self._sock.sendall((json.dumps(pedido) + '\n').encode('utf-8'))
+                with self._sock.makefile('rb') as archivo:
+                    for linea in archivo:
+                        self._procesar(linea)
+            except OSError:
+                pass
+            finally:
+                self._sock.close()
+            if not self._detener.is_set():
+                print("⚠️ Conexión con el servidor perdida. Reintentando...")
+                self._detener.wait(ESPERA_RECONEXION)
+
+    def _procesar(self, linea):
+        try:
+            mensaje = json.loads(linea)
+        except ValueError:
+            self.errores_parseo += 1
+            return
+        if mensaje.get('tipo') == 'inicio':
+            self.parametros = mensaje.get('parametros', {})
+        elif mensaje.get('tipo') == 'lote':
+            t = np.asarray(mensaje['t'], dtype=np.float64)
+            datos = np.asarray(mensaje['datos'], dtype=np.float64).reshape(len(t), len(CAMPOS))
+            self.descartadas += mensaje.get('descartadas', 0)
+            if len(t) == 0:
+                return
+            self.tramas_leidas += len(t)
+            self.muestras.append((t, datos))
+            if self.grabador is not None:
+                self.grabador.agregar_bloque(t, datos)
+
+    def extraer(self):
+        """Devuelve y elimina las muestras pendientes como (t, datos), en orden de llegada."""
+        return extraer_bloques(self.muestras)
+
+    def detener(self, espera=1.0):
+        self._detener.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.is_alive():
+            self.join(espera)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de telemetría del controlador PID")
+    parser.add_argument('--puerto', default='COM1', help="Puerto serial del controlador")
+    parser.add_argument('--baud', type=int, default=BAUD_RATE)
+    parser.add_argument('--reproducir', metavar='ARCHIVO',
+                        help="Publica una grabación .pidrec en lugar de leer el puerto")
+    parser.add_argument('--velocidad', type=float, default=1.0,
+                        help="Velocidad de reproducción (1 = tiempo real)")
+    parser.add_argument('--grabar', metavar='ARCHIVO', help="Graba además cada trama en un .pidrec")
+    parser.add_argument('--escuchar', default=DIRECCION, metavar='HOST:PUERTO',
+                        help=f"Dirección de escucha (por defecto {DIRECCION})")
+    args = parser.parse_args(argv)
+
+    grabador = None
+    if args.reproducir:
+        fuente = ReproductorGrabacion(args.reproducir, velocidad=args.velocidad)
+        parametros = dict(fuente.grabacion.cabecera)
+    else:
+        parametros = {'puerto': args.puerto, 'baud_rate': args.baud, **parametros_nominales()}
+        if args.grabar:
+            grabador = Grabador(args.grabar, parametros)
+            print(f"   Grabando la sesión en {args.grabar}")
+        # La captura no se rinde: el servidor queda esperando al controlador
+        fuente = LectorSerial(args.puerto, args.baud, max_intentos=float('inf'), grabador=grabador)
+    fuente.start()
+
+    host, puerto = separar_direccion(args.escuchar)
+    servidor = ServidorTelemetria(fuente, host, puerto, parametros)
+    try:
+        asyncio.run(servidor.ejecutar())
+    except KeyboardInterrupt:
+        print("\n⚠️ Interrupción del usuario")
+    finally:
+        fuente.detener()
+        if grabador is not None:
+            grabador.cerrar()
+            print(f"💾 {grabador.registros} tramas grabadas en {grabador.ruta}")
+        print("✅ Servidor finalizado.")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,10 @@ const float KD = 0.31;
 
 const unsigned long PERIODO_MS = 100;
 
+// true: agrega millis() como 9° campo de cada trama para que el análisis
+// use la hora de la medición en lugar de la hora de llegada por el puerto
+const bool ENVIAR_MILLIS = false;
+
 // Variables del PID
 float integral = 0.0;
 float temp_anterior = 0.0;
@@ -129,7 +133,9 @@ void setup() {
     Serial.print(F("Setpoint: "));
     Serial.print(SETPOINT);
     Serial.println(F("°C"));
-    Serial.println(F("Formato: >> temperatura,setpoint,error,out_p,out_i,out_d,out_total,salida"));
+    Serial.print(F("Formato: >> temperatura,setpoint,error,out_p,out_i,out_d,out_total,salida"));
+    if (ENVIAR_MILLIS) Serial.print(F(",millis"));
+    Serial.println();
     Serial.println();
     
     delay(1000);
@@ -161,6 +167,12 @@ void loop() {
         Serial.print(F(","));
         Serial.print(pid_total, 2);
         Serial.print(F(","));
-        Serial.println(salida, 2);
+        if (ENVIAR_MILLIS) {
+            Serial.print(salida, 2);
+            Serial.print(F(","));
+            Serial.println(ahora);
+        } else {
+            Serial.println(salida, 2);
+        }
     }
 }